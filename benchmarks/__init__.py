@@ -0,0 +1,92 @@
+"""
+Benchmarks for the VPR Alexa Skill.
+
+These aren't part of the test suite. Run one directly as a module, e.g.
+
+    python -m benchmarks.bench_rss
+
+Shared helpers for building synthetic podcast feeds and timing calls live here.
+"""
+from __future__ import print_function
+import logging
+import timeit
+
+RSS_HEADER = u"""<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0" xmlns:itunes="http://www.itunes.com/dtds/podcast-1.0.dtd">
+<channel>
+<title>{title}</title>
+<link>https://www.vpr.net/</link>
+<description>A synthetic VPR podcast feed for benchmarking.</description>
+<itunes:image href="https://static.feedpress.it/logo/vpr-synthetic.jpg"/>
+<image>
+<url>https://static.feedpress.it/logo/vpr-synthetic.jpg</url>
+<title>{title}</title>
+</image>
+"""
+
+RSS_ITEM = u"""<item>
+<title>Episode {n}: talking maple syrup, town meeting and the weather</title>
+<link>https://www.vpr.net/episodes/{n}</link>
+<guid>https://www.vpr.net/episodes/{n}</guid>
+<pubDate>{date}</pubDate>
+<description>Episode {n} of a synthetic show. {filler}</description>
+<itunes:duration>00:{minutes:02d}:00</itunes:duration>
+<enclosure url="https://cpa.ds.npr.org/vpr/audio/synthetic/{n}.mp3" length="{length}" type="audio/mpeg"/>
+{extra_links}</item>
+"""
+
+RSS_FOOTER = u"""</channel>
+</rss>
+"""
+
+FILLER = u'Vermont Edition covers news, culture and conversation. ' * 8
+
+DAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+          'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+def synthetic_feed(items, title=u'Synthetic Edition', extra_links=0):
+    """
+    Build an RSS document shaped like VPR's podcast feeds.
+    :param items: number of <item> elements
+    :param title: channel title
+    :param extra_links: number of additional non-audio enclosures per item
+    :return: bytes of RSS XML, newest item first
+    """
+    parts = [RSS_HEADER.format(title=title)]
+    for n in range(items, 0, -1):
+        extras = u''.join(
+            u'<enclosure url="https://www.vpr.net/{0}/{1}.jpg" type="image/jpeg"/>\n'
+            .format(n, i) for i in range(extra_links))
+        date = u'{day}, {dom:02d} {month} {year} 12:00:00 -0400'.format(
+            day=DAYS[n % 7], dom=n % 28 + 1, month=MONTHS[n % 12],
+            year=2000 + n % 20)
+        parts.append(RSS_ITEM.format(n=n, date=date, filler=FILLER,
+                                     minutes=n % 60, length=n * 1000,
+                                     extra_links=extras))
+    parts.append(RSS_FOOTER)
+    return u''.join(parts).encode('utf-8')
+
+
+def best_of(func, repeat=5, number=1):
+    """
+    :return: best seconds per call over `repeat` runs of `number` calls
+    """
+    return min(timeit.repeat(func, repeat=repeat, number=number)) / number
+
+
+def report(rows, headers):
+    """ Print rows as a simple aligned table. """
+    widths = [max(len(str(v)) for v in column)
+              for column in zip(headers, *rows)]
+    for row in [headers] + list(rows):
+        print('  '.join(str(v).ljust(w) for v, w in zip(row, widths)))
+
+
+def quiet(level=logging.WARNING):
+    """
+    Silence the skill's per-request info logging while benchmarking.
+    :param level: lowest level still logged
+    """
+    logging.getLogger('vpr_alexa').setLevel(level)
@@ -0,0 +1,63 @@
+"""
+Compare AudioPlayer event throughput through the fast path against flask-ask's
+full dispatch.
+
+    python -m benchmarks.bench_playback [--requests 2000]
+"""
+from __future__ import print_function
+import argparse
+import logging
+import os
+import time
+
+from mock import patch
+
+from benchmarks import report, quiet
+import tests.requests as requests
+
+EVENTS = ('PlaybackStarted', 'PlaybackStopped', 'PlaybackNearlyFinished',
+          'PlaybackFinished', 'PlaybackFailed')
+
+
+def throughput(client, bodies, count):
+    """
+    :return: requests per second posting `count` bodies in turn
+    """
+    start = time.time()
+    for n in range(count):
+        client.post('/ask', data=bodies[n % len(bodies)])
+    return count / (time.time() - start)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('FLASK_SECRET_KEY', 'benchmark')
+    os.environ['DISABLE_ASK_VERIFY_REQUESTS'] = 'true'
+    # Every PlaybackFailed event posted is logged as an error.
+    quiet(logging.CRITICAL)
+    from vpr_alexa import webapp
+    app = webapp.create_app()
+    # The same bodies are posted over and over, not as retries.
+    webapp.response_cache.ttl = 0
+    client = app.test_client()
+
+    bodies = [requests.audio_player_event(event, offset=1000).read()
+              .encode('utf-8') for event in EVENTS]
+    throughput(client, bodies, 100)
+
+    fast = throughput(client, bodies, args.requests)
+    with patch.object(webapp.playback_events, 'dispatch', return_value=None):
+        full = throughput(client, bodies, args.requests)
+
+    report([('flask-ask dispatch', '%.0f/s' % full,
+             '%.0f us' % (1e6 / full)),
+            ('fast path', '%.0f/s' % fast, '%.0f us' % (1e6 / fast))],
+           ('path', 'throughput', 'per request'))
+    print('%.1fx faster' % (fast / full))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+"""
+Time and measure the peak memory of the functions in vpr_alexa.programs one
+at a time, on synthetic feeds read from local files.
+
+    python -m benchmarks.bench_programs [--items 10 100 1000 10000] \\
+        [--output programs.json] [--baseline programs.json --threshold 0.25]
+
+Cases:
+
+* get_program: every program name in the LIST_OF_PROGRAMS slot values and the
+  utterance corpus, with podcast feeds already cached.
+* _filter_links: entries with 10 to 1,000 enclosure links.
+* latest_podcast_episode: feeds of 10 to 10,000 items, `cold` fetching and
+  parsing the file each call and `warm` answered from the feed cache. The feed
+  cache stops parsing after `programs.INDEX_LIMIT` (500) items, so each case
+  is labelled with how many items were actually parsed.
+
+With --baseline the run fails (exit status 1) when any case is slower than the
+baseline by more than --threshold, or uses more than --threshold extra memory.
+"""
+from __future__ import print_function
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+from six.moves.urllib.request import pathname2url
+
+from benchmarks import synthetic_feed, best_of, report, quiet
+import tests.requests as requests
+from vpr_alexa import programs
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+
+def peak_memory(func):
+    """
+    :return: peak bytes allocated during one call, None without tracemalloc
+    """
+    if tracemalloc is None:
+        return None
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure(func, repeat, number=1):
+    """
+    :return: dict of best seconds per call and peak bytes of one call
+    """
+    func()  # warm up lazy imports and caches outside the measurement
+    return {'seconds': best_of(func, repeat=repeat, number=number),
+            'peak_bytes': peak_memory(func)}
+
+
+def program_names():
+    """
+    :return: list of every program name we know users say
+    """
+    names = [utterance for utterance, _ in requests.program_utterances()]
+    with open(programs.SLOT_VALUES_PATH, 'r') as f:
+        names.extend(line.strip() for line in f if line.strip())
+    return names
+
+
+def bench_get_program(repeat):
+    names = program_names()
+
+    def run():
+        for name in names:
+            programs.get_program(name)
+
+    result = measure(run, repeat)
+    result['seconds'] /= len(names)
+    return {'get_program': result}
+
+
+def bench_filter_links(repeat, counts=(10, 100, 1000)):
+    results = {}
+    for count in counts:
+        links = [{'href': 'https://www.vpr.net/%d.jpg' % i, 'type': 'image/jpeg'}
+                 for i in range(count - 1)]
+        links.append({'href': 'https://www.vpr.net/episode.mp3',
+                      'type': 'audio/mpeg'})
+        links.insert(count // 2, {'href': 'https://www.vpr.net/', 'rel': 'alternate'})
+        results['_filter_links[%d links]' % count] = measure(
+            lambda: list(programs._filter_links(links, 'audio/mpeg')),
+            repeat, number=10)
+    return results
+
+
+def bench_latest_episode(directory, items, repeat):
+    results = {}
+    for count in items:
+        name = 'synthetic-%d' % count
+        with open(os.path.join(directory, name), 'wb') as f:
+            f.write(synthetic_feed(count))
+        programs.podcasts.add(name)
+        programs.fallback_counts[name] = 0
+
+        def cold():
+            programs.feed_cache.invalidate()
+            programs.latest_podcast_episode(name)
+
+        label = '%d items' % count
+        if programs.feed_cache.max_items is not None and \
+                count > programs.feed_cache.max_items:
+            label += ', %d parsed' % programs.feed_cache.max_items
+        results['latest_podcast_episode[%s, cold]' % label] = \
+            measure(cold, repeat)
+        results['latest_podcast_episode[%s, warm]' % label] = \
+            measure(lambda: programs.latest_podcast_episode(name), repeat,
+                    number=100)
+    return results
+
+
+def regressions(results, baseline, threshold):
+    """
+    :return: list of (case, metric, before, after) worse than the threshold
+    """
+    found = []
+    for case, after in sorted(results.items()):
+        before = baseline.get(case)
+        if before is None:
+            continue
+        for metric in ('seconds', 'peak_bytes'):
+            if before.get(metric) and after.get(metric) is not None \
+                    and after[metric] > before[metric] * (1 + threshold):
+                found.append((case, metric, before[metric], after[metric]))
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--items', type=int, nargs='+',
+                        default=[10, 100, 1000, 10000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='save results to this JSON file')
+    parser.add_argument('--baseline', help='JSON results of an earlier run')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='allowed slowdown or memory growth, 0.25 is 25%%')
+    args = parser.parse_args(argv)
+
+    quiet()
+    directory = tempfile.mkdtemp(prefix='vpr-alexa-bench-')
+    saved_url = programs.PODCAST_URL
+    programs.PODCAST_URL = 'file:' + pathname2url(directory) + '/'
+    programs.latest_episodes.clear()
+    try:
+        results = bench_latest_episode(directory, args.items, args.repeat)
+        for name in ('vermont-edition', 'eye-on-the-sky', 'vpr-news',
+                     'brave-little-state'):
+            with open(os.path.join(directory, name), 'wb') as f:
+                f.write(synthetic_feed(10, title=name))
+        results.update(bench_get_program(args.repeat))
+        results.update(bench_filter_links(args.repeat))
+    finally:
+        programs.PODCAST_URL = saved_url
+        for count in args.items:
+            programs.podcasts.discard('synthetic-%d' % count)
+        shutil.rmtree(directory)
+
+    rows = [(case, '%.2f us' % (result['seconds'] * 1e6),
+             '-' if result['peak_bytes'] is None
+             else '%.1f KB' % (result['peak_bytes'] / 1024.0))
+            for case, result in sorted(results.items())]
+    report(rows, ('case', 'time per call', 'peak memory'))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f), args.threshold)
+        for case, metric, before, after in found:
+            print('REGRESSION %s %s: %s -> %s' % (case, metric, before, after))
+        if found:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Compare the indexed program name resolver against the substring chain
+`get_program` used before it, over the utterance regression corpus.
+
+    python -m benchmarks.bench_resolver [--programs 8 50 200]
+
+`--programs` pads both with made up programs to show how each scales as the
+catalogue grows.
+
+The resolver is slower than the chain: a few microseconds per utterance
+against well under one for today's 8 programs, and still ahead at 200. It's
+used for its fuzzy matching and confidence scores, not for speed, and either
+cost is negligible next to a request.
+"""
+from __future__ import print_function
+import argparse
+
+from benchmarks import best_of, report
+from vpr_alexa import programs
+from vpr_alexa.resolver import ProgramResolver
+import tests.requests as requests
+
+
+def legacy_chain(extra):
+    """
+    The old if/elif substring chain, with `extra` made up programs checked
+    before falling through to the live stream.
+    """
+    def resolve(program_name):
+        program_name = program_name.lower() if program_name else ''
+        if 'edition' in program_name or 'addition' in program_name:
+            return 'vermont-edition'
+        elif 'brave' in program_name:
+            return 'brave-little-state'
+        elif 'sky' in program_name or 'weather' in program_name:
+            return 'eye-on-the-sky'
+        elif 'jazz' in program_name:
+            return 'jazz'
+        elif 'classical' in program_name:
+            return 'classical'
+        elif 'replay' in program_name:
+            return 'replay'
+        elif 'news' in program_name:
+            return 'vpr-news'
+        for word in extra:
+            if word in program_name:
+                return word
+        return 'radio'
+    return resolve
+
+
+def indexed(extra):
+    keywords = dict(programs.program_keywords)
+    keywords.update((word, [word]) for word in extra)
+    resolver = ProgramResolver(keywords, programs.program_priority + extra,
+                               default='radio')
+    return lambda program_name: resolver.resolve(program_name).key
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--programs', type=int, nargs='+', default=[8, 50, 200])
+    parser.add_argument('--number', type=int, default=200)
+    args = parser.parse_args(argv)
+
+    utterances = [u for u, _ in requests.program_utterances()]
+    rows = []
+    for count in args.programs:
+        extra = ['program%d' % n for n in range(max(0, count - 8))]
+        for name, build in (('substring chain', legacy_chain),
+                            ('indexed', indexed)):
+            resolve = build(extra)
+
+            def run():
+                for utterance in utterances:
+                    resolve(utterance)
+            per_call = best_of(run, number=args.number) / len(utterances)
+            rows.append((count, name, '%.2f us' % (per_call * 1e6)))
+
+    report(rows, ('programs', 'resolver', 'per utterance'))
+
+
+if __name__ == '__main__':
+    main()
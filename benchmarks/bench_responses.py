@@ -0,0 +1,102 @@
+"""
+Measure the latency saved by pre-serialized responses, both for building the
+response alone and for whole requests posted through the Flask test client.
+
+    python -m benchmarks.bench_responses [--number 500] [--repeat 7]
+
+Building one of these responses through flask-ask takes around 100us, and
+preparing it brings that down to 10-50us. A whole request takes
+around a millisecond, though, and its run-to-run noise is about as big as the
+saving. The `full request` columns show the best of `--repeat` runs with and
+without prepared responses, alternating between the two. Treat differences
+there as noise unless they hold up across several runs.
+"""
+from __future__ import print_function
+import argparse
+import json
+import os
+
+from flask_ask import models
+
+from benchmarks import best_of, report, quiet
+import tests.requests as requests
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--number', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=7)
+    args = parser.parse_args(argv)
+
+    quiet()
+    os.environ.setdefault('FLASK_SECRET_KEY', 'benchmark')
+    from vpr_alexa import programs, webapp
+    app = webapp.create_app()
+    app.config['ASK_VERIFY_REQUESTS'] = False
+    # Bodies are posted repeatedly, which would otherwise be answered as
+    # retries from the response cache.
+    webapp.response_cache.ttl = 0
+    client = app.test_client()
+    prepared = dict(webapp.prepared_responses)
+
+    def play_jazz():
+        return webapp._play(programs.jazz, webapp.templates.render(
+            'play_livestream', name=programs.jazz.name)).render_response()
+
+    def fresh_cache(func):
+        # Every play pushes onto the listener's stream list in the cache,
+        # which would otherwise grow and slow down whichever runs last.
+        def run():
+            webapp.cache.clear()
+            return func()
+        return run
+
+    cases = (('LaunchRequest', requests.launch,
+              lambda: webapp.welcome_response().render_response(),
+              lambda: webapp._prepared('welcome')),
+             ('ListPrograms', requests.list_programs,
+              lambda: webapp.list_programs_response().render_response(),
+              lambda: webapp._prepared('list_programs')),
+             ('AMAZON.HelpIntent', requests.help,
+              lambda: webapp.help_response().render_response(),
+              lambda: webapp._prepared('help')),
+             ('PlayProgram (jazz)', lambda: requests.play_program('jazz'),
+              play_jazz,
+              lambda: webapp._play_prepared(programs.jazz)))
+
+    rows = []
+    for name, request, build, render in cases:
+        body = request().read()
+        alexa = json.loads(body)
+        with app.app_context():
+            webapp.ask.session = models._Field(alexa['session'])
+            webapp.ask.context = models._Field(alexa['context'])
+            built = best_of(fresh_cache(build), repeat=args.repeat,
+                            number=args.number)
+            cached = best_of(fresh_cache(render), repeat=args.repeat,
+                             number=args.number)
+
+        bodies = [body] * args.number
+
+        def run():
+            webapp.cache.clear()
+            for body in bodies:
+                client.post('/ask', data=body)
+
+        full_built, full_cached = [], []
+        for _ in range(args.repeat):
+            webapp.prepared_responses.clear()
+            full_built.append(best_of(run, repeat=1) / args.number)
+            webapp.prepared_responses.update(prepared)
+            full_cached.append(best_of(run, repeat=1) / args.number)
+
+        rows.append((name, '%.1f us' % (built * 1e6), '%.1f us' % (cached * 1e6),
+                     '%.0f us' % (min(full_built) * 1e6),
+                     '%.0f us' % (min(full_cached) * 1e6)))
+
+    report(rows, ('request', 'build', 'prepared', 'full request',
+                  'full request, prepared'))
+
+
+if __name__ == '__main__':
+    main()
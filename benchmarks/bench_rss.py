@@ -0,0 +1,44 @@
+"""
+Compare Feedparser's full parse against the early-exit streaming parser used by
+`latest_podcast_episode` on large synthetic feeds.
+
+    python -m benchmarks.bench_rss [--items 10 100 1000 5000]
+
+The streaming parser is timed reading only the newest item, and reading up to
+`programs.INDEX_LIMIT` items like the podcast feed cache does to build each
+podcast's episode index.
+"""
+from __future__ import print_function
+import argparse
+
+import feedparser
+
+from benchmarks import synthetic_feed, best_of, report
+from vpr_alexa import programs, rss
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--items', type=int, nargs='+',
+                        default=[10, 100, 1000, 5000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    rows = []
+    for items in args.items:
+        doc = synthetic_feed(items)
+        full = best_of(lambda: dict(feedparser.parse(doc)), repeat=args.repeat)
+        streaming = best_of(lambda: rss.parse(doc), repeat=args.repeat)
+        indexed = best_of(lambda: rss.parse(doc, max_items=programs.INDEX_LIMIT),
+                          repeat=args.repeat)
+        rows.append((items, '%.1f KB' % (len(doc) / 1024.0),
+                     '%.2f ms' % (full * 1000), '%.3f ms' % (streaming * 1000),
+                     '%.0fx' % (full / streaming), '%.2f ms' % (indexed * 1000),
+                     '%.0fx' % (full / indexed)))
+
+    report(rows, ('items', 'size', 'feedparser', 'streaming', 'speedup',
+                  'streaming %d' % programs.INDEX_LIMIT, 'speedup'))
+
+
+if __name__ == '__main__':
+    main()
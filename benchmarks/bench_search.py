@@ -0,0 +1,118 @@
+"""
+Time episode search over thousands of synthetic episodes: adding a refreshed
+feed to the inverted index, and ranked lookups against a linear scan of every
+title and summary.
+
+    python -m benchmarks.bench_search [--episodes 1000 5000 20000]
+"""
+from __future__ import print_function
+import argparse
+import random
+import time
+
+from benchmarks import best_of, report
+from vpr_alexa.search import EpisodeSearch, terms
+
+PODCASTS = ('vermont-edition', 'eye-on-the-sky', 'vpr-news',
+            'brave-little-state')
+
+WORDS = ('maple', 'syrup', 'town', 'meeting', 'lake', 'champlain', 'snow',
+         'mud', 'season', 'legislature', 'school', 'budget', 'farm', 'dairy',
+         'forecast', 'storm', 'ski', 'trail', 'election', 'housing', 'bridge',
+         'river', 'flood', 'library', 'music', 'festival', 'hunting', 'moose',
+         'broadband', 'opioid', 'hospital', 'climate', 'solar', 'wind')
+
+QUERIES = ('maple syrup', 'town meeting budget', 'lake champlain flood',
+           'moose hunting season', 'the weather', 'broadband in rural towns',
+           'curling')
+
+
+def entry(rng, podcast, n):
+    title = ' '.join(rng.choice(WORDS) for _ in range(4))
+    summary = ' '.join(rng.choice(WORDS) for _ in range(40))
+    return {'title': title.title(), 'summary': summary,
+            'published': 'Tue, 14 Mar 2017 12:00:00 -0400',
+            'links': [{'type': 'audio/mpeg', 'href':
+                       'https://cpa.ds.npr.org/vpr/audio/%s/%d.mp3'
+                       % (podcast, n)}]}
+
+
+def synthetic_feeds(episodes, seed=0):
+    """
+    :return: dict of podcast -> feed with episodes spread evenly over them,
+    newest entries first
+    """
+    rng = random.Random(seed)
+    per_podcast = episodes // len(PODCASTS)
+    return dict((podcast, {
+        'feed': {'title': podcast.replace('-', ' ').title(),
+                 'image': {'href': 'https://static.feedpress.it/logo.jpg'}},
+        'entries': [entry(rng, podcast, n)
+                    for n in range(per_podcast, 0, -1)]})
+        for podcast in PODCASTS)
+
+
+def linear_scan(feeds, query, limit=3):
+    """ Search the way we'd have to without an index. """
+    wanted = set(terms(query))
+    scored = []
+    for feed in feeds.values():
+        for entry in feed['entries']:
+            found = terms(entry['title']) + terms(entry['summary'])
+            score = sum(1 for word in found if word in wanted)
+            if score:
+                scored.append((score, entry['title']))
+    return sorted(scored, reverse=True)[:limit]
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--episodes', type=int, nargs='+',
+                        default=[1000, 5000, 20000])
+    parser.add_argument('--lookups', type=int, default=200)
+    args = parser.parse_args(argv)
+
+    rows = []
+    for count in args.episodes:
+        feeds = synthetic_feeds(count)
+        index = EpisodeSearch(max_documents=count)
+
+        start = time.time()
+        for podcast, feed in feeds.items():
+            index.add(podcast, feed)
+        build = time.time() - start
+
+        # A refresh bringing one new episode to one podcast.
+        podcast = PODCASTS[0]
+        refreshed = dict(feeds[podcast], entries=[
+            entry(random.Random(1), podcast, count + 1)] +
+            feeds[podcast]['entries'])
+        start = time.time()
+        index.add(podcast, refreshed)
+        refresh = time.time() - start
+
+        samples = []
+        for n in range(args.lookups):
+            query = QUERIES[n % len(QUERIES)]
+            start = time.time()
+            index.search(query)
+            samples.append(time.time() - start)
+        scan = best_of(lambda: linear_scan(feeds, QUERIES[0]), repeat=3)
+
+        rows.append((count, '%.0f ms' % (build * 1e3),
+                     '%.2f ms' % (refresh * 1e3),
+                     '%.3f ms' % (percentile(samples, 0.5) * 1e3),
+                     '%.3f ms' % (percentile(samples, 0.99) * 1e3),
+                     '%.1f ms' % (scan * 1e3)))
+
+    report(rows, ('episodes', 'initial add', 'refresh add', 'search p50',
+                  'search p99', 'linear scan'))
+
+
+if __name__ == '__main__':
+    main()
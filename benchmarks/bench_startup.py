@@ -0,0 +1,80 @@
+"""
+Time a fresh worker from importing vpr_alexa.wsgi to answering its first
+requests, with and without warm-up, against a local stub of podcasts.vpr.net.
+
+    python -m benchmarks.bench_startup [--feed-latency 0.3] [--runs 3]
+
+Each run imports the app in a new process, like a gunicorn worker coming up,
+then sends a LaunchRequest and a PlayProgram for a podcast.
+"""
+from __future__ import print_function
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from benchmarks import report, quiet
+from benchmarks.stub_podcasts import StubPodcasts
+
+WORKER = """
+import json, sys, time
+from benchmarks import quiet
+quiet()
+from vpr_alexa import programs
+programs.PODCAST_URL = sys.argv[1]
+from vpr_alexa.wsgi import application
+from vpr_alexa import startup
+import tests.requests as requests
+client = application.test_client()
+latencies = {}
+for name, body in (('launch', requests.launch()),
+                   ('play_podcast', requests.play_program('vermont edition'))):
+    start = time.time()
+    client.post('/ask', data=body.read())
+    latencies[name] = time.time() - start
+print(json.dumps({'events': startup.times.describe(), 'latencies': latencies}))
+"""
+
+
+def run_worker(stub, warm_up):
+    env = dict(os.environ, FLASK_SECRET_KEY='bench', FEED_REFRESH_INTERVAL='0',
+               DISABLE_ASK_VERIFY_REQUESTS='true',
+               WARM_UP_BUDGET='10' if warm_up else '0')
+    output = subprocess.check_output([sys.executable, '-c', WORKER, stub.url],
+                                     env=env)
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--feed-latency', type=float, default=0.3)
+    parser.add_argument('--feed-items', type=int, default=500)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    quiet()
+    stub = StubPodcasts(latency=args.feed_latency,
+                        items=args.feed_items).start()
+    rows = []
+    try:
+        for warm_up in (False, True):
+            for run in range(args.runs):
+                result = run_worker(stub, warm_up)
+                events, latencies = result['events'], result['latencies']
+                rows.append(('on' if warm_up else 'off', run + 1,
+                             '%.2f s' % events['app_created'],
+                             '%.2f s' % (events['worker_started'] -
+                                         events['app_created']),
+                             '%.0f ms' % (latencies['launch'] * 1000),
+                             '%.0f ms' % (latencies['play_podcast'] * 1000),
+                             '%.2f s' % events['first_request']))
+    finally:
+        stub.stop()
+
+    report(rows, ('warm-up', 'run', 'import', 'warm-up time', 'first launch',
+                  'first podcast', 'import to first request'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+Cold-start budget: how long importing the WSGI entry point takes, module by
+module, checked against a budget.
+
+    python -m benchmarks.import_budget [--budget 1.0] [--top 15] \\
+        [--forbid feedparser redis] [--output imports.json]
+
+Imports vpr_alexa.wsgi in fresh processes with `python -X importtime` (Python
+3.7+), keeping the fastest of --repeat runs for each module. Warm-up and the
+feed refresher are turned off so only imports and create_app() are timed.
+Exits non-zero when the total goes over --budget seconds, or when any module
+named by --forbid is imported at all. Those are the dependencies a first
+LaunchRequest doesn't need, which are loaded lazily.
+"""
+from __future__ import print_function
+import argparse
+from collections import OrderedDict
+import json
+import os
+import subprocess
+import sys
+
+from benchmarks import report
+
+DEFAULT_BUDGET = 1.0
+DEFAULT_FORBIDDEN = ['feedparser', 'redis']
+
+
+def import_times(module):
+    """
+    Import a module in a new process.
+    :return: OrderedDict of module name -> (self seconds, cumulative seconds),
+    in import order
+    """
+    env = dict(os.environ, WARM_UP_BUDGET='0', FEED_REFRESH_INTERVAL='0')
+    env.setdefault('FLASK_SECRET_KEY', 'import-budget')
+    process = subprocess.Popen(
+        [sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+        env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    _, stderr = process.communicate()
+    if process.returncode:
+        raise RuntimeError('Importing %s failed:\n%s'
+                           % (module, stderr.decode('utf-8', 'replace')))
+    return parse_importtime(stderr.decode('utf-8', 'replace'))
+
+
+def parse_importtime(output):
+    """
+    :param output: stderr of `python -X importtime`
+    :return: OrderedDict of module name -> (self seconds, cumulative seconds)
+    """
+    times = OrderedDict()
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # the header
+        times[fields[2].strip()] = (int(fields[0]) / 1e6, int(fields[1]) / 1e6)
+    return times
+
+
+def fastest(runs):
+    """
+    :param runs: list of import_times() results
+    :return: OrderedDict of module -> fastest (self, cumulative) of any run
+    """
+    best = OrderedDict()
+    for times in runs:
+        for module, (own, cumulative) in times.items():
+            if module in best:
+                own = min(own, best[module][0])
+                cumulative = min(cumulative, best[module][1])
+            best[module] = (own, cumulative)
+    return best
+
+
+def by_package(times):
+    """
+    :return: dict of top-level package -> seconds spent in its own modules
+    """
+    packages = {}
+    for module, (own, _) in times.items():
+        package = module.split('.', 1)[0]
+        packages[package] = packages.get(package, 0) + own
+    return packages
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--module', default='vpr_alexa.wsgi')
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET,
+                        help='most seconds the import may take')
+    parser.add_argument('--forbid', nargs='*', default=DEFAULT_FORBIDDEN,
+                        help='modules that must not be imported at startup')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--output', help='save every module time as JSON')
+    args = parser.parse_args(argv)
+
+    if sys.version_info < (3, 7):
+        parser.error('-X importtime needs Python 3.7+')
+
+    times = fastest([import_times(args.module) for _ in range(args.repeat)])
+    total = times[args.module][1]
+
+    print('Slowest modules:')
+    slowest = sorted(times.items(), key=lambda item: -item[1][0])[:args.top]
+    report([(module, '%.1f ms' % (own * 1000), '%.1f ms' % (cumulative * 1000))
+            for module, (own, cumulative) in slowest],
+           ('module', 'self', 'cumulative'))
+    print()
+    print('Slowest packages:')
+    packages = sorted(by_package(times).items(), key=lambda item: -item[1])
+    report([(package, '%.1f ms' % (own * 1000))
+            for package, own in packages[:args.top]], ('package', 'self'))
+    print()
+
+    failures = []
+    if total > args.budget:
+        failures.append('import took %.3fs, over the %.3fs budget'
+                        % (total, args.budget))
+    for module in args.forbid or ():
+        if module in times:
+            failures.append('%s was imported at startup' % module)
+    print('%s: %.3fs importing %s (%d modules), budget %.3fs'
+          % ('FAIL' if failures else 'OK', total, args.module, len(times),
+             args.budget))
+    for failure in failures:
+        print('  ' + failure)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'module': args.module, 'total': total,
+                       'budget': args.budget,
+                       'modules': OrderedDict((module, {'self': own,
+                                                        'cumulative': cumulative})
+                                              for module, (own, cumulative)
+                                              in times.items())},
+                      f, indent=2)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
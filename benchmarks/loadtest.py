@@ -0,0 +1,295 @@
+"""
+Load test the `application` from vpr_alexa.wsgi or vpr_alexa.asgi with a mix of
+the Alexa request fixtures in tests/fixtures, against a local stub of
+podcasts.vpr.net.
+
+    python -m benchmarks.loadtest --concurrency 1 8 32 --requests 2000 \\
+        --mix launch=1 help=1 list_programs=1 "play:vermont edition=4" play:jazz=2 \\
+        --feed-latency 0.2 --feed-items 1000 \\
+        --output before.json [--compare baseline.json]
+
+Reports throughput and p50/p95/p99 latency per request type at each
+concurrency level. --output saves the results as JSON, tagged with the current
+git commit, and --compare prints the p95 change against an earlier run.
+
+--entry-point asgi sends every request as a task on one event loop instead of
+a thread each. --workers caps the WSGI requests handled at once, like a fixed
+pool of sync workers, so the two can be compared at high concurrency:
+
+    python -m benchmarks.loadtest --entry-point wsgi --workers 8 \\
+        --concurrency 256 --feed-latency 0.5 --feed-ttl 1
+    python -m benchmarks.loadtest --entry-point asgi \\
+        --concurrency 256 --feed-latency 0.5 --feed-ttl 1
+"""
+from __future__ import print_function
+import argparse
+import bisect
+from collections import defaultdict
+import json
+import math
+import os
+import random
+import subprocess
+import threading
+import time
+
+from benchmarks import report, quiet
+from benchmarks.stub_podcasts import StubPodcasts
+import tests.requests as requests
+
+FIXTURES = {'launch': requests.launch,
+            'list_programs': requests.list_programs,
+            'help': requests.help,
+            'cancel': requests.cancel,
+            'say_nothing': requests.say_nothing}
+
+DEFAULT_MIX = ['launch=1', 'list_programs=1', 'help=1',
+               'play:vermont edition=3', 'play:eye on the sky=2',
+               'play:jazz=2', 'play:news=1']
+
+
+def parse_mix(mix):
+    """
+    :param mix: list of "name=weight", name is a fixture or "play:<program>"
+    :return: list of (name, request body str, weight)
+    """
+    parsed = []
+    for item in mix:
+        name, _, weight = item.rpartition('=')
+        if name.startswith('play:'):
+            body = requests.play_program(name[len('play:'):]).read()
+        else:
+            body = FIXTURES[name]().read()
+        parsed.append((name, body, float(weight)))
+    return parsed
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    rank = int(math.ceil(fraction * len(ordered))) - 1
+    return ordered[min(len(ordered) - 1, max(0, rank))]
+
+
+def load_application(stub, feed_ttl, entry_point='wsgi'):
+    """
+    Import vpr_alexa.wsgi or vpr_alexa.asgi the way gunicorn or uvicorn would,
+    pointed at the stub server.
+    """
+    os.environ.setdefault('FLASK_SECRET_KEY', 'loadtest')
+    os.environ['DISABLE_ASK_VERIFY_REQUESTS'] = 'true'
+    os.environ.setdefault('FEED_REFRESH_INTERVAL', '0')
+
+    from vpr_alexa import programs
+    programs.PODCAST_URL = stub.url
+    if feed_ttl is not None:
+        programs.feed_cache.default_ttl = feed_ttl
+        programs.feed_cache.stale_ttl = 0
+        programs.feed_cache.ttls.clear()
+
+    if entry_point == 'asgi':
+        from vpr_alexa.asgi import application
+    else:
+        from vpr_alexa.wsgi import application
+    return application
+
+
+def make_plan(mix, total, seed):
+    """
+    :return: list of `total` request names drawn from the mix
+    """
+    rng = random.Random(seed)
+    names = [name for name, _, _ in mix]
+    bounds = []
+    for _, _, weight in mix:
+        bounds.append((bounds[-1] if bounds else 0) + weight)
+    return [names[bisect.bisect(bounds, rng.random() * bounds[-1])]
+            for _ in range(total)]
+
+
+def run_level(application, mix, concurrency, total, seed, workers=None):
+    """
+    Send `total` requests drawn from the mix using `concurrency` threads.
+    :param workers: most requests the application handles at once, None for
+    as many as there are threads
+    :return: (wall seconds, dict of name -> list of latencies, dict of errors)
+    """
+    plan = make_plan(mix, total, seed)
+    bodies = dict((name, body) for name, body, _ in mix)
+
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    position = [0]
+    pool = threading.BoundedSemaphore(workers or concurrency)
+
+    def worker():
+        client = application.test_client()
+        while True:
+            with lock:
+                if position[0] >= len(plan):
+                    return
+                name = plan[position[0]]
+                position[0] += 1
+            # A fresh requestId, or the response cache answers every repeat.
+            body = requests.with_request_id(bodies[name]).encode('utf-8')
+            start = time.time()
+            with pool:
+                response = client.post('/ask', data=body)
+            elapsed = time.time() - start
+            with lock:
+                latencies[name].append(elapsed)
+                if response.status_code != 200:
+                    errors[name] += 1
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.time() - start, latencies, errors
+
+
+def run_level_asgi(application, mix, concurrency, total, seed):
+    """
+    Send `total` requests drawn from the mix as `concurrency` tasks on one
+    event loop.
+    :return: (wall seconds, dict of name -> list of latencies, dict of errors)
+    """
+    import asyncio
+    from tests.asgi_client import call
+
+    plan = make_plan(mix, total, seed)
+    bodies = dict((name, body) for name, body, _ in mix)
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    remaining = iter(plan)
+
+    async def worker():
+        for name in remaining:
+            body = requests.with_request_id(bodies[name]).encode('utf-8')
+            start = time.time()
+            status, _, _ = await call(application, 'POST', '/ask', body)
+            latencies[name].append(time.time() - start)
+            if status != 200:
+                errors[name] += 1
+
+    async def level():
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+
+    loop = asyncio.new_event_loop()
+    start = time.time()
+    try:
+        loop.run_until_complete(level())
+    finally:
+        loop.close()
+    return time.time() - start, latencies, errors
+
+
+def summarize(wall, latencies, errors):
+    results = {}
+    everything = []
+    for name, values in latencies.items():
+        everything.extend(values)
+        results[name] = _stats(values, wall, errors.get(name, 0))
+    results['all'] = _stats(everything, wall, sum(errors.values()))
+    return results
+
+
+def _stats(values, wall, errors):
+    ordered = sorted(values)
+    return {'requests': len(ordered),
+            'errors': errors,
+            'throughput': len(ordered) / wall if wall else 0.0,
+            'p50_ms': percentile(ordered, 0.50) * 1000,
+            'p95_ms': percentile(ordered, 0.95) * 1000,
+            'p99_ms': percentile(ordered, 0.99) * 1000}
+
+
+def current_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.STDOUT).decode().strip()
+    except Exception:
+        return None
+
+
+def print_results(results, baseline=None):
+    rows = []
+    for concurrency in sorted(results, key=int):
+        for name, stats in sorted(results[concurrency].items()):
+            row = [concurrency, name, stats['requests'], stats['errors'],
+                   '%.1f/s' % stats['throughput'], '%.1f' % stats['p50_ms'],
+                   '%.1f' % stats['p95_ms'], '%.1f' % stats['p99_ms']]
+            if baseline is not None:
+                before = baseline.get(concurrency, {}).get(name)
+                if before and before['p95_ms']:
+                    change = (stats['p95_ms'] - before['p95_ms']) / before['p95_ms']
+                    row.append('%+.0f%%' % (change * 100))
+                else:
+                    row.append('-')
+            rows.append(row)
+
+    headers = ['threads', 'request', 'count', 'errors', 'throughput',
+               'p50 ms', 'p95 ms', 'p99 ms']
+    if baseline is not None:
+        headers.append('p95 vs baseline')
+    report(rows, headers)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--requests', type=int, default=1000,
+                        help='requests sent at each concurrency level')
+    parser.add_argument('--mix', nargs='+', default=DEFAULT_MIX)
+    parser.add_argument('--feed-latency', type=float, default=0.1,
+                        help='seconds the stub podcast server waits per request')
+    parser.add_argument('--feed-items', type=int, default=500)
+    parser.add_argument('--feed-ttl', type=float, default=None,
+                        help='override feed cache TTLs, 0 fetches every time')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--entry-point', choices=['wsgi', 'asgi'],
+                        default='wsgi')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='most WSGI requests handled at once')
+    parser.add_argument('--output', help='save results to this JSON file')
+    parser.add_argument('--compare', help='JSON results of an earlier run')
+    args = parser.parse_args(argv)
+
+    quiet()
+    stub = StubPodcasts(latency=args.feed_latency, items=args.feed_items).start()
+    application = load_application(stub, args.feed_ttl, args.entry_point)
+    mix = parse_mix(args.mix)
+
+    results = {}
+    for concurrency in args.concurrency:
+        if args.entry_point == 'asgi':
+            wall, latencies, errors = run_level_asgi(
+                application, mix, concurrency, args.requests, args.seed)
+        else:
+            wall, latencies, errors = run_level(
+                application, mix, concurrency, args.requests, args.seed,
+                args.workers)
+        results[str(concurrency)] = summarize(wall, latencies, errors)
+    stub.stop()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'commit': current_commit(),
+                       'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ',
+                                                  time.gmtime()),
+                       'config': vars(args),
+                       'feed_requests': stub.requests,
+                       'results': results}, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
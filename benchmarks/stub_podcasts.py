@@ -0,0 +1,115 @@
+"""
+Local stand-in for https://podcasts.vpr.net with tunable latency and feed size.
+
+    python -m benchmarks.stub_podcasts --port 8099 --latency 0.5 --items 1000
+
+Every path serves a synthetic feed titled after the path, e.g. /vermont-edition.
+ETag conditional requests get a 304.
+"""
+from __future__ import print_function
+import argparse
+import threading
+import time
+
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from six.moves.socketserver import ThreadingMixIn
+
+from benchmarks import synthetic_feed
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class StubPodcasts(object):
+    """
+    Threaded HTTP server serving synthetic podcast feeds.
+    """
+
+    def __init__(self, port=0, latency=0.0, items=100):
+        """
+        :param port: port to listen on, 0 picks a free one
+        :param latency: seconds to wait before answering each request
+        :param items: number of episodes in each feed
+        """
+        self.latency = latency
+        self.items = items
+        self.requests = 0
+        self._feeds = {}
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d/' % self.server.server_address[1]
+
+    def feed(self, name):
+        with self._lock:
+            if name not in self._feeds:
+                title = name.replace('-', ' ').title()
+                self._feeds[name] = synthetic_feed(self.items, title=title)
+            return self._feeds[name]
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with stub._lock:
+                    stub.requests += 1
+                if stub.latency:
+                    time.sleep(stub.latency)
+
+                name = self.path.strip('/') or 'vpr'
+                etag = '"%s-%d"' % (name, stub.items)
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+
+                body = stub.feed(name)
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/rss+xml')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('ETag', etag)
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except IOError:
+                    pass  # the streaming parser hung up early
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       name='stub-podcasts')
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--items', type=int, default=100)
+    args = parser.parse_args(argv)
+
+    stub = StubPodcasts(args.port, args.latency, args.items)
+    print('Serving synthetic podcasts on %s' % stub.url)
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        stub.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+Test client for vpr_alexa.asgi, answering like Flask's test_client. Python 3
+only, import it from inside tests.
+"""
+import asyncio
+
+from werkzeug.wrappers import Response
+
+from tests.fixtures import mock_bls_ed, mock_vt_ed
+from vpr_alexa.feeds import FeedCache
+
+FEEDS = {'vermont-edition': mock_vt_ed, 'brave-little-state': mock_bls_ed}
+
+
+class FakeFetch(object):
+    """ fetch_feed stand-in serving the fixture feeds after `delay` seconds. """
+
+    def __init__(self, delay=0, error=None):
+        self.delay = delay
+        self.error = error
+        self.calls = []
+
+    async def __call__(self, url, **kwargs):
+        self.calls.append((url, kwargs))
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        feed = FEEDS.get(url.rstrip('/').rsplit('/', 1)[-1], mock_vt_ed)
+        return dict(feed, status=200, etag='"v1"', modified=None)
+
+
+def fixture_feeds():
+    """
+    :return: AsyncFeeds serving fixture feeds into a cache of its own, leaving
+    programs.feed_cache and its breakers alone
+    """
+    from vpr_alexa.asgi import AsyncFeeds
+    return AsyncFeeds(cache=FeedCache(), fetch=FakeFetch())
+
+
+async def call(application, method, path, body=b'', headers=()):
+    """
+    Send one HTTP request through an ASGI application.
+    :return: (status code, list of header pairs, bytes of the body)
+    """
+    scope = {'type': 'http', 'http_version': '1.1', 'method': method,
+             'scheme': 'http', 'path': path, 'root_path': '',
+             'query_string': b'', 'server': ('localhost', 80),
+             'client': ('127.0.0.1', 50000),
+             'headers': [(b'content-type', b'application/json')] +
+                        [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                         for name, value in headers]}
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    await application(scope, receive, send)
+    start = sent[0]
+    return (start['status'], start['headers'],
+            b''.join(message.get('body', b'') for message in sent[1:]))
+
+
+async def lifespan(application):
+    """
+    Start an ASGI application up and shut it down again.
+    :return: list of the messages it sent
+    """
+    messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    await application({'type': 'lifespan'}, receive, send)
+    return sent
+
+
+class AsgiTestClient(object):
+    """
+    Runs requests through an ASGI application on an event loop of its own.
+    """
+
+    def __init__(self, application):
+        self.application = application
+        self.loop = asyncio.new_event_loop()
+
+    def open(self, method, path, data=b'', headers=()):
+        if hasattr(data, 'read'):
+            data = data.read()
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        status, headers, body = self.loop.run_until_complete(
+            call(self.application, method, path, data, headers))
+        return Response(body, status=status,
+                        headers=[(name.decode('latin-1'), value.decode('latin-1'))
+                                 for name, value in headers])
+
+    def post(self, path, data=b'', headers=()):
+        return self.open('POST', path, data, headers)
+
+    def get(self, path, headers=()):
+        return self.open('GET', path, headers=headers)
+
+    def close(self):
+        self.application.close()
+        close_loop(self.loop)
+
+
+def close_loop(loop):
+    """ Cancel fetches still running past their deadline, then close. """
+    pending = [task for task in asyncio.all_tasks(loop) if not task.done()] \
+        if hasattr(asyncio, 'all_tasks') else asyncio.Task.all_tasks(loop)
+    for task in pending:
+        task.cancel()
+    if pending:
+        loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+    loop.close()
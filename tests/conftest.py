@@ -0,0 +1,10 @@
+"""
+pytest configuration shared by every test module.
+"""
+import sys
+
+# The ASGI entry point and its test client use async/await, which Python 2
+# can't even compile, so keep them out of collection there.
+collect_ignore = []
+if sys.version_info < (3, 6):
+    collect_ignore.extend(['test_asgi.py', 'asgi_client.py'])
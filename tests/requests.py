@@ -9,15 +9,32 @@ a File-like object for reading the POST data to send.
 """
 import os
 import io
+import re
+import uuid
 import six
 
 requests_dir = os.path.realpath(os.path.join(os.path.realpath(__file__),
                                              '../fixtures/'))
 
 
+_request_id = re.compile(r'"requestId": "[^"]*"')
+
+
+def with_request_id(body, request_id=None):
+    """
+    Alexa gives every request its own id and the skill answers a repeated id
+    with the response it already sent, see vpr_alexa.idempotency.
+    :param body: str of request JSON
+    :param request_id: id to use, defaults to a new one
+    :return: str of the request JSON with the new id
+    """
+    request_id = request_id or 'amzn1.echo-api.request.%s' % uuid.uuid4()
+    return _request_id.sub('"requestId": "%s"' % request_id, body)
+
+
 def _read_request_json(filename):
     with open(requests_dir + '/' + filename, 'r') as f:
-        body = f.read()
+        body = with_request_id(f.read())
         return io.StringIO(six.u(body))
 
 
@@ -44,3 +61,39 @@ def help():
 
 def say_nothing():
     return _read_request_json('say_nothing.json')
+
+
+def audio_player_event(event='PlaybackStarted', token='token', offset=0):
+    json = _read_request_json('audio_player_event.json').read()
+    return io.StringIO(json.replace('{{EVENT}}', event)
+                           .replace('{{TOKEN}}', token)
+                           .replace('{{OFFSET}}', str(offset)))
+
+
+def audio_player_intent(intent='AMAZON.NextIntent', token='token'):
+    json = _read_request_json('audio_player_intent.json').read()
+    return io.StringIO(json.replace('{{INTENT}}', intent)
+                           .replace('{{TOKEN}}', token))
+
+
+def whats_new():
+    return _read_request_json('whats_new.json')
+
+
+def search_episodes(topic='maple syrup'):
+    json = _read_request_json('search_episodes.json').read()
+    return io.StringIO(json.replace('{{TOPIC}}', topic))
+
+
+def program_utterances():
+    """
+    :return: list of (utterance, program key) from the regression corpus
+    """
+    utterances = []
+    with open(requests_dir + '/program_utterances.txt', 'r') as f:
+        for line in f.readlines():
+            line = line.rstrip('\n')
+            if line and not line.startswith('#'):
+                utterance, key = line.split('|')
+                utterances.append((utterance, key))
+    return utterances
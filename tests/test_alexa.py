@@ -6,9 +6,10 @@ from tests.fixtures import *
 import tests.requests as requests
 
 from mock import patch
-from pytest import fixture
+from pytest import fixture, skip
 import json
 import os
+import sys
 
 if 'FLASK_SECRET_KEY' not in os.environ:
     os.environ.setdefault('FLASK_SECRET_KEY', 'asdf')
@@ -18,14 +19,24 @@ app.config['ASK_VERIFY_REQUESTS'] = False
 app.config['TESTING'] = True
 
 
-@fixture(name='client')
-def setup_client():
+@fixture(name='client', params=['wsgi', 'asgi'])
+def setup_client(request):
     """
     Configure our test fixture. Your test functions should have a 'client'
-    parameter to allow using the pytest fixture.
-    :return: Flask test client
-    """
-    return app.test_client()
+    parameter to allow using the pytest fixture. Each test runs against both
+    the WSGI app and the ASGI entry point.
+    :return: Flask test client, or an ASGI client answering like one
+    """
+    if request.param == 'wsgi':
+        yield app.test_client()
+        return
+    if sys.version_info < (3, 6):
+        skip('The ASGI entry point needs Python 3.6+')
+    from tests.asgi_client import AsgiTestClient, fixture_feeds
+    from vpr_alexa.asgi import AsgiApplication
+    client = AsgiTestClient(AsgiApplication(app, feeds=fixture_feeds()))
+    yield client
+    client.close()
 
 
 def post(flask_client, request):
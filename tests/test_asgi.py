@@ -0,0 +1,182 @@
+"""
+Tests against the ASGI entry point and its non-blocking feed fetches. Python
+3.6+ only, tests/conftest.py leaves it out of collection on older versions.
+"""
+import asyncio
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import threading
+import time
+
+from mock import patch
+from pytest import fixture
+
+from benchmarks import synthetic_feed
+from benchmarks.stub_podcasts import StubPodcasts
+from tests.test_alexa import app
+import tests.requests as requests
+from tests.asgi_client import FakeFetch, call, close_loop, lifespan
+from vpr_alexa import programs
+from vpr_alexa.asgi import AsgiApplication, AsyncFeeds, fetch_feed, feeds_for
+from vpr_alexa.feeds import FeedCache
+from vpr_alexa.resilience import CircuitOpen, Deadline
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        close_loop(loop)
+
+
+@fixture(name='stub')
+def stub_podcasts():
+    stub = StubPodcasts(items=20).start()
+    yield stub
+    stub.stop()
+
+
+def test_fetch_feed(stub):
+    result = run(fetch_feed(stub.url + 'vermont-edition', max_items=3))
+    assert result['status'] == 200
+    assert result['feed']['title'] == 'Vermont Edition'
+    assert len(result['entries']) == 3
+    assert result['entries'][0]['links']
+
+    again = run(fetch_feed(stub.url + 'vermont-edition', etag=result['etag']))
+    assert again['status'] == 304
+    assert 'entries' not in again
+
+
+class ChunkedHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path == '/moved':
+            self.send_response(301)
+            self.send_header('Location', '/feed')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = synthetic_feed(5, title=u'Chunked Edition')
+        self.send_response(200)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for start in range(0, len(body), 100):
+            chunk = body[start:start + 100]
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+        self.wfile.write(b'0\r\n\r\n')
+
+    def log_message(self, *args):
+        pass
+
+
+def test_fetch_follows_redirects_and_chunks():
+    server = HTTPServer(('127.0.0.1', 0), ChunkedHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        url = 'http://127.0.0.1:%d/moved' % server.server_address[1]
+        result = run(fetch_feed(url, max_items=None))
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert result['feed']['title'] == 'Chunked Edition'
+    assert len(result['entries']) == 5
+
+
+def test_waiting_requests_share_a_fetch():
+    fetch = FakeFetch(delay=0.1)
+    feeds = AsyncFeeds(cache=FeedCache(), fetch=fetch)
+    url = programs.PODCAST_URL + 'vermont-edition'
+
+    async def many():
+        return await asyncio.gather(*[feeds.ensure(url) for _ in range(10)])
+
+    assert run(many()) == [True] * 10
+    assert len(fetch.calls) == 1
+    assert feeds.cache.peek(url)['feed']['title'] == 'Vermont Edition'
+
+    # Fresh now, nothing more to fetch.
+    assert run(feeds.ensure(url))
+    assert len(fetch.calls) == 1
+
+
+def test_refetches_are_conditional():
+    fetch = FakeFetch()
+    feeds = AsyncFeeds(cache=FeedCache(default_ttl=0), fetch=fetch)
+    url = programs.PODCAST_URL + 'vermont-edition'
+    run(feeds.ensure(url))
+    run(feeds.ensure(url))
+    assert fetch.calls[1][1]['etag'] == '"v1"'
+
+
+def test_failing_feed_trips_its_breaker():
+    feeds = AsyncFeeds(cache=FeedCache(), fetch=FakeFetch(error=IOError('down')))
+    url = programs.PODCAST_URL + 'vermont-edition'
+    for _ in range(10):
+        assert not run(feeds.ensure(url))
+    calls = len(feeds.fetch.calls)
+    assert calls < 10
+    try:
+        feeds.cache.breaker(url).before_call()
+        assert False, 'breaker should be open'
+    except CircuitOpen:
+        pass
+
+
+def test_feeds_for():
+    url = programs.PODCAST_URL
+    with patch.dict(programs.latest_episodes, clear=True):
+        whats_new = feeds_for(json.loads(requests.whats_new().read()))
+        assert url + 'vermont-edition' in whats_new
+        assert len(whats_new) == len(programs.podcasts)
+        assert feeds_for(json.loads(
+            requests.play_program('vermont edition').read())) == \
+            [url + 'vermont-edition']
+        assert feeds_for(json.loads(requests.play_program('jazz').read())) == []
+        assert feeds_for(json.loads(requests.launch().read())) == []
+
+        # Podcasts the refresher keeps in memory don't need fetching.
+        programs.latest_episodes['vermont-edition'] = object()
+        assert feeds_for(json.loads(
+            requests.play_program('vermont edition').read())) == []
+
+
+def test_prefetch_gives_up_at_the_deadline():
+    feeds = AsyncFeeds(cache=FeedCache(), fetch=FakeFetch(delay=5))
+    application = AsgiApplication(app, feeds=feeds)
+    body = requests.play_program('vermont edition').read().encode('utf-8')
+    start = time.time()
+    with patch.dict(programs.latest_episodes, clear=True):
+        run(application.prefetch(body, Deadline(0.2)))
+    assert time.time() - start < 1
+    application.close()
+
+
+def test_flask_runs_on_the_thread_pool():
+    application = AsgiApplication(app, feeds=AsyncFeeds(
+        cache=FeedCache(), fetch=FakeFetch()))
+    threads = []
+
+    def record(*args, **kwargs):
+        threads.append(threading.current_thread())
+        return app.wsgi_app(*args, **kwargs)
+
+    with patch.object(application, 'wsgi_app', record):
+        status, headers, body = run(call(application, 'GET', '/feeds'))
+    assert status == 200
+    assert (b'content-type', b'application/json') in headers
+    assert 'feeds' in json.loads(body.decode('utf-8'))
+    assert threads and threads[0] is not threading.main_thread()
+    application.close()
+
+
+def test_lifespan_starts_and_stops_the_refresher():
+    application = AsgiApplication(app, refresh_interval=0)
+    sent = run(lifespan(application))
+    assert [message['type'] for message in sent] == \
+        ['lifespan.startup.complete', 'lifespan.shutdown.complete']
+    assert application.refresher is None
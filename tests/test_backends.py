@@ -0,0 +1,121 @@
+"""
+Tests against the pooled Redis backend and its in-process fallback.
+"""
+import socket
+
+from mock import Mock, patch
+from pytest import raises
+import redis
+
+from vpr_alexa import metrics
+from vpr_alexa.backends import RedisBackend, TimedConnectionPool
+
+
+def unused_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def test_from_url():
+    backend = RedisBackend.from_url('redis://:secret@example.com:10449/2',
+                                    max_connections=5, socket_timeout=0.2)
+    pool = backend.client.connection_pool
+    assert isinstance(pool, TimedConnectionPool)
+    assert pool.max_connections == 5
+    assert pool.connection_kwargs['host'] == 'example.com'
+    assert pool.connection_kwargs['port'] == 10449
+    assert pool.connection_kwargs['password'] == 'secret'
+    assert pool.connection_kwargs['db'] == 2
+    assert pool.connection_kwargs['socket_timeout'] == 0.2
+    assert pool.connection_kwargs['socket_connect_timeout'] == 0.2
+    assert backend.stats()['pool'] == {'max': 5, 'created': 0, 'in_use': 0,
+                                       'idle': 0}
+
+
+def test_falls_back_while_unreachable():
+    backend = RedisBackend.from_url('redis://127.0.0.1:%d' % unused_port(),
+                                    socket_timeout=0.2, retry_interval=60)
+    with patch.object(metrics.registry, 'inc') as inc:
+        assert backend.set('stream', {'token': 'abc'})
+        assert backend.get('stream') == {'token': 'abc'}
+        assert backend.inc_many({'a': 1, 'b': 2}) == [1, 2]
+
+    assert not backend.available
+    assert backend.fallbacks == 1
+    inc.assert_called_once_with('vpr_alexa_redis_fallback_total',
+                                {'event': 'unavailable'})
+
+
+def test_recovers_when_redis_returns():
+    client = Mock()
+    client.get.side_effect = redis.ConnectionError('down')
+    client.ping.side_effect = redis.ConnectionError('still down')
+    backend = RedisBackend(client, retry_interval=60)
+
+    assert backend.get('key') is None
+    backend.set('key', 'from the fallback')
+    backend.retry_at = 0
+    assert backend.get('key') == 'from the fallback'
+    assert client.ping.call_count == 1
+
+    client.get.side_effect = None
+    client.get.return_value = backend.redis.dump_object('x')
+    client.ping.side_effect = None
+    backend.retry_at = 0
+    assert backend.get('key') == 'x'
+    assert backend.available
+    assert backend.recoveries == 1
+    assert backend.fallback.get('key') is None
+
+
+def test_counters_from_the_outage_are_added_on_recovery():
+    client = Mock()
+    client.ping.side_effect = redis.ConnectionError('down')
+    backend = RedisBackend(client, retry_interval=60)
+    backend._mark_down(redis.ConnectionError('down'))
+
+    backend.inc_many({'a': 1, 'b': 2})
+    backend.inc('a', 3)
+    backend.dec('b')
+
+    client.ping.side_effect = None
+    client.get.return_value = None
+    backend.retry_at = 0
+    with patch.object(backend.redis, 'inc_many') as inc_many:
+        assert backend.get('key') is None
+    assert backend.available
+    inc_many.assert_called_once_with({'a': 4, 'b': 1})
+    assert backend.fallback.get('a') is None
+
+
+def test_command_errors_propagate():
+    client = Mock()
+    client.incr.side_effect = redis.ResponseError('not an integer')
+    backend = RedisBackend(client)
+    with raises(redis.ResponseError):
+        backend.inc('key')
+    assert backend.available
+
+
+def test_inc_many_is_pipelined():
+    client = Mock()
+    pipe = client.pipeline.return_value
+    pipe.execute.return_value = [3, 4]
+    backend = RedisBackend(client, key_prefix='p:')
+
+    assert backend.inc_many({'a': 1}) == [3, 4]
+    client.pipeline.assert_called_once_with(transaction=False)
+    pipe.incr.assert_called_once_with(name='p:a', amount=1)
+    assert not client.incr.called
+
+
+def test_add_is_a_single_command():
+    client = Mock()
+    client.set.return_value = None
+    backend = RedisBackend(client)
+    assert backend.add('lock', 'token', timeout=30) is False
+    client.set.assert_called_once_with(
+        name='lock', value=backend.redis.dump_object('token'), nx=True, ex=30)
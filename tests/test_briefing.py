@@ -0,0 +1,163 @@
+"""
+Tests against the What's New briefing.
+"""
+import time
+
+from mock import patch
+from pytest import fixture
+
+from tests.test_alexa import app, post
+import tests.requests as requests
+from vpr_alexa import programs, resilience, webapp
+from vpr_alexa.briefing import Briefing
+from vpr_alexa.positions import playlist_from_token, token_for, url_from_token
+
+PODCASTS = ['vermont-edition', 'brave-little-state', 'eye-on-the-sky',
+            'vpr-news']
+
+
+def episode(name):
+    return programs.Program(name=name.replace('-', ' ').title(),
+                            title='Latest %s' % name, text='',
+                            url='https://cpa.ds.npr.org/vpr/%s.mp3' % name,
+                            small_img=None, large_img=None, is_podcast=True)
+
+
+class FakeFeeds(object):
+    """ latest_podcast_episode stand-in taking `delays[name]` seconds. """
+
+    def __init__(self, delays=None):
+        self.delays = delays or {}
+        self.calls = []
+        self.deadlines = []
+
+    def __call__(self, name):
+        self.calls.append(name)
+        self.deadlines.append(resilience.current_deadline())
+        if self.delays.get(name) == 'down':
+            raise IOError('down')
+        time.sleep(self.delays.get(name, 0))
+        return episode(name)
+
+
+def test_podcasts_are_resolved_concurrently():
+    feeds = FakeFeeds(dict((name, 0.2) for name in PODCASTS))
+    briefing = Briefing(PODCASTS, latest=feeds)
+    deadline = resilience.Deadline(2)
+
+    start = time.time()
+    episodes = briefing.episodes(deadline)
+    assert time.time() - start < 0.6
+    assert [e.name for e in episodes] == \
+        ['Vermont Edition', 'Brave Little State', 'Eye On The Sky', 'Vpr News']
+    assert feeds.deadlines == [deadline] * 4
+
+
+def test_late_podcasts_are_left_out():
+    feeds = FakeFeeds({'eye-on-the-sky': 1, 'vpr-news': 'down'})
+    briefing = Briefing(PODCASTS, latest=feeds, partial_ttl=0)
+
+    start = time.time()
+    episodes = briefing.episodes(resilience.Deadline(0.2))
+    assert time.time() - start < 0.5
+    assert [e.name for e in episodes] == \
+        ['Vermont Edition', 'Brave Little State']
+
+    # Partial briefings aren't kept for long.
+    feeds.calls = []
+    briefing.episodes(resilience.Deadline(2))
+    assert len(feeds.calls) == 4
+
+
+def test_briefing_is_cached_until_a_feed_changes():
+    feeds = FakeFeeds()
+    briefing = Briefing(PODCASTS, latest=feeds)
+    first = briefing.episodes()
+    assert briefing.episodes() is first
+    assert len(feeds.calls) == 4
+
+    with patch.object(programs, 'feed_generation',
+                      programs.feed_generation + 1):
+        assert briefing.episodes() == first
+    assert len(feeds.calls) == 8
+
+
+def test_feed_changes_bump_the_generation():
+    generation = programs.feed_generation
+    with patch.dict(programs.episode_indexes), \
+            patch.dict(programs.publish_schedules), \
+            patch.object(programs.episode_search, 'add'):
+        programs._index_feed(programs.PODCAST_URL + 'vpr-news',
+                             {'feed': {'title': 'VPR News'}, 'entries': []})
+    assert programs.feed_generation == generation + 1
+
+
+def test_new_latest_episode_bumps_the_generation():
+    """
+    Also when the episode comes from another worker through the shared
+    episode cache, without this worker fetching the feed.
+    """
+    new = episode('vpr-news')
+    with patch.object(programs, 'shared_episodes') as shared, \
+            patch.object(programs.feed_cache, 'get'), \
+            patch.dict(programs.latest_episodes,
+                       {'vpr-news': new._replace(title='Older news')}), \
+            patch.dict(programs.last_good_episodes):
+        shared.get_or_refresh.return_value = new
+        generation = programs.feed_generation
+        programs.refresh_podcast_episode('vpr-news')
+        assert programs.feed_generation == generation + 1
+        assert programs.latest_episodes['vpr-news'] == new
+
+        programs.refresh_podcast_episode('vpr-news')
+        assert programs.feed_generation == generation + 1
+
+
+def test_next_after():
+    briefing = Briefing(PODCASTS, latest=FakeFeeds())
+    assert briefing.next_after(episode('vpr-news').url) is None
+    briefing.episodes()
+    assert briefing.next_after(episode('vermont-edition').url).name == \
+        'Brave Little State'
+    assert briefing.next_after(episode('vpr-news').url) is None
+
+
+@fixture(name='briefing')
+def fake_briefing():
+    briefing = Briefing(PODCASTS, latest=FakeFeeds())
+    with patch.object(webapp, 'briefing', briefing):
+        yield briefing
+
+
+def test_whats_new_intent(briefing):
+    response = post(app.test_client(), requests.whats_new())
+    speech = response['response']['outputSpeech']['text']
+    assert speech.startswith("Here's what's new at VPR. "
+                             "Vermont Edition: Latest vermont-edition. ")
+    assert 'Vpr News: Latest vpr-news.' in speech
+    assert speech.endswith('starting with Vermont Edition.')
+
+    stream = response['response']['directives'][0]['audioItem']['stream']
+    assert stream['url'] == episode('vermont-edition').url
+    assert playlist_from_token(stream['token']) == 'briefing'
+
+
+def test_briefing_plays_on(briefing):
+    briefing.episodes()
+    token = token_for(episode('vermont-edition').url, 'briefing')
+    response = post(app.test_client(), requests.audio_player_event(
+        'PlaybackNearlyFinished', token=token))
+    stream = response['response']['directives'][0]['audioItem']['stream']
+    assert stream['url'] == episode('brave-little-state').url
+    assert stream['expectedPreviousToken'] == token
+    assert playlist_from_token(stream['token']) == 'briefing'
+    assert url_from_token(stream['token']) == stream['url']
+
+
+def test_whats_new_with_every_feed_down():
+    briefing = Briefing(PODCASTS, latest=FakeFeeds(
+        dict((name, 'down') for name in PODCASTS)))
+    with patch.object(webapp, 'briefing', briefing):
+        response = post(app.test_client(), requests.whats_new())
+    assert "couldn't get the latest" in \
+        response['response']['outputSpeech']['text']
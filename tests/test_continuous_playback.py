@@ -0,0 +1,98 @@
+"""
+Tests against continuous podcast playback: enqueuing the next episode when one
+is nearly finished, and Next/Previous through a podcast's episodes.
+"""
+from mock import patch
+from pytest import fixture
+
+from tests.test_alexa import app, post
+import tests.requests as requests
+from vpr_alexa import programs
+from vpr_alexa.positions import token_for, url_from_token
+
+
+def episode_url(n):
+    return 'https://cpa.ds.npr.org/vpr/audio/ve-%d.mp3' % n
+
+
+FEED = {
+    'feed': {'title': 'Vermont Edition',
+             'image': {'href': 'https://static.feedpress.it/logo/ve.jpg'}},
+    'entries': [{'title': 'Episode %d' % n,
+                 'summary': 'Episode %d of Vermont Edition.' % n,
+                 'links': [{'type': 'text/html', 'href': 'https://www.vpr.net/'},
+                           {'type': 'audio/mpeg', 'href': episode_url(n)}]}
+                for n in (3, 2, 1)]
+}
+
+
+@fixture(name='client')
+def setup_client():
+    programs.episode_lists.clear()
+    with patch.object(programs.feed_cache, 'peek',
+                      side_effect=lambda url: FEED
+                      if url.endswith('vermont-edition') else None):
+        yield app.test_client()
+    programs.episode_lists.clear()
+
+
+def test_episode_list_is_built_once_per_feed(client):
+    episodes = programs.podcast_episodes('vermont-edition')
+    assert [episode.url for episode in episodes] == \
+        [episode_url(3), episode_url(2), episode_url(1)]
+    assert programs.podcast_episodes('vermont-edition') is episodes
+    assert programs.podcast_episodes('vpr-news') == ()
+
+
+def test_adjacent_episode(client):
+    assert programs.adjacent_episode(episode_url(3), 1).title == 'Episode 2'
+    assert programs.adjacent_episode(episode_url(2), -1).title == 'Episode 3'
+    assert programs.adjacent_episode(episode_url(1), 1) is None
+    assert programs.adjacent_episode(episode_url(3), -1) is None
+    assert programs.adjacent_episode('https://unknown/episode.mp3', 1) is None
+
+
+def test_nearly_finished_enqueues_next_episode(client):
+    token = token_for(episode_url(3))
+    with patch.object(programs.feed_cache, 'get') as get:
+        response = post(client, requests.audio_player_event(
+            'PlaybackNearlyFinished', token=token, offset=1000))
+    assert not get.called
+
+    directive = response['response']['directives'][0]
+    assert directive['playBehavior'] == 'ENQUEUE'
+    stream = directive['audioItem']['stream']
+    assert stream['url'] == episode_url(2)
+    assert stream['expectedPreviousToken'] == token
+    assert url_from_token(stream['token']) == episode_url(2)
+
+
+def test_nearly_finished_at_the_last_episode(client):
+    for token in (token_for(episode_url(1)), 'live-stream-token'):
+        response = post(client, requests.audio_player_event(
+            'PlaybackNearlyFinished', token=token))
+        assert response['response'] == {}
+
+
+def test_next_and_previous(client):
+    response = post(client, requests.audio_player_intent(
+        'AMAZON.NextIntent', token_for(episode_url(2))))
+    stream = response['response']['directives'][0]['audioItem']['stream']
+    assert stream['url'] == episode_url(1)
+    assert response['response']['outputSpeech']['text'] == \
+        'Playing Vermont Edition titled Episode 1'
+
+    response = post(client, requests.audio_player_intent(
+        'AMAZON.PreviousIntent', token_for(episode_url(2))))
+    stream = response['response']['directives'][0]['audioItem']['stream']
+    assert stream['url'] == episode_url(3)
+
+
+def test_next_past_the_end(client):
+    response = post(client, requests.audio_player_intent(
+        'AMAZON.NextIntent', token_for(episode_url(1))))
+    assert 'no more episodes' in response['response']['outputSpeech']['text']
+
+    response = post(client, requests.audio_player_intent(
+        'AMAZON.NextIntent', 'live-stream-token'))
+    assert "doesn't support" in response['response']['outputSpeech']['text']
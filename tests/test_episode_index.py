@@ -0,0 +1,94 @@
+"""
+Tests against the compact per-podcast episode index.
+"""
+from mock import patch
+from pytest import raises
+
+from tests.test_feeds import parsed
+from vpr_alexa import programs
+from vpr_alexa.episode_index import (EpisodeIndex, parse_duration,
+                                     parse_published)
+
+DAY = 24 * 60 * 60
+START = parse_published('Mon, 02 Jan 2017 12:00:00 -0500')
+
+
+def entry(n, published=None, audio=True):
+    links = [{'type': 'text/html', 'href': 'https://www.vpr.net/%d' % n}]
+    if audio:
+        links.append({'type': 'audio/mpeg',
+                      'href': 'https://cpa.ds.npr.org/vpr/%d.mp3' % n})
+    return {'title': u'Episode %d — maple' % n, 'summary': 'x' * 500,
+            'links': links, 'itunes_duration': '00:%02d:00' % n,
+            'published': published or
+            'Mon, %02d Jan 2017 12:00:00 -0500' % (n + 1)}
+
+
+def test_parsers():
+    assert parse_published('Tue, 14 Mar 2017 12:00:00 -0400') == 1489507200
+    assert parse_published('not a date') == 0
+    assert parse_duration('1:02:03') == 3723
+    assert parse_duration('48:10') == 2890
+    assert parse_duration('2890') == 2890
+    assert parse_duration('') == 0
+    assert parse_duration('about an hour') == 0
+
+
+def test_lookup_by_position():
+    index = EpisodeIndex.from_entries([entry(n) for n in (1, 3, 2)] +
+                                      [entry(9, audio=False)])
+    assert len(index) == 3
+    assert [index[n].title for n in range(3)] == \
+        [u'Episode 3 — maple', u'Episode 2 — maple',
+         u'Episode 1 — maple']
+    assert index[0].url == 'https://cpa.ds.npr.org/vpr/3.mp3'
+    assert index[0].duration == 180
+    assert index[-1].published == START
+    with raises(IndexError):
+        index[3]
+
+
+def test_lookup_by_date():
+    index = EpisodeIndex.from_entries([entry(n) for n in range(1, 11)])
+    assert index[index.published_before(START + 4 * DAY)].title.startswith('Episode 5')
+    assert index[index.published_before(START + 4 * DAY - 1)].title.startswith('Episode 4')
+    assert index.published_before(START - 1) is None
+
+    positions = index.published_between(START + 2 * DAY, START + 5 * DAY)
+    assert [index[n].title[:9] for n in positions] == \
+        ['Episode 5', 'Episode 4', 'Episode 3']
+    assert list(index.published_between(0, START)) == []
+
+
+def test_limit_keeps_the_newest():
+    index = EpisodeIndex.from_entries([entry(n) for n in range(1, 11)],
+                                      limit=3)
+    assert [index[n].title[:10] for n in range(3)] == \
+        ['Episode 10', 'Episode 9 ', 'Episode 8 ']
+
+
+def test_index_is_smaller_than_the_entries():
+    entries = [entry(n) for n in range(1, 29)]
+    index = EpisodeIndex.from_entries(entries)
+    assert index.nbytes() < 150 * len(entries)
+
+
+@patch('vpr_alexa.feeds.feedparser.parse')
+def test_feed_refresh_builds_index(parse):
+    feed = {'feed': {'title': 'Vermont Edition',
+                     'image': {'href': 'https://www.vpr.net/ve.jpg'}},
+            'entries': [entry(n) for n in range(28, 0, -1)]}
+    parse.return_value = parsed(feed)
+    with patch.object(programs.feed_cache, 'streaming', False):
+        programs.feed_cache.refresh(programs.PODCAST_URL + 'vermont-edition')
+    try:
+        assert len(programs.episode_indexes['vermont-edition']) == 28
+        assert len(programs.feed_cache.peek(
+            programs.PODCAST_URL + 'vermont-edition')['entries']) == \
+            programs.EPISODES_KEPT
+        footprint = programs.episode_index_footprint()['vermont-edition']
+        assert footprint['episodes'] == 28
+        assert footprint['bytes'] > 0
+    finally:
+        programs.feed_cache.invalidate()
+        programs.episode_indexes.clear()
@@ -0,0 +1,167 @@
+"""
+Tests against the cross-worker shared episode cache. werkzeug's SimpleCache
+stands in for Redis.
+"""
+import threading
+import time
+from mock import patch
+from pytest import raises
+from werkzeug.contrib.cache import SimpleCache
+
+from tests.fixtures import mock_vt_ed, mock_vted_program, mock_bls_program
+from vpr_alexa import programs
+from vpr_alexa.episodes import SharedEpisodeCache, LOCK_PREFIX
+from vpr_alexa.feeds import FeedCache
+from vpr_alexa.search import EpisodeSearch
+
+
+class FakeRedisCache(SimpleCache):
+    """
+    SimpleCache with an atomic `add`, like Redis' SETNX, so concurrent
+    callers can't both take a lock.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(FakeRedisCache, self).__init__(*args, **kwargs)
+        self._add_lock = threading.Lock()
+
+    def add(self, *args, **kwargs):
+        with self._add_lock:
+            return super(FakeRedisCache, self).add(*args, **kwargs)
+
+
+def test_fresh_episode_is_shared():
+    backend = FakeRedisCache()
+    first, second = SharedEpisodeCache(backend), SharedEpisodeCache(backend)
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return mock_vted_program
+
+    assert first.get_or_refresh('vermont-edition', fetch) == mock_vted_program
+    assert second.get_or_refresh('vermont-edition', fetch) == mock_vted_program
+    assert len(calls) == 1
+
+
+def test_stale_episode_served_while_another_worker_refreshes():
+    backend = FakeRedisCache()
+    cache = SharedEpisodeCache(backend, ttl=60)
+    cache.set('vermont-edition', mock_vted_program, fetched_at=0)
+    backend.add(LOCK_PREFIX + 'vermont-edition', 'someone-else')
+
+    def fetch():
+        raise AssertionError('only the lock holder should fetch')
+
+    assert cache.get_or_refresh('vermont-edition', fetch) == mock_vted_program
+
+
+def test_stale_episode_refreshed_by_lock_winner():
+    backend = FakeRedisCache()
+    cache = SharedEpisodeCache(backend, ttl=60)
+    cache.set('brave-little-state', mock_vted_program, fetched_at=0)
+
+    program = cache.get_or_refresh('brave-little-state', lambda: mock_bls_program)
+
+    assert program == mock_bls_program
+    assert cache.get('brave-little-state')[0] == mock_bls_program
+    assert backend.get(LOCK_PREFIX + 'brave-little-state') is None
+
+
+def test_failed_refresh_serves_stale_episode():
+    backend = FakeRedisCache()
+    cache = SharedEpisodeCache(backend, ttl=60)
+    cache.set('vermont-edition', mock_vted_program, fetched_at=0)
+
+    def fetch():
+        raise IOError('podcasts.vpr.net is down')
+
+    assert cache.get_or_refresh('vermont-edition', fetch) == mock_vted_program
+    assert backend.get(LOCK_PREFIX + 'vermont-edition') is None
+    with raises(IOError):
+        SharedEpisodeCache(FakeRedisCache()).get_or_refresh('vermont-edition',
+                                                            fetch)
+
+
+def test_cold_start_is_single_flight():
+    """
+    With nothing stored, only one of many concurrent callers fetches and the
+    rest wait for its result.
+    """
+    backend = FakeRedisCache()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(1)
+        return mock_vted_program
+
+    results = []
+
+    def worker():
+        cache = SharedEpisodeCache(backend)
+        results.append(cache.get_or_refresh('vermont-edition', fetch))
+
+    threads = [threading.Thread(target=worker) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [mock_vted_program] * 5
+
+
+def test_worker_reading_shared_record_keeps_its_own_episode_list():
+    """
+    A second worker picking up the episode a first worker stored still reads
+    the feed itself, for the episode list, index, search and schedule.
+    """
+    shared = SharedEpisodeCache(FakeRedisCache(), ttl=60)
+
+    def worker():
+        return patch.object(programs, 'feed_cache',
+                            FeedCache(on_refresh=programs._index_feed))
+
+    with patch.object(programs, 'shared_episodes', shared), \
+            patch.object(programs, 'episode_search', EpisodeSearch()), \
+            patch.dict(programs.latest_episodes, clear=True), \
+            patch.dict(programs.last_good_episodes, clear=True), \
+            patch.dict(programs.episode_lists, clear=True), \
+            patch.dict(programs.episode_indexes, clear=True), \
+            patch.dict(programs.publish_schedules, clear=True), \
+            patch('vpr_alexa.feeds.feedparser.parse',
+                  return_value=dict(mock_vt_ed)) as parse:
+        with worker():
+            programs.refresh_podcast_episode('vermont-edition')
+        programs.episode_lists.clear()
+        programs.episode_indexes.clear()
+
+        with worker():
+            episode = programs.refresh_podcast_episode('vermont-edition')
+            assert episode == mock_vted_program
+            assert programs.podcast_episodes('vermont-edition')[0] == \
+                mock_vted_program
+            assert 'vermont-edition' in programs.episode_indexes
+        assert parse.call_count == 2
+
+
+def test_forced_refresh_skips_fresh_shared_episode():
+    shared = SharedEpisodeCache(FakeRedisCache(), ttl=60)
+    shared.set('vermont-edition', mock_bls_program)
+
+    with patch.object(programs, 'shared_episodes', shared), \
+            patch.object(programs, 'feed_cache', FeedCache()), \
+            patch.dict(programs.latest_episodes, clear=True), \
+            patch.dict(programs.last_good_episodes, clear=True), \
+            patch.dict(programs.episode_lists, clear=True), \
+            patch('vpr_alexa.feeds.feedparser.parse',
+                  return_value=dict(mock_vt_ed)):
+        assert programs.refresh_podcast_episode('vermont-edition') == \
+            mock_bls_program
+        assert programs.refresh_podcast_episode('vermont-edition',
+                                                force=True) == mock_vted_program
+    assert shared.get('vermont-edition')[0] == mock_vted_program
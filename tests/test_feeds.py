@@ -0,0 +1,125 @@
+"""
+Tests against the podcast feed cache.
+"""
+import time
+
+import pytest
+from mock import patch
+
+from tests.fixtures import mock_vt_ed
+from vpr_alexa.feeds import FeedCache, FeedUnavailable
+
+URL = 'https://podcasts.vpr.net/vermont-edition'
+
+
+def parsed(feed, status=200, etag='"abc"', modified=None):
+    """ Build something shaped like feedparser's result dict. """
+    result = dict(feed)
+    result.update({'status': status, 'etag': etag, 'modified': modified})
+    return result
+
+
+@patch('vpr_alexa.feeds.feedparser.parse', return_value=parsed(mock_vt_ed))
+def test_fresh_feed_is_only_fetched_once(parse):
+    cache = FeedCache(default_ttl=60)
+
+    first = cache.get(URL)
+    second = cache.get(URL)
+
+    assert first['feed']['title'] == 'Vermont Edition'
+    assert second is first
+    assert parse.call_count == 1
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'stale': 0,
+                             'not_modified': 0}
+
+
+@patch('vpr_alexa.feeds.feedparser.parse')
+def test_not_modified_keeps_cached_feed(parse):
+    parse.return_value = parsed(mock_vt_ed)
+    cache = FeedCache(default_ttl=0, stale_ttl=0)
+    first = cache.get(URL)
+
+    parse.return_value = {'status': 304, 'entries': []}
+    second = cache.get(URL)
+
+    assert second is first
+    parse.assert_called_with(URL, etag='"abc"', modified=None)
+    assert cache.stats()['not_modified'] == 1
+
+
+@patch('vpr_alexa.feeds.feedparser.parse')
+def test_not_modified_after_invalidate_fetches_again(parse):
+    parse.return_value = parsed(mock_vt_ed)
+    cache = FeedCache(default_ttl=0, stale_ttl=0)
+    cache.get(URL)
+
+    def invalidated_in_flight(url, **validators):
+        if validators:
+            cache.invalidate(url)
+            return {'status': 304, 'entries': []}
+        return parsed(mock_vt_ed)
+    parse.side_effect = invalidated_in_flight
+
+    assert cache.refresh(URL).feed['feed']['title'] == 'Vermont Edition'
+    parse.assert_called_with(URL)
+
+
+def test_not_modified_without_previous_copy_is_unavailable():
+    cache = FeedCache()
+
+    with pytest.raises(FeedUnavailable):
+        cache.update(URL, {'status': 304, 'entries': []})
+    assert cache.peek(URL) is None
+
+
+@patch('vpr_alexa.feeds.feedparser.parse', return_value=parsed(mock_vt_ed))
+def test_stale_feed_served_while_refreshing(parse):
+    cache = FeedCache(default_ttl=10, stale_ttl=60)
+    first = cache.get(URL)
+    cache._feeds[URL].fetched_at -= 30
+
+    assert cache.get(URL) is first
+    assert cache.stats()['stale'] == 1
+
+    # the refresh happens on a background thread
+    for _ in range(100):
+        if parse.call_count == 2:
+            break
+        time.sleep(0.01)
+    assert parse.call_count == 2
+
+
+@patch('vpr_alexa.feeds.feedparser.parse', return_value=parsed(mock_vt_ed))
+def test_per_feed_ttls(parse):
+    other = 'https://podcasts.vpr.net/vpr-news'
+    cache = FeedCache(default_ttl=60, stale_ttl=0, ttls={other: 0})
+
+    cache.get(URL)
+    cache.get(URL)
+    cache.get(other)
+    cache.get(other)
+
+    assert parse.call_count == 3
+
+
+@patch('vpr_alexa.feeds.feedparser.parse')
+def test_failed_refresh_falls_back_to_expired_feed(parse):
+    parse.return_value = parsed(mock_vt_ed)
+    cache = FeedCache(default_ttl=0, stale_ttl=0)
+    first = cache.get(URL)
+
+    parse.side_effect = IOError('podcasts.vpr.net is down')
+    assert cache.get(URL) is first
+
+
+@patch('vpr_alexa.feeds.feedparser.parse')
+def test_on_refresh_sees_every_entry_before_trimming(parse):
+    feed = dict(mock_vt_ed, entries=mock_vt_ed['entries'] * 5)
+    parse.return_value = parsed(feed)
+    seen = []
+    cache = FeedCache(keep_items=2,
+                      on_refresh=lambda url, feed: seen.append(
+                          len(feed['entries'])))
+
+    assert len(cache.get(URL)['entries']) == 2
+    assert seen == [5]
@@ -0,0 +1,96 @@
+"""
+Tests against the health and readiness endpoints.
+"""
+import json
+import time
+
+from mock import MagicMock, patch
+from pytest import fixture
+
+from tests.fixtures import mock_vt_ed
+from tests.test_alexa import app
+from vpr_alexa import health, programs, refresher
+from vpr_alexa.feeds import FeedCache
+from vpr_alexa.refresher import FeedRefresher
+
+
+@fixture(name='feeds')
+def empty_feed_cache():
+    """ An empty feed cache that fails the test if anything fetches. """
+    feeds = FeedCache(default_ttl=300)
+    with patch.object(programs, 'feed_cache', feeds), \
+            patch.object(feeds, '_fetch', side_effect=AssertionError('fetch')), \
+            patch.dict(programs.latest_episodes, clear=True), \
+            patch.object(refresher, 'current', None):
+        yield feeds
+
+
+def fill(feeds, names, fetched_at=None):
+    for name in names:
+        entry = feeds.update(programs.PODCAST_URL + name, dict(mock_vt_ed))
+        if fetched_at is not None:
+            entry.fetched_at = fetched_at
+
+
+def get(path):
+    response = app.test_client().get(path)
+    return response.status_code, json.loads(response.data.decode('utf-8'))
+
+
+def test_healthz(feeds):
+    status, body = get('/healthz')
+    assert status == 200
+    assert body['status'] == 'ok'
+    assert not body['refresher_running']
+
+
+def test_not_ready_until_feeds_are_primed(feeds):
+    status, body = get('/readyz')
+    assert status == 503
+    assert body['waiting_on'] == sorted(programs.podcasts)
+    assert body['feeds']['vpr-news']['state'] == 'missing'
+
+    fill(feeds, ['vermont-edition', 'eye-on-the-sky', 'vpr-news'])
+    # A feed that's down has been tried, it doesn't hold the worker back.
+    feeds.breaker(programs.PODCAST_URL + 'brave-little-state').failure()
+    status, body = get('/readyz')
+    assert status == 200
+    assert body['ready']
+    assert body['feeds']['vpr-news']['state'] == 'fresh'
+    assert body['feeds']['brave-little-state']['failures'] == 1
+    assert body['cache_backend']['available']
+
+
+def test_not_ready_without_the_cache_backend(feeds):
+    fill(feeds, programs.podcasts)
+    backend = MagicMock()
+    backend.stats.return_value = {'available': False, 'down_since': 1.0}
+    with patch.object(health, 'backend', backend):
+        status, body = get('/readyz')
+    assert status == 503
+    assert body['cache_backend']['type'] == 'MagicMock'
+
+
+def test_feed_ages_relative_to_their_refresh(feeds):
+    now = time.time()
+    fill(feeds, ['vermont-edition'], fetched_at=now - 150)
+    fill(feeds, ['vpr-news'], fetched_at=now - 900)
+    fill(feeds, ['eye-on-the-sky'], fetched_at=now - 7200)
+
+    assert health.feed_status('vermont-edition', now)['relative_age'] == 0.5
+    news = health.feed_status('vpr-news', now)
+    assert news['state'] == 'stale'
+    assert news['overdue']
+    assert health.feed_status('eye-on-the-sky', now)['state'] == 'expired'
+
+    # The refresher polling less often pushes out the expected refresh.
+    poller = FeedRefresher(podcasts=['vpr-news'], interval=3600)
+    poller.next_due['vpr-news'] = now + 600
+    with patch.object(refresher, 'current', poller), \
+            patch.object(poller, 'is_running', return_value=True):
+        news = health.feed_status('vpr-news', now)
+        status, body = get('/readyz')
+    assert news['expected_refresh'] == 3600
+    assert news['next_poll_in'] == 600
+    assert not news['overdue']
+    assert body['overdue'] == ['eye-on-the-sky']
@@ -0,0 +1,121 @@
+"""
+Tests against answering retried Alexa requests from the response cache.
+"""
+import io
+import threading
+
+from mock import patch
+from pytest import fixture, raises
+from werkzeug.contrib.cache import SimpleCache
+
+from tests.test_alexa import app, post
+import tests.requests as requests
+from vpr_alexa import metrics, programs, webapp
+from vpr_alexa.idempotency import PENDING, ResponseCache
+
+
+def play(program, request_id):
+    body = requests.play_program(program).read()
+    return io.StringIO(requests.with_request_id(body, request_id))
+
+
+def retries(result):
+    return metrics.registry.collect().get(
+        metrics.series('vpr_alexa_retried_requests_total', {'result': result}),
+        0)
+
+
+@fixture(name='client')
+def setup_client():
+    return app.test_client()
+
+
+def test_claim_store_and_replay():
+    responses = ResponseCache(SimpleCache())
+    assert responses.claim('request-1')
+    assert not responses.claim('request-1')
+
+    responses.store('request-1', 200, b'{}')
+    assert responses.response('request-1') == {'status': 200, 'body': b'{}'}
+    assert not responses.claim('request-1')
+
+
+def test_release_lets_a_retry_claim_the_request():
+    responses = ResponseCache(SimpleCache(), wait=0.1)
+    assert responses.claim('request-1')
+    assert responses.response('request-1') is None
+
+    responses.release('request-1')
+    assert responses.response('request-1') is None
+    assert responses.claim('request-1')
+
+
+def test_retry_is_answered_from_the_cache(client):
+    replayed = retries('replayed')
+    with patch.object(programs, 'get_program',
+                      wraps=programs.get_program) as get_program:
+        first = post(client, play('jazz', 'request-retried'))
+        second = post(client, play('jazz', 'request-retried'))
+        post(client, play('jazz', 'request-other'))
+
+    assert second == first
+    assert get_program.call_count == 2
+    assert retries('replayed') == replayed + 1
+
+
+def test_retry_waits_for_the_first_attempt(client):
+    started, finish = threading.Event(), threading.Event()
+    get_program = programs.get_program
+
+    def slow_get_program(name):
+        started.set()
+        finish.wait(5)
+        return get_program(name)
+
+    results = {}
+
+    def first_attempt():
+        results['first'] = post(app.test_client(),
+                                play('jazz', 'request-in-flight'))
+
+    with patch.object(programs, 'get_program',
+                      side_effect=slow_get_program) as patched:
+        thread = threading.Thread(target=first_attempt)
+        thread.start()
+        assert started.wait(5)
+        threading.Timer(0.2, finish.set).start()
+        results['retry'] = post(client, play('jazz', 'request-in-flight'))
+        thread.join()
+
+    assert patched.call_count == 1
+    assert results['retry'] == results['first']
+
+
+def test_retry_of_an_unfinished_attempt_is_handled(client):
+    handled = retries('handled')
+    assert webapp.response_cache.claim('request-stuck')
+    with patch.object(webapp.response_cache, 'wait', 0.1):
+        response = post(client, play('jazz', 'request-stuck'))
+    assert response['response']['directives'][0]['type'] == 'AudioPlayer.Play'
+    assert retries('handled') == handled + 1
+    # The stuck attempt's claim is left to expire.
+    assert webapp.cache.get('vpr_alexa:response:request-stuck') == PENDING
+
+
+def test_failed_attempt_is_not_replayed(client):
+    with patch.object(webapp.response_cache, 'store') as store, \
+            patch.object(webapp.response_cache, 'release') as release:
+        with raises(TypeError):
+            # No request type, which flask-ask fails on.
+            client.post('/ask', data='{"request": {"requestId": "x"}}')
+    assert not store.called
+    release.assert_called_once_with('x')
+
+
+def test_disabled(client):
+    with patch.object(webapp.response_cache, 'ttl', 0), \
+            patch.object(programs, 'get_program',
+                         wraps=programs.get_program) as get_program:
+        post(client, play('jazz', 'request-disabled'))
+        post(client, play('jazz', 'request-disabled'))
+    assert get_program.call_count == 2
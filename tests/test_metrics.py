@@ -0,0 +1,88 @@
+"""
+Tests against request/cache metrics and the /metrics endpoint.
+"""
+from mock import Mock
+from werkzeug.contrib.cache import SimpleCache
+
+from tests.test_alexa import app, post
+import tests.requests as requests
+from vpr_alexa import metrics, webapp
+from vpr_alexa.metrics import Metrics, parse_series, series
+
+
+def test_series_round_trip():
+    key = series('vpr_alexa_request_seconds_count',
+                 {'intent': 'Play"Program', 'le': '0.1'})
+    assert parse_series(key) == ('vpr_alexa_request_seconds_count',
+                                 {'intent': 'Play\\"Program', 'le': '0.1'})
+
+
+def test_histogram_buckets_are_cumulative():
+    metrics = Metrics(buckets=(0.1, 1.0))
+    for seconds in (0.05, 0.5, 0.5, 3):
+        metrics.observe('vpr_alexa_request_seconds', seconds,
+                        {'intent': 'PlayProgram'})
+
+    text = metrics.render()
+    assert 'vpr_alexa_request_seconds_bucket{intent="PlayProgram",le="0.1"} 1' in text
+    assert 'vpr_alexa_request_seconds_bucket{intent="PlayProgram",le="1.0"} 3' in text
+    assert 'vpr_alexa_request_seconds_bucket{intent="PlayProgram",le="+Inf"} 4' in text
+    assert 'vpr_alexa_request_seconds_count{intent="PlayProgram"} 4' in text
+    assert 'vpr_alexa_request_seconds_sum{intent="PlayProgram"} 4.050000' in text
+
+
+def test_counts_add_up_across_workers():
+    """
+    Two registries sharing a backend stand in for two gunicorn workers.
+    """
+    backend = SimpleCache()
+    first, second = Metrics(backend), Metrics(backend)
+
+    first.inc('vpr_alexa_feed_cache_total', {'result': 'hit'}, 2)
+    second.inc('vpr_alexa_feed_cache_total', {'result': 'hit'}, 3)
+    second.inc('vpr_alexa_feed_cache_total', {'result': 'miss'})
+    second.flush()
+
+    assert first.collect() == {
+        'vpr_alexa_feed_cache_total{result="hit"}': 5,
+        'vpr_alexa_feed_cache_total{result="miss"}': 1}
+
+
+def test_flush_is_batched_when_backend_supports_it():
+    backend = SimpleCache()
+    backend.inc_many = Mock()
+    metrics = Metrics(backend)
+    metrics.inc('vpr_alexa_feed_cache_total', {'result': 'hit'})
+    metrics.inc('vpr_alexa_feed_cache_total', {'result': 'miss'}, 2)
+    metrics.flush()
+
+    backend.inc_many.assert_called_once_with({
+        'vpr_alexa:metrics:vpr_alexa_feed_cache_total{result="hit"}': 1,
+        'vpr_alexa:metrics:vpr_alexa_feed_cache_total{result="miss"}': 2})
+
+
+def test_metrics_endpoint():
+    client = app.test_client()
+    post(client, requests.launch())
+    post(client, requests.help())
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+
+    text = response.data.decode('utf-8')
+    assert '# TYPE vpr_alexa_request_seconds histogram' in text
+    assert 'vpr_alexa_request_seconds_count{intent="LaunchRequest"}' in text
+    assert 'vpr_alexa_request_seconds_count{intent="AMAZON.HelpIntent"}' in text
+    assert 'vpr_alexa_stream_cache_total{result=' in text
+
+
+def test_counts_stay_in_process_without_redis(monkeypatch):
+    monkeypatch.delenv('REDIS_URL', raising=False)
+    webapp.create_app()
+    assert metrics.registry.backend is None
+
+    registry = Metrics()
+    registry.inc('vpr_alexa_feed_cache_total', {'result': 'hit'}, value=3)
+    assert registry.collect() == {
+        'vpr_alexa_feed_cache_total{result="hit"}': 3}
@@ -0,0 +1,83 @@
+"""
+Tests against the AudioPlayer event fast path.
+"""
+from mock import patch
+from pytest import fixture, raises
+
+from flask_ask.verifier import VerificationError
+
+from tests.test_alexa import app, post
+import tests.requests as requests
+from vpr_alexa import webapp
+from vpr_alexa.playback import EventCounts
+
+EVENTS = ('PlaybackStarted', 'PlaybackStopped', 'PlaybackNearlyFinished',
+          'PlaybackFinished', 'PlaybackFailed')
+
+
+@fixture(name='client')
+def setup_client():
+    return app.test_client()
+
+
+def test_events_get_an_empty_response(client):
+    for event in EVENTS:
+        assert post(client, requests.audio_player_event(event)) == \
+            {'version': '1.0', 'response': {}}
+
+
+def test_events_skip_flask_ask(client):
+    with patch.object(webapp.ask, '_flask_view_func') as view:
+        post(client, requests.audio_player_event('PlaybackStopped', offset=5))
+    assert not view.called
+
+
+def test_intents_still_reach_flask_ask(client):
+    response = post(client, requests.help())
+    assert 'outputSpeech' in response['response']
+
+
+def test_events_are_verified(client):
+    app.config['ASK_VERIFY_REQUESTS'] = True
+    try:
+        with raises(VerificationError):
+            client.post('/ask', headers={
+                'Signaturecertchainurl': 'https://example.com/cert.pem',
+                'Signature': 'nope'},
+                data=requests.audio_player_event('PlaybackStarted'))
+    finally:
+        app.config['ASK_VERIFY_REQUESTS'] = False
+
+
+def test_handler_response(client):
+    handlers = dict(webapp.playback_events.handlers)
+    webapp.playback_events.handler('AudioPlayer.PlaybackNearlyFinished')(
+        lambda event, context: {'directives': [{'token': event['token']}]})
+    try:
+        response = post(client, requests.audio_player_event(
+            'PlaybackNearlyFinished', token='abc'))
+    finally:
+        webapp.playback_events.handlers = handlers
+    assert response['response'] == {'directives': [{'token': 'abc'}]}
+
+
+def test_counts_are_logged_in_batches():
+    counts = EventCounts(interval=60)
+    with patch('vpr_alexa.playback.logger') as logger:
+        for _ in range(3):
+            counts.add('AudioPlayer.PlaybackStarted', now=counts.since + 1)
+        counts.add('AudioPlayer.PlaybackStopped', now=counts.since + 2)
+        assert not logger.info.called
+
+        counts.add('AudioPlayer.PlaybackStopped', now=counts.since + 61)
+    logger.info.assert_called_once_with(
+        'AudioPlayer events in the last 61s: PlaybackStarted=3, '
+        'PlaybackStopped=2')
+    assert counts.flush() == {}
+
+
+def test_events_are_timed_by_type(client):
+    post(client, requests.audio_player_event('PlaybackFinished'))
+    text = client.get('/metrics').data.decode('utf-8')
+    assert 'vpr_alexa_request_seconds_count{intent="AudioPlayer.PlaybackFinished"}' in text
+    assert 'vpr_alexa_playback_events_total{event="AudioPlayer.PlaybackFinished"}' in text
@@ -0,0 +1,105 @@
+"""
+Tests against the write-behind playback position store and podcast resume.
+"""
+from mock import Mock, patch
+from pytest import fixture
+from werkzeug.contrib.cache import SimpleCache
+
+from tests.test_alexa import app, post
+import tests.requests as requests
+from vpr_alexa import webapp
+from vpr_alexa.positions import PlaybackPositions, token_for, url_from_token
+from vpr_alexa.programs import Program
+
+EPISODE = Program(name='Vermont Edition', title='Maple syrup',
+                  text='All about sugaring season.',
+                  url='https://cpa.ds.npr.org/vpr/audio/ve.mp3',
+                  small_img='https://www.vpr.net/ve.jpg',
+                  large_img='https://www.vpr.net/ve.jpg', is_podcast=True)
+
+
+@fixture(name='positions')
+def setup_positions():
+    backend = Mock(wraps=SimpleCache())
+    positions = PlaybackPositions(backend, flush_interval=3600)
+    with patch.object(webapp, 'playback_positions', positions):
+        yield positions
+
+
+def test_tokens_carry_the_episode_url():
+    token = token_for(EPISODE.url)
+    assert url_from_token(token) == EPISODE.url
+    assert token != token_for(EPISODE.url)
+    assert url_from_token('1f0e5c3a-live-stream') is None
+
+
+def test_writes_are_batched(positions):
+    for offset in (1000, 2000, 3000):
+        positions.record('alice', token_for(EPISODE.url), offset)
+        positions.record('bob', token_for(EPISODE.url), offset * 2)
+    positions.record('carol', 'live stream token', 500)
+    assert not positions.backend.method_calls
+
+    assert positions.flush() == 2
+    positions.backend.set_many.assert_called_once_with(
+        {'vpr_alexa:position:alice:' + EPISODE.url: 3000,
+         'vpr_alexa:position:bob:' + EPISODE.url: 6000},
+        timeout=positions.retention)
+    assert positions.offset('alice', EPISODE.url) == 3000
+    assert positions.offset('alice', 'https://other/episode.mp3') == 0
+
+
+def test_finished_episodes_start_over(positions):
+    positions.record('alice', token_for(EPISODE.url), 1000)
+    positions.flush()
+    positions.finish('alice', token_for(EPISODE.url))
+    assert positions.offset('alice', EPISODE.url) == 0
+
+    positions.flush()
+    positions.backend.delete_many.assert_called_once_with(
+        'vpr_alexa:position:alice:' + EPISODE.url)
+    assert positions.offset('alice', EPISODE.url) == 0
+
+
+def test_each_episode_keeps_its_own_position(positions):
+    other = 'https://cpa.ds.npr.org/vpr/audio/bls.mp3'
+    positions.record('alice', token_for(EPISODE.url), 1000)
+    positions.flush()
+    positions.record('alice', token_for(other), 5000)
+    assert positions.offset('alice', EPISODE.url) == 1000
+
+    positions.flush()
+    assert positions.offset('alice', EPISODE.url) == 1000
+    assert positions.offset('alice', other) == 5000
+
+
+def test_failed_flush_is_retried(positions):
+    positions.backend.set_many.side_effect = Exception('Redis is down')
+    positions.record('alice', token_for(EPISODE.url), 1000)
+    assert positions.flush() == 0
+
+    positions.backend.set_many.side_effect = None
+    assert positions.flush() == 1
+
+
+def play(client):
+    response = post(client, requests.play_program('vermont edition'))
+    return response['response']
+
+
+def test_podcast_resumes_at_saved_offset(positions):
+    client = app.test_client()
+    with patch('vpr_alexa.programs.get_program', return_value=EPISODE):
+        first = play(client)
+        stream = first['directives'][0]['audioItem']['stream']
+        assert stream['offsetInMilliseconds'] == 0
+
+        post(client, requests.audio_player_event(
+            'PlaybackStopped', token=stream['token'], offset=754000))
+        positions.flush()
+
+        resumed = play(client)
+    stream = resumed['directives'][0]['audioItem']['stream']
+    assert stream['offsetInMilliseconds'] == 754000
+    assert url_from_token(stream['token']) == EPISODE.url
+    assert resumed['outputSpeech']['text'].startswith('Picking up where')
@@ -0,0 +1,86 @@
+"""
+Tests against the background podcast refresher.
+"""
+import time
+from mock import patch
+from pytest import fixture
+
+from tests.fixtures import mock_vt_ed, mock_vted_program
+from vpr_alexa import programs
+from vpr_alexa.feeds import CachedFeed
+from vpr_alexa.refresher import FeedRefresher
+
+
+@fixture(autouse=True)
+def clear_episodes():
+    programs.latest_episodes.clear()
+    yield
+    programs.latest_episodes.clear()
+
+
+@patch('vpr_alexa.programs.feed_cache.refresh',
+       return_value=CachedFeed(mock_vt_ed))
+def test_refresh_precomputes_episode(refresh):
+    refresher = FeedRefresher(podcasts=['vermont-edition'], jitter=0)
+
+    assert refresher.refresh('vermont-edition', now=100)
+    assert refresher.next_due['vermont-edition'] == 100 + refresher.interval
+
+    with patch('vpr_alexa.programs._get_feed') as get_feed:
+        program = programs.get_program('vermont edition')
+        assert not get_feed.called
+    assert program.title == mock_vted_program.title
+    assert program.url == mock_vted_program.url
+
+
+@patch('vpr_alexa.programs.feed_cache.refresh', side_effect=IOError('down'))
+def test_failed_refresh_backs_off(refresh):
+    refresher = FeedRefresher(podcasts=['vpr-news'], jitter=0, retry_delay=10,
+                              max_backoff=35)
+
+    delays = []
+    for _ in range(4):
+        assert not refresher.refresh('vpr-news', now=0)
+        delays.append(refresher.next_due['vpr-news'])
+
+    assert delays == [10, 20, 35, 35]
+    assert 'vpr-news' not in programs.latest_episodes
+
+
+@patch('vpr_alexa.programs.feed_cache.refresh',
+       return_value=CachedFeed(mock_vt_ed))
+def test_refresh_due_only_polls_due_feeds(refresh):
+    refresher = FeedRefresher(podcasts=['vermont-edition', 'vpr-news'],
+                              jitter=0)
+    refresher.next_due['vpr-news'] = 1000
+
+    refresher.refresh_due(now=500)
+
+    refresh.assert_called_once_with(programs.PODCAST_URL + 'vermont-edition')
+
+
+@patch('vpr_alexa.programs.feed_cache.refresh',
+       return_value=CachedFeed(mock_vt_ed))
+def test_start_and_stop(refresh):
+    refresher = FeedRefresher(podcasts=['vermont-edition']).start()
+    assert refresher.is_running()
+
+    for _ in range(100):
+        if 'vermont-edition' in programs.latest_episodes:
+            break
+        time.sleep(0.01)
+    assert 'vermont-edition' in programs.latest_episodes
+
+    refresher.stop()
+    assert not refresher.is_running()
+
+
+@patch('vpr_alexa.refresher.atexit.register')
+@patch('vpr_alexa.programs.feed_cache.refresh',
+       return_value=CachedFeed(mock_vt_ed))
+def test_stop_registered_at_exit_once(refresh, register):
+    refresher = FeedRefresher(podcasts=['vermont-edition'])
+    for _ in range(3):
+        refresher.start()
+        refresher.stop()
+    register.assert_called_once_with(refresher.stop)
@@ -0,0 +1,162 @@
+"""
+Tests against request deadlines, feed circuit breakers and the last known good
+episode fallback.
+"""
+import time
+from mock import patch
+from pytest import fixture, raises
+from six.moves.urllib.error import URLError
+from werkzeug.contrib.cache import SimpleCache
+
+from tests.fixtures import mock_vt_ed, mock_vted_program
+from vpr_alexa import programs, resilience
+from vpr_alexa.episodes import LOCK_PREFIX, SharedEpisodeCache
+from vpr_alexa.feeds import FeedCache
+from vpr_alexa.resilience import CircuitBreaker, CircuitOpen, Deadline, \
+    DeadlineExceeded, FeedUnavailable
+
+URL = 'https://podcasts.vpr.net/vermont-edition'
+
+
+@fixture(autouse=True)
+def reset():
+    yield
+    resilience.end_request()
+    programs.last_good_episodes.clear()
+    programs.fallback_counts['vermont-edition'] = 0
+
+
+def test_deadline():
+    deadline = Deadline(budget=10, start=time.time() - 5)
+    assert 4 < deadline.remaining() <= 5
+    deadline.check()
+
+    with raises(DeadlineExceeded):
+        Deadline(budget=1, start=time.time() - 5).check()
+
+
+def test_breaker_opens_and_recovers():
+    breaker = CircuitBreaker(threshold=2, reset_timeout=60)
+    for _ in range(2):
+        breaker.failure()
+    assert breaker.state == resilience.OPEN
+    with raises(CircuitOpen):
+        breaker.before_call()
+
+    # once the reset timeout passes a single trial call is let through
+    breaker.opened_at -= 60
+    assert breaker.state == resilience.HALF_OPEN
+    breaker.before_call()
+    with raises(CircuitOpen):
+        breaker.before_call()
+
+    breaker.success()
+    assert breaker.state == resilience.CLOSED
+
+
+def test_failed_trial_reopens_breaker():
+    breaker = CircuitBreaker(threshold=1, reset_timeout=60)
+    breaker.failure()
+    breaker.opened_at -= 60
+    breaker.before_call()
+    breaker.failure()
+    assert breaker.state == resilience.OPEN
+
+
+@patch('vpr_alexa.feeds.feedparser.parse', side_effect=IOError('down'))
+def test_feed_cache_breaker_stops_calling_failing_feed(parse):
+    cache = FeedCache()
+    for _ in range(3):
+        with raises(FeedUnavailable):
+            cache.get(URL)
+    with raises(CircuitOpen):
+        cache.get(URL)
+
+    assert parse.call_count == 3
+    assert cache.breaker_states() == {URL: resilience.OPEN}
+
+
+@patch('vpr_alexa.feeds.feedparser.parse')
+def test_bozo_result_keeps_the_last_good_feed(parse):
+    # What feedparser returns when the network fails, rather than raising.
+    parse.return_value = {'bozo': 1, 'entries': [], 'feed': {}}
+    cache = FeedCache(default_ttl=0, stale_ttl=0)
+    with raises(FeedUnavailable):
+        cache.get(URL)
+    assert cache.peek(URL) is None
+    assert cache.breaker(URL).failures == 1
+
+    parse.return_value = dict(mock_vt_ed)
+    assert cache.get(URL)['feed']['title'] == 'Vermont Edition'
+
+    parse.return_value = {'bozo': 1, 'entries': [], 'feed': {}}
+    with raises(FeedUnavailable):
+        cache.refresh(URL)
+    assert cache.peek(URL)['feed']['title'] == 'Vermont Edition'
+    assert cache.breaker(URL).failures == 1
+
+
+@patch('vpr_alexa.feeds.feedparser.parse',
+       return_value={'bozo': 1, 'entries': [], 'feed': {}})
+def test_bozo_result_plays_last_known_good_episode(parse):
+    programs.last_good_episodes['vermont-edition'] = mock_vted_program
+    with patch.object(programs, 'feed_cache', FeedCache()), \
+            patch.dict(programs.latest_episodes, clear=True), \
+            patch.object(programs, 'shared_episodes', None):
+        assert programs.get_program('vermont edition') == mock_vted_program
+    assert programs.fallback_counts['vermont-edition'] == 1
+
+
+@patch('vpr_alexa.feeds.feedparser.parse')
+def test_feed_cache_respects_request_deadline(parse):
+    resilience.start_request(budget=0)
+    with raises(DeadlineExceeded):
+        FeedCache().get(URL)
+    assert not parse.called
+
+
+def test_shared_refresh_wait_stops_at_deadline():
+    """
+    Waiting on another worker's refresh gives up when the request runs out of
+    time, playing the last known good episode.
+    """
+    backend = SimpleCache()
+    shared = SharedEpisodeCache(backend, wait=5)
+    backend.add(LOCK_PREFIX + 'vermont-edition', 'someone-else')
+    programs.last_good_episodes['vermont-edition'] = mock_vted_program
+    resilience.start_request(budget=0.2)
+
+    start = time.time()
+    with patch.object(programs, 'shared_episodes', shared), \
+            patch.dict(programs.latest_episodes, clear=True), \
+            patch('vpr_alexa.programs._fetch_podcast_episode') as fetch:
+        assert programs.get_program('vermont edition') == mock_vted_program
+    assert time.time() - start < 1
+    assert not fetch.called
+    assert programs.fallback_counts['vermont-edition'] == 1
+
+
+@patch('vpr_alexa.feeds.rss.urlopen',
+       side_effect=URLError('podcasts.vpr.net is down'))
+def test_unreachable_feed_plays_last_known_good_episode(urlopen):
+    programs.last_good_episodes['vermont-edition'] = mock_vted_program
+    with patch.object(programs, 'feed_cache', FeedCache(streaming=True)), \
+            patch.dict(programs.latest_episodes, clear=True), \
+            patch.object(programs, 'shared_episodes', None):
+        assert programs.get_program('vermont edition') == mock_vted_program
+    assert urlopen.called
+    assert programs.fallback_counts['vermont-edition'] == 1
+
+
+@patch('vpr_alexa.programs._get_feed', side_effect=DeadlineExceeded('slow'))
+def test_last_known_good_episode_played(get_feed):
+    programs.last_good_episodes['vermont-edition'] = mock_vted_program
+
+    assert programs.get_program('vermont edition') == mock_vted_program
+    assert programs.fallback_counts['vermont-edition'] == 1
+
+
+@patch('vpr_alexa.programs._get_feed', side_effect=CircuitOpen('open'))
+def test_no_last_known_good_episode(get_feed):
+    with raises(CircuitOpen):
+        programs.get_program('vermont edition')
@@ -0,0 +1,36 @@
+"""
+Tests against the program name resolver, including the regression corpus of
+utterances in tests/fixtures/program_utterances.txt
+"""
+from vpr_alexa import programs
+from vpr_alexa.resolver import ProgramResolver, normalize
+import tests.requests as requests
+
+
+def test_regression_corpus():
+    for utterance, key in requests.program_utterances():
+        match = programs.resolver.resolve(utterance)
+        assert match.key == key, utterance
+
+
+def test_confidence_by_match_method():
+    exact = programs.resolver.resolve('Eye on the Sky')
+    keyword = programs.resolver.resolve('vermont edition')
+    fuzzy = programs.resolver.resolve('vermont addition')
+    default = programs.resolver.resolve('totally not a program')
+
+    assert (exact.method, keyword.method, fuzzy.method, default.method) == \
+        ('alias', 'keyword', 'fuzzy', 'default')
+    assert 1.0 == exact.confidence > keyword.confidence > fuzzy.confidence \
+        > default.confidence == 0.0
+    assert fuzzy.key == 'vermont-edition'
+
+
+def test_priority_breaks_keyword_ties():
+    resolver = ProgramResolver({'a': ['one'], 'b': ['two']}, ['b', 'a'], 'a')
+    assert resolver.resolve('one two').key == 'b'
+
+
+def test_normalize():
+    assert normalize("  Eye-on the   SKY! ") == 'eye on the sky'
+    assert normalize(None) == ''
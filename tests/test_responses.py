@@ -0,0 +1,66 @@
+"""
+Tests against the pre-serialized responses, which must match what flask-ask
+would have built on its own.
+"""
+import json
+from pytest import fixture
+
+from tests.test_alexa import app, post
+import tests.requests as requests
+from vpr_alexa import programs, webapp
+from vpr_alexa.responses import PreparedResponse, field
+
+
+@fixture(name='client')
+def setup_client():
+    return app.test_client()
+
+
+def without_prepared(send):
+    saved = dict(webapp.prepared_responses)
+    webapp.prepared_responses.clear()
+    try:
+        return send()
+    finally:
+        webapp.prepared_responses.update(saved)
+
+
+def test_prepared_response_render():
+    prepared = PreparedResponse({'directives': [{'token': field('token')}]})
+    rendered = json.loads(prepared.render(token='abc',
+                                          session_attributes={'x': 1}))
+
+    assert rendered == {'version': '1.0',
+                        'response': {'directives': [{'token': 'abc'}]},
+                        'sessionAttributes': {'x': 1}}
+
+
+def test_static_intents_match_flask_ask(client):
+    for request in (requests.launch, requests.list_programs, requests.help):
+        assert post(client, request()) == \
+            without_prepared(lambda: post(client, request()))
+
+
+def test_live_stream_matches_flask_ask(client):
+    for name in ('jazz', 'classical', 'replay', 'public radio'):
+        prepared = post(client, requests.play_program(name))
+        built = without_prepared(
+            lambda: post(client, requests.play_program(name)))
+
+        prepared_stream = prepared['response']['directives'][0]['audioItem']['stream']
+        built_stream = built['response']['directives'][0]['audioItem']['stream']
+        assert prepared_stream.pop('token') != built_stream.pop('token')
+        assert prepared == built
+
+
+def test_live_stream_tokens_are_unique(client):
+    tokens = set()
+    for _ in range(3):
+        response = post(client, requests.play_program('jazz'))
+        tokens.add(response['response']['directives'][0]['audioItem']['stream']['token'])
+    assert len(tokens) == 3
+
+
+def test_every_stream_is_prepared():
+    for program in programs.streams.values():
+        assert program in webapp.prepared_responses
@@ -0,0 +1,101 @@
+"""
+Tests against the early-exit streaming RSS parser.
+"""
+import io
+from mock import patch
+from pytest import raises
+
+from tests.fixtures import mock_vt_ed
+from vpr_alexa import programs, rss
+from vpr_alexa.feeds import FeedCache
+
+FEED = b"""<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0" xmlns:itunes="http://www.itunes.com/dtds/podcast-1.0.dtd">
+<channel>
+  <title>Vermont Edition</title>
+  <itunes:image href="https://static.feedpress.it/logo/vpr-vermont-edition.jpg"/>
+  <item>
+    <title>This is a pretend Vermont Edition</title>
+    <description>This episode is pretty good.</description>
+    <enclosure url="https://www.vpr.net/junk.jpg" type="junk"/>
+    <enclosure url="https://cpa.ds.npr.org/vpr/audio/2017/03/vted.mp3"
+               type="audio/mpeg" length="1234"/>
+  </item>
+  <item>
+    <title>An older Vermont Edition</title>
+    <description>This one is older.</description>
+    <enclosure url="https://cpa.ds.npr.org/vpr/audio/2017/02/vted.mp3"
+               type="audio/mpeg"/>
+  </item>
+"""
+
+
+def test_parse_matches_feedparser_shape():
+    feed = rss.parse(FEED + b'</channel></rss>')
+
+    program = programs._episode_from_feed(feed)
+    assert program.name == 'Vermont Edition'
+    assert program.title == 'This is a pretend Vermont Edition'
+    assert program.text == 'This episode is pretty good.'
+    assert program.url == 'https://cpa.ds.npr.org/vpr/audio/2017/03/vted.mp3'
+    assert program.small_img == \
+        'https://static.feedpress.it/logo/vpr-vermont-edition.jpg'
+    assert len(feed['entries']) == 1
+
+
+def test_parse_stops_after_first_item():
+    """
+    Anything after the first item is never read, even if it's broken.
+    """
+    feed = rss.parse(io.BytesIO(FEED + b'<item><title>broken' + b' ' * 100000))
+    assert feed['entries'][0]['title'] == 'This is a pretend Vermont Edition'
+
+
+def test_parse_all_items():
+    feed = rss.parse(FEED + b'</channel></rss>', max_items=None)
+    assert [e['title'] for e in feed['entries']] == \
+        ['This is a pretend Vermont Edition', 'An older Vermont Edition']
+
+
+def test_parse_rejects_non_rss():
+    with raises(rss.RSSParseError):
+        rss.parse(b'<html><body>Service Unavailable</body></html>')
+    with raises(rss.RSSParseError):
+        rss.parse(b'not xml at all')
+
+
+class FakeResponse(io.BytesIO):
+    headers = {'ETag': '"abc"'}
+
+    def getcode(self):
+        return 200
+
+
+@patch('vpr_alexa.rss.urlopen')
+def test_fetch_attaches_document_when_parsing_fails(urlopen):
+    document = b'<html><body>' + b' ' * 100000 + b'</body></html>'
+    urlopen.return_value = FakeResponse(document)
+
+    with raises(rss.RSSParseError) as error:
+        rss.fetch('https://podcasts.vpr.net/vpr-news')
+    assert error.value.response == {'document': document, 'status': 200,
+                                    'etag': '"abc"', 'modified': None}
+
+
+@patch('vpr_alexa.feeds.feedparser.parse', return_value=dict(mock_vt_ed))
+@patch('vpr_alexa.feeds.rss.fetch')
+def test_cache_falls_back_to_full_parse(fetch, parse):
+    """
+    The full parse reads the document that was already downloaded.
+    """
+    error = rss.RSSParseError('bad')
+    error.response = {'document': b'<rss/>', 'status': 200, 'etag': '"abc"',
+                      'modified': None}
+    fetch.side_effect = error
+    cache = FeedCache(streaming=True)
+    cache.get('https://podcasts.vpr.net/vpr-news')
+
+    assert fetch.called
+    parse.assert_called_once_with(b'<rss/>')
+    assert cache.validators('https://podcasts.vpr.net/vpr-news') == \
+        {'etag': '"abc"', 'modified': None}
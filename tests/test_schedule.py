@@ -0,0 +1,157 @@
+"""
+Tests against learned publish schedules and schedule-aware feed polling.
+"""
+import calendar
+import json
+
+from mock import patch
+from pytest import fixture
+
+from tests.test_alexa import app
+from vpr_alexa import programs, refresher
+from vpr_alexa.refresher import FeedRefresher
+from vpr_alexa.search import EpisodeSearch
+from vpr_alexa.schedule import HOUR, DAY, PublishSchedule, slot_of
+
+# Monday, March 13 2017 00:00 UTC
+MONDAY = calendar.timegm((2017, 3, 13, 0, 0, 0))
+
+
+def weekdays_at(hour, weeks=4, minute=5):
+    """ Publish times of a show going out every weekday at hour:minute UTC. """
+    return [MONDAY + week * 7 * DAY + day * DAY + hour * HOUR + minute * 60
+            for week in range(weeks) for day in range(5)]
+
+
+def test_slot_of():
+    assert slot_of(MONDAY) == 0
+    assert slot_of(MONDAY + 16 * HOUR + 59 * 60) == 16
+    assert slot_of(MONDAY + 6 * DAY + 23 * HOUR) == 167
+
+
+def test_learns_weekday_windows():
+    schedule = PublishSchedule(weekdays_at(16) + [0])
+    assert schedule.episodes == 20
+    assert schedule.windows == frozenset(day * 24 + 16 for day in range(5))
+    assert schedule.describe()['windows'][0] == 'Mon 16:00 UTC'
+    assert schedule.describe()['mean_gap_hours'] == 31.6
+
+
+def test_irregular_feed_has_no_windows():
+    published = [MONDAY + n * 11 * DAY + n * 7 * HOUR for n in range(6)]
+    schedule = PublishSchedule(published)
+    assert schedule.windows == frozenset()
+    assert schedule.next_window(MONDAY) is None
+    assert PublishSchedule([]).describe()['episodes'] == 0
+
+
+def test_old_episodes_are_forgotten():
+    old = weekdays_at(9)
+    new = [t + 20 * 7 * DAY for t in weekdays_at(16)]
+    assert PublishSchedule(old + new).windows == \
+        frozenset(day * 24 + 16 for day in range(5))
+
+
+def test_expecting_an_episode():
+    schedule = PublishSchedule(weekdays_at(16))
+    week = MONDAY + 4 * 7 * DAY
+    assert not schedule.expecting(week + 15 * HOUR)
+    assert schedule.expecting(week + 15 * HOUR + 55 * 60)
+    assert schedule.expecting(week + 16 * HOUR + 30 * 60)
+    assert not schedule.expecting(week + 17 * HOUR)
+
+    # Published today, nothing more expected until tomorrow.
+    published = PublishSchedule(weekdays_at(16) + [week + 16 * HOUR + 3 * 60])
+    assert not published.expecting(week + 16 * HOUR + 30 * 60)
+
+
+def test_poll_delay():
+    schedule = PublishSchedule(weekdays_at(16))
+    week = MONDAY + 4 * 7 * DAY
+
+    def delay(now, quiet_polls=0):
+        return schedule.poll_delay(now, interval=300, min_interval=60,
+                                   max_interval=3600, quiet_polls=quiet_polls)
+
+    assert delay(week + 16 * HOUR + 10 * 60) == 60
+    assert delay(week + 9 * HOUR) == 300
+    assert delay(week + 9 * HOUR, quiet_polls=2) == 1200
+    assert delay(week + 9 * HOUR, quiet_polls=10) == 3600
+    # Never sleeps past the start of the next window.
+    assert delay(week + 15 * HOUR + 20 * 60, quiet_polls=10) == 30 * 60
+    # Saturday: quiet until Monday.
+    assert delay(week + 5 * DAY + 12 * HOUR, quiet_polls=10) == 3600
+
+
+@fixture(name='vermont_edition')
+def learned_schedule():
+    programs.publish_schedules['vermont-edition'] = \
+        PublishSchedule(weekdays_at(16))
+    yield
+    programs.publish_schedules.pop('vermont-edition', None)
+
+
+def episode(url):
+    return programs.Program(name='Vermont Edition', title='', text='', url=url,
+                            small_img=None, large_img=None, is_podcast=True)
+
+
+def test_refresher_follows_schedule(vermont_edition):
+    poller = FeedRefresher(podcasts=['vermont-edition'], jitter=0, interval=300,
+                           min_interval=60, max_interval=3600)
+    morning = MONDAY + 4 * 7 * DAY + 9 * HOUR
+    with patch.object(programs, 'refresh_podcast_episode',
+                      return_value=episode('https://example.org/1.mp3')):
+        for n in range(4):
+            assert poller.refresh('vermont-edition', now=morning)
+        programs.refresh_podcast_episode.assert_called_with('vermont-edition',
+                                                            force=False)
+    assert poller.quiet_polls['vermont-edition'] == 3
+    assert poller.next_due['vermont-edition'] == morning + 2400
+
+    noon = morning + 7 * HOUR
+    with patch.object(programs, 'refresh_podcast_episode',
+                      return_value=episode('https://example.org/1.mp3')) \
+            as refresh:
+        poller.refresh('vermont-edition', now=noon)
+    assert poller.next_due['vermont-edition'] == noon + 60
+    refresh.assert_called_once_with('vermont-edition', force=True)
+
+    with patch.object(programs, 'refresh_podcast_episode',
+                      return_value=episode('https://example.org/2.mp3')):
+        poller.refresh('vermont-edition', now=noon + 60)
+    assert poller.quiet_polls['vermont-edition'] == 0
+
+    status = poller.status(now=noon + 60)['vermont-edition']
+    assert status['expecting_episode']
+    assert status['next_poll'] == noon + 120
+    assert status['schedule']['episodes'] == 20
+
+
+def test_feeds_endpoint(vermont_edition):
+    poller = FeedRefresher(podcasts=['vermont-edition'])
+    with patch.object(refresher, 'current', poller):
+        response = app.test_client().get('/feeds')
+    feeds = json.loads(response.data.decode('utf-8'))
+    assert not feeds['running']
+    assert len(feeds['feeds']['vermont-edition']['schedule']['windows']) == 5
+
+    with patch.object(refresher, 'current', None):
+        response = app.test_client().get('/feeds')
+    feeds = json.loads(response.data.decode('utf-8'))
+    assert 'vermont-edition' in feeds['feeds']
+
+
+def test_refresh_learns_schedule():
+    entries = [{'title': 'Episode', 'published': 'Mon, 13 Mar 2017 16:05:00 +0000',
+                'links': [{'type': 'audio/mpeg',
+                           'href': 'https://example.org/%d.mp3' % n}]}
+               for n in range(3)]
+    with patch.dict(programs.publish_schedules, clear=True), \
+            patch.dict(programs.episode_indexes), \
+            patch.object(programs, 'episode_search', EpisodeSearch()):
+        programs._index_feed(programs.PODCAST_URL + 'brave-little-state',
+                             {'feed': {'title': 'Brave Little State'},
+                              'entries': entries})
+        schedule = programs.publish_schedules['brave-little-state']
+    assert schedule.windows == frozenset([16])
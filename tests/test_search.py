@@ -0,0 +1,139 @@
+"""
+Tests against the episode search index and the SearchEpisodes intent.
+"""
+from mock import patch
+from pytest import fixture
+
+from tests.test_alexa import app, post
+import tests.requests as requests
+from vpr_alexa import programs
+from vpr_alexa.positions import url_from_token
+from vpr_alexa.search import EpisodeSearch, terms
+
+
+def entry(n, title, summary='', published='Tue, 14 Mar 2017 12:00:00 -0400'):
+    return {'title': title, 'summary': summary, 'published': published,
+            'links': [{'type': 'audio/mpeg',
+                       'href': 'https://cpa.ds.npr.org/vpr/audio/%d.mp3' % n}]}
+
+
+def feed(title, *entries):
+    return {'feed': {'title': title,
+                     'image': {'href': 'https://static.feedpress.it/logo.jpg'}},
+            'entries': list(entries)}
+
+
+VERMONT_EDITION = feed(
+    'Vermont Edition',
+    entry(3, 'Sugaring Season', 'Maple syrup producers on a warm spring.'),
+    entry(2, 'Town Meeting Day', 'Results from town meetings across the state.'),
+    entry(1, 'Lake Champlain', 'Water quality in the lake.'))
+
+EYE_ON_THE_SKY = feed(
+    'Eye on the Sky',
+    entry(10, 'Spring Forecast', 'A warm week, good for maple sap runs.'))
+
+
+def test_terms():
+    assert terms('Find the episodes about Maple Syrup!') == ['maple', 'syrup']
+    assert terms('news') == ['new']
+    assert terms('grass') == ['grass']
+
+
+def test_ranks_title_matches_first():
+    index = EpisodeSearch()
+    index.add('vermont-edition', VERMONT_EDITION)
+    index.add('eye-on-the-sky', EYE_ON_THE_SKY)
+
+    results = index.search('maple syrup')
+    assert [result.document.title for result in results] == \
+        ['Sugaring Season', 'Spring Forecast']
+    assert results[0].score > results[1].score
+    assert index.search('town meeting')[0].document.podcast == 'vermont-edition'
+    assert index.search('the weather on mars') == []
+
+
+def test_add_is_incremental():
+    index = EpisodeSearch()
+    assert index.add('vermont-edition', VERMONT_EDITION) == 3
+    assert index.add('vermont-edition', VERMONT_EDITION) == 0
+
+    updated = feed('Vermont Edition', entry(4, 'Mud Season', 'Dirt roads.'),
+                   *VERMONT_EDITION['entries'])
+    assert index.add('vermont-edition', updated) == 1
+    assert len(index) == 4
+    assert index.search('mud')[0].document.title == 'Mud Season'
+
+
+def test_evicts_oldest_episodes():
+    index = EpisodeSearch(max_documents=2)
+    index.add('vermont-edition', VERMONT_EDITION)
+    assert len(index) == 2
+    assert index.search('lake') == []
+    assert 'champlain' not in index.postings
+
+    index.add('eye-on-the-sky', EYE_ON_THE_SKY)
+    assert len(index) == 3
+
+
+def test_postings_budget_scores_rarest_terms_first():
+    index = EpisodeSearch(max_postings=1)
+    index.add('vermont-edition', VERMONT_EDITION)
+    index.add('eye-on-the-sky', EYE_ON_THE_SKY)
+
+    # "warm" is in two episodes, "syrup" in one: only "syrup" is scored.
+    results = index.search('warm syrup')
+    assert [result.document.title for result in results] == ['Sugaring Season']
+
+
+@fixture(name='client')
+def setup_client():
+    search = EpisodeSearch()
+    search.add('vermont-edition', VERMONT_EDITION)
+    search.add('eye-on-the-sky', feed(
+        'Eye on the Sky',
+        dict(entry(10, 'Spring Forecast', 'Maple sap runs.'),
+             links=[{'type': 'audio/mpeg',
+                     'href': 'http://cpa.ds.npr.org/vpr/audio/10.mp3'}])))
+    with patch.object(programs, 'episode_search', search):
+        yield app.test_client()
+
+
+def test_search_intent(client):
+    response = post(client, requests.search_episodes('town meetings'))
+    stream = response['response']['directives'][0]['audioItem']['stream']
+    assert stream['url'] == 'https://cpa.ds.npr.org/vpr/audio/2.mp3'
+    assert url_from_token(stream['token']) == stream['url']
+    assert response['response']['outputSpeech']['text'] == \
+        'Playing Vermont Edition titled Town Meeting Day'
+
+
+def test_search_intent_secures_eye_on_the_sky(client):
+    response = post(client, requests.search_episodes('sap'))
+    stream = response['response']['directives'][0]['audioItem']['stream']
+    assert stream['url'] == 'https://cpa.ds.npr.org/vpr/audio/10.mp3'
+
+
+def test_search_intent_without_results(client):
+    response = post(client, requests.search_episodes('curling'))
+    assert response['response']['outputSpeech']['text'] == \
+        "Sorry, I couldn't find an episode about curling."
+
+
+def test_search_intent_without_topic(client):
+    with patch.object(programs, 'find_episode') as find_episode:
+        response = post(client, requests.search_episodes(''))
+    assert not find_episode.called
+    assert response['response']['outputSpeech']['text'] == \
+        'What topic would you like to hear about?'
+    assert response['response']['reprompt']['outputSpeech']['text'] == \
+        'What topic would you like to hear about?'
+    assert not response['response']['shouldEndSession']
+
+
+def test_refresh_adds_to_search():
+    search = EpisodeSearch()
+    with patch.object(programs, 'episode_search', search):
+        programs._index_feed(programs.PODCAST_URL + 'vermont-edition',
+                             VERMONT_EDITION)
+    assert search.search('champlain')[0].document.podcast == 'vermont-edition'
@@ -0,0 +1,64 @@
+"""
+Tests against the precompiled speech templates.
+"""
+import os
+from flask import render_template
+
+from tests.test_alexa import app
+from vpr_alexa import programs
+from vpr_alexa.speech import SpeechTemplates, inline_includes
+from vpr_alexa.webapp import templates
+
+PARAMS = {'play_podcast': {'name': 'Vermont Edition', 'title': 'Maple syrup'},
+          'play_livestream': {'name': 'VPR Jazz'},
+          'briefing': {'episodes': (programs.jazz, programs.radio)}}
+
+
+def test_matches_flask_ask_rendering():
+    with app.app_context():
+        for name in templates.compiled:
+            params = PARAMS.get(name, {})
+            assert templates.render(name, **params) == \
+                render_template(name, **params)
+
+
+def test_includes_are_inlined():
+    sources = {'a': "A {% include 'b' %}", 'b': "B {%- include 'c' -%}",
+               'c': 'C'}
+    assert inline_includes('a', sources) == 'A B C'
+
+
+def test_static_templates_are_memoized():
+    speech = SpeechTemplates(templates.path)
+    first = speech.render('welcome')
+    assert speech.render('welcome') is first
+
+
+def test_warm_renders_static_templates():
+    speech = SpeechTemplates(templates.path)
+    assert speech.parameters['play_livestream'] == frozenset(['name'])
+    assert speech.warm() == len(speech._static)
+    assert 'welcome' in speech._static
+    assert 'play_livestream' not in speech._static
+
+
+def test_parameterized_cache_is_bounded(tmpdir):
+    path = tmpdir.join('templates.yaml')
+    path.write("hello: Hello {{ name }}\n")
+    speech = SpeechTemplates(str(path), max_cached=2)
+
+    for name in ('a', 'b', 'a', 'c'):
+        assert speech.render('hello', name=name) == 'Hello ' + name
+    assert [key[1] for key in speech._rendered] == [(('name', 'a'),),
+                                                    (('name', 'c'),)]
+
+
+def test_auto_reload(tmpdir):
+    path = tmpdir.join('templates.yaml')
+    path.write("hello: Hello\n")
+    speech = SpeechTemplates(str(path), auto_reload=True)
+    assert speech.render('hello') == 'Hello'
+
+    path.write("hello: Howdy\n")
+    os.utime(str(path), (speech.mtime + 10, speech.mtime + 10))
+    assert speech.render('hello') == 'Howdy'
@@ -0,0 +1,147 @@
+"""
+Tests against worker warm-up, the gunicorn hooks and lazy imports.
+"""
+import json
+import os
+import subprocess
+import sys
+
+from mock import MagicMock, patch
+from pytest import fixture
+
+from tests.test_alexa import post
+from tests.test_briefing import PODCASTS, FakeFeeds
+import tests.requests as requests
+from vpr_alexa import startup, webapp
+from vpr_alexa.backends import RedisBackend
+from vpr_alexa.briefing import Briefing
+from vpr_alexa.feeds import FeedCache
+from vpr_alexa.lazy import LazyModule
+
+
+@fixture(name='times')
+def fresh_times():
+    times = startup.StartupTimes()
+    with patch.object(startup, 'times', times):
+        yield times
+
+
+def test_warm_up_primes_every_podcast():
+    briefing = Briefing(PODCASTS, latest=FakeFeeds())
+    with patch.object(webapp, 'briefing', briefing):
+        steps = startup.warm_up(budget=2)
+    assert list(steps) == ['speech', 'cache_backend', 'feeds']
+    assert len(briefing.cached()) == 4
+    assert 'welcome' in webapp.templates._static
+
+
+def test_failed_warm_up_steps_carry_on():
+    briefing = Briefing(PODCASTS, latest=FakeFeeds())
+    with patch.object(webapp, 'briefing', briefing), \
+            patch.object(webapp.cache, 'get', side_effect=IOError('down')):
+        steps = startup.warm_up(budget=2)
+    assert 'cache_backend' in steps
+    assert len(briefing.cached()) == 4
+
+
+def test_boot_starts_the_worker(times):
+    app = webapp.create_app()
+    with patch.object(startup, 'warm_up', return_value={}), \
+            patch.object(startup, 'start_refresher') as start_refresher, \
+            patch.object(startup, 'after_fork') as after_fork:
+        startup.boot(app)
+    start_refresher.assert_called_once_with(app.config['FEED_REFRESH_INTERVAL'])
+    assert not after_fork.called
+    assert list(times.events) == ['import', 'app_created', 'warmed_up',
+                                  'worker_started']
+
+
+def test_preloaded_app_waits_for_the_fork(times):
+    app = webapp.create_app()
+    with patch.object(startup, 'preloading', True), \
+            patch.object(startup, 'warm_up', return_value={}), \
+            patch.object(startup, 'start_refresher') as start_refresher, \
+            patch.object(startup, 'after_fork') as after_fork:
+        startup.boot(app)
+        assert not start_refresher.called
+
+        startup.start_worker(app)
+    assert after_fork.called
+    assert start_refresher.called
+
+
+def test_first_request_is_reported(times):
+    app = webapp.create_app()
+    app.config['ASK_VERIFY_REQUESTS'] = False
+    with patch.object(startup, 'warm_up', return_value={}), \
+            patch.object(startup, 'start_refresher'):
+        startup.boot(app)
+
+    with patch.object(startup.metrics.registry, 'observe') as observe:
+        app.test_client().get('/metrics')
+        assert 'first_request' not in times.events
+        post(app.test_client(), requests.launch())
+        post(app.test_client(), requests.launch())
+    phases = [call[0][2]['phase'] for call in observe.call_args_list
+              if call[0][0] == 'vpr_alexa_startup_seconds']
+    assert phases == ['import', 'warm_up', 'worker', 'first_request']
+    assert list(times.describe())[-1] == 'first_request'
+
+
+def test_feed_cache_after_fork():
+    cache = FeedCache()
+    cache.update('https://example.org/feed', {'feed': {'title': 'Feed'}})
+    cache._feeds['https://example.org/feed'].refreshing = True
+    cache.after_fork()
+    assert not cache._feeds['https://example.org/feed'].refreshing
+
+
+def test_redis_backend_after_fork():
+    client = MagicMock()
+    backend = RedisBackend(client)
+    backend.after_fork()
+    client.connection_pool.reset.assert_called_once_with()
+
+
+def test_gunicorn_post_fork():
+    with patch.dict(os.environ, {'GUNICORN_PRELOAD': 'true'}):
+        from vpr_alexa import gunicorn_conf
+        assert gunicorn_conf.preload_app
+        assert os.environ['VPR_ALEXA_PRELOADED'] == 'true'
+
+    server, worker = MagicMock(), MagicMock()
+    with patch.object(startup, 'start_worker') as start_worker:
+        gunicorn_conf.post_fork(server, worker)
+    start_worker.assert_called_once_with(worker.app.wsgi.return_value)
+
+    server.cfg.preload_app = False
+    with patch.object(startup, 'start_worker') as start_worker:
+        gunicorn_conf.post_fork(server, worker)
+    assert not start_worker.called
+
+
+def test_lazy_module():
+    module = LazyModule('json')
+    assert not module.loaded
+    assert module.dumps([1]) == '[1]'
+    assert module.loaded
+
+
+FIRST_LAUNCH = """
+import json, sys
+from vpr_alexa.wsgi import application
+import tests.requests as requests
+response = application.test_client().post('/ask', data=requests.launch().read())
+print(json.dumps([response.status_code] +
+                 [name for name in ('feedparser', 'redis') if name in sys.modules]))
+"""
+
+
+def test_first_launch_leaves_optional_dependencies_unloaded():
+    env = dict(os.environ, FLASK_SECRET_KEY='asdf', WARM_UP_BUDGET='0',
+               FEED_REFRESH_INTERVAL='0', DISABLE_ASK_VERIFY_REQUESTS='true')
+    env.pop('REDIS_URL', None)
+    output = subprocess.check_output(
+        [sys.executable, '-c', FIRST_LAUNCH], env=env,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert json.loads(output.decode('utf-8').strip().splitlines()[-1]) == [200]
@@ -0,0 +1,194 @@
+"""
+Tests against request signature verification, with certificates issued by a
+local CA and served by a fake certificate host.
+"""
+import base64
+from datetime import datetime, timedelta
+
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from cryptography.x509.oid import NameOID
+from flask_ask.verifier import VerificationError
+from mock import patch
+from OpenSSL import crypto
+from pytest import fixture, raises
+
+from tests.test_alexa import app
+import tests.requests as requests
+from vpr_alexa import webapp
+from vpr_alexa.verification import RequestVerifier
+
+CERT_URL = 'https://s3.amazonaws.com/echo.api/echo-api-cert.pem'
+NOW = datetime.utcnow()
+
+
+def make_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048,
+                                    backend=default_backend())
+
+
+def make_cert(name, key, issuer=None, issuer_key=None, ca=False,
+              dns_name=None, not_before=NOW - timedelta(days=1),
+              not_after=NOW + timedelta(days=30)):
+    subject = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, name)])
+    builder = x509.CertificateBuilder() \
+        .subject_name(subject) \
+        .issuer_name(issuer.subject if issuer is not None else subject) \
+        .public_key(key.public_key()) \
+        .serial_number(x509.random_serial_number()) \
+        .not_valid_before(not_before) \
+        .not_valid_after(not_after) \
+        .add_extension(x509.BasicConstraints(ca=ca, path_length=None),
+                       critical=True)
+    if dns_name:
+        builder = builder.add_extension(
+            x509.SubjectAlternativeName([x509.DNSName(dns_name)]),
+            critical=False)
+    return builder.sign(issuer_key or key, hashes.SHA256(), default_backend())
+
+
+def pem(*certs):
+    return b''.join(cert.public_bytes(serialization.Encoding.PEM)
+                    for cert in certs)
+
+
+class CA(object):
+    """ A local root CA with an intermediate, like Amazon's chain. """
+
+    def __init__(self):
+        self.root_key = make_key()
+        self.root = make_cert(u'Test Root CA', self.root_key, ca=True)
+        self.intermediate_key = make_key()
+        self.intermediate = make_cert(u'Test Intermediate CA',
+                                      self.intermediate_key, issuer=self.root,
+                                      issuer_key=self.root_key, ca=True)
+
+    def trust_store(self):
+        store = crypto.X509Store()
+        store.add_cert(crypto.X509.from_cryptography(self.root))
+        return store
+
+    def issue(self, key, dns_name=u'echo-api.amazon.com', **kwargs):
+        """ :return: PEM chain of a signing certificate for key """
+        leaf = make_cert(u'echo-api.amazon.com', key, issuer=self.intermediate,
+                         issuer_key=self.intermediate_key, dns_name=dns_name,
+                         **kwargs)
+        return pem(leaf, self.intermediate)
+
+
+class FakeCertHost(object):
+    """ Serves PEM chains by URL and counts downloads. """
+
+    def __init__(self, chains):
+        self.chains = chains
+        self.requests = []
+
+    def __call__(self, url):
+        self.requests.append(url)
+        return self.chains[url]
+
+
+def sign(key, body, algorithm=None):
+    return base64.b64encode(key.sign(body, padding.PKCS1v15(),
+                                     algorithm or hashes.SHA1()))
+
+
+@fixture(scope='module', name='ca')
+def setup_ca():
+    return CA()
+
+
+@fixture(scope='module', name='signing_key')
+def setup_signing_key():
+    return make_key()
+
+
+def verifier_for(ca, chain):
+    host = FakeCertHost({CERT_URL: chain})
+    return RequestVerifier(trust_store=ca.trust_store(), fetch=host), host
+
+
+def test_certificate_is_downloaded_once(ca, signing_key):
+    verifier, host = verifier_for(ca, ca.issue(signing_key))
+    for body in (b'first', b'second', b'third'):
+        verifier.verify(CERT_URL, sign(signing_key, body), body)
+    assert host.requests == [CERT_URL]
+
+
+def test_bad_signature(ca, signing_key):
+    verifier, _ = verifier_for(ca, ca.issue(signing_key))
+    with raises(VerificationError):
+        verifier.verify(CERT_URL, sign(signing_key, b'signed'), b'tampered')
+    with raises(VerificationError):
+        verifier.verify(CERT_URL, sign(make_key(), b'signed'), b'signed')
+
+
+def test_sha256_signature(ca, signing_key):
+    verifier, _ = verifier_for(ca, ca.issue(signing_key))
+    verifier.verify(CERT_URL, sign(signing_key, b'body', hashes.SHA256()),
+                    b'body', hashes.SHA256())
+
+
+def test_expired_certificate_is_downloaded_again(ca, signing_key):
+    verifier, host = verifier_for(ca, ca.issue(signing_key))
+    cert = verifier.certificate(CERT_URL)
+    cert.not_after = datetime.utcnow() - timedelta(seconds=1)
+    assert verifier.certificate(CERT_URL) is not cert
+    assert len(host.requests) == 2
+
+
+def test_expired_chain_is_rejected(ca, signing_key):
+    verifier, _ = verifier_for(ca, ca.issue(
+        signing_key, not_before=NOW - timedelta(days=30),
+        not_after=NOW - timedelta(days=1)))
+    with raises(VerificationError):
+        verifier.certificate(CERT_URL)
+
+
+def test_untrusted_chain_is_rejected(ca, signing_key):
+    verifier, _ = verifier_for(CA(), ca.issue(signing_key))
+    with raises(VerificationError):
+        verifier.certificate(CERT_URL)
+    assert verifier.certificates == {}
+
+
+def test_wrong_name_is_rejected(ca, signing_key):
+    verifier, _ = verifier_for(ca, ca.issue(signing_key,
+                                            dns_name=u'example.com'))
+    with raises(VerificationError):
+        verifier.certificate(CERT_URL)
+
+
+def test_certificate_url_is_checked_before_download(ca, signing_key):
+    verifier, host = verifier_for(ca, ca.issue(signing_key))
+    for url in ('http://s3.amazonaws.com/echo.api/echo-api-cert.pem',
+                'https://example.com/echo.api/echo-api-cert.pem',
+                'https://s3.amazonaws.com/echo.api/../cert.pem'):
+        with raises(VerificationError):
+            verifier.certificate(url)
+    assert host.requests == []
+
+
+def test_signed_request(ca, signing_key):
+    verifier, host = verifier_for(ca, ca.issue(signing_key))
+    body = requests.launch().read().encode('utf-8')
+    client = app.test_client()
+
+    app.config['ASK_VERIFY_REQUESTS'] = True
+    try:
+        with patch.object(webapp.ask, 'verifier', verifier), \
+                patch('flask_ask.verifier.verify_timestamp'):
+            for _ in range(2):
+                response = client.post('/ask', data=body, headers={
+                    'SignatureCertChainUrl': CERT_URL,
+                    'Signature': sign(signing_key, body)})
+                assert response.status_code == 200
+            with raises(VerificationError):
+                client.post('/ask', data=body, headers={
+                    'SignatureCertChainUrl': CERT_URL,
+                    'Signature': sign(make_key(), body)})
+    finally:
+        app.config['ASK_VERIFY_REQUESTS'] = False
+    assert host.requests == [CERT_URL]
@@ -0,0 +1,387 @@
+"""
+ASGI Entry Point
+
+    uvicorn vpr_alexa.asgi:application
+
+`vpr_alexa.wsgi` ties up a whole worker for as long as a request waits on
+https://podcasts.vpr.net. This entry point serves the same application from an
+event loop instead:
+
+1. The podcast feeds an /ask request is going to read are worked out from its
+   intent (see `feeds_for`).
+2. Any of them that isn't fresh in `programs.feed_cache` is fetched with a
+   non-blocking HTTP client and parsed as it arrives. Requests waiting on the
+   same feed share one fetch.
+3. The Flask app, with the same flask-ask intent handlers, then runs on a
+   thread pool. Its feeds are already in memory by then, so a thread is only
+   held for as long as building the response takes.
+
+Python 3.6+ only.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import io
+import os
+import ssl
+import sys
+import time
+from urllib.parse import urljoin, urlsplit
+
+from flask import json
+
+from vpr_alexa import logger, programs, resilience, rss
+from vpr_alexa.feeds import check_result
+from vpr_alexa.metrics import registry as metrics
+from vpr_alexa.refresher import start_refresher
+from vpr_alexa.webapp import ASK_ROUTE, REQUEST_STARTED, briefing, create_app
+
+FETCH_TIMEOUT = 10
+MAX_REDIRECTS = 3
+CHUNK_SIZE = 16 * 1024
+DEFAULT_THREADS = 32
+
+# Intents naming a program in their ProgramName slot.
+PROGRAM_INTENTS = frozenset(['PlayProgram', 'SelectProgram'])
+
+
+class FetchError(IOError):
+    """ A feed couldn't be fetched. """
+
+
+async def fetch_feed(url, etag=None, modified=None, max_items=1,
+                     timeout=FETCH_TIMEOUT):
+    """
+    Non-blocking counterpart of rss.fetch.
+    :param url: url to RSS feed
+    :param etag: ETag from a previous fetch
+    :param modified: Last-Modified from a previous fetch
+    :param max_items: number of items to read, None reads them all
+    :param timeout: seconds the whole fetch may take
+    :return: new dict shaped like Feedparser's results, including 'status',
+    'etag' and 'modified'. A 304 response has no 'feed' or 'entries'.
+    """
+    async def follow(url):
+        for _ in range(MAX_REDIRECTS + 1):
+            result = await _get(url, etag, modified, max_items)
+            if 'location' not in result:
+                return result
+            url = urljoin(url, result['location'])
+        raise FetchError('Too many redirects fetching %s' % url)
+
+    return await asyncio.wait_for(follow(url), timeout)
+
+
+async def _get(url, etag, modified, max_items):
+    parts = urlsplit(url)
+    secure = parts.scheme == 'https'
+    reader, writer = await asyncio.open_connection(
+        parts.hostname, parts.port or (443 if secure else 80),
+        ssl=ssl.create_default_context() if secure else None)
+    try:
+        path = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+        lines = ['GET %s HTTP/1.1' % path, 'Host: %s' % parts.netloc,
+                 'Accept-Encoding: identity', 'Connection: close']
+        if etag:
+            lines.append('If-None-Match: %s' % etag)
+        if modified:
+            lines.append('If-Modified-Since: %s' % modified)
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+
+        status, headers = await _read_head(reader)
+        if status == 304:
+            return {'status': 304, 'etag': etag, 'modified': modified}
+        if status in (301, 302, 303, 307, 308) and 'location' in headers:
+            return {'status': status, 'location': headers['location']}
+        if status != 200:
+            raise FetchError('%s answered %d' % (url, status))
+
+        parser = rss.FeedParser(max_items)
+        body = _read_body(reader, headers)
+        try:
+            async for chunk in body:
+                if parser.feed(chunk):
+                    break  # hang up on the rest of the feed
+        finally:
+            await body.aclose()
+        result = parser.result()
+        result['status'] = status
+        result['etag'] = headers.get('etag')
+        result['modified'] = headers.get('last-modified')
+        return result
+    finally:
+        writer.close()
+
+
+async def _read_head(reader):
+    """
+    :return: (status code, dict of lowercased header name -> value)
+    """
+    status_line = (await reader.readline()).decode('latin-1').split(None, 2)
+    if len(status_line) < 2 or not status_line[0].startswith('HTTP/'):
+        raise FetchError('Not an HTTP response: %r' % ' '.join(status_line))
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            return int(status_line[1]), headers
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+
+async def _read_body(reader, headers):
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0].strip() or b'0',
+                       16)
+            if not size:
+                return
+            yield await reader.readexactly(size)
+            await reader.readline()
+    else:
+        remaining = int(headers['content-length']) \
+            if 'content-length' in headers else None
+        while remaining is None or remaining > 0:
+            chunk = await reader.read(CHUNK_SIZE if remaining is None
+                                      else min(CHUNK_SIZE, remaining))
+            if not chunk:
+                return
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+
+
+class AsyncFeeds(object):
+    """
+    Fills a FeedCache from the event loop, one fetch per feed at a time.
+    """
+
+    def __init__(self, cache=None, fetch=fetch_feed):
+        """
+        :param cache: vpr_alexa.feeds.FeedCache, defaults to programs.feed_cache
+        :param fetch: coroutine function like fetch_feed
+        """
+        self.cache = cache if cache is not None else programs.feed_cache
+        self.fetch = fetch
+        self.fetches = 0
+        self._inflight = {}
+
+    async def ensure(self, url):
+        """
+        Make sure the cache has a fresh copy of a feed, fetching it if needed.
+        :param url: url to RSS feed
+        :return: True if the feed is fresh
+        """
+        if self.cache.fresh(url):
+            return True
+        task = self._inflight.get(url)
+        if task is None:
+            task = asyncio.ensure_future(self._refresh(url))
+            self._inflight[url] = task
+            task.add_done_callback(lambda _: self._inflight.pop(url, None))
+        try:
+            # Shielded, a waiter giving up mustn't cancel the others' fetch.
+            await asyncio.shield(task)
+            return True
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.info('Non-blocking fetch of %s failed: %s' % (url, e))
+            return False
+
+    async def _refresh(self, url):
+        breaker = self.cache.breaker(url)
+        breaker.before_call()
+        self.fetches += 1
+        max_items = self.cache.max_items if self.cache.streaming else None
+        try:
+            with metrics.timer('vpr_alexa_feed_fetch_seconds',
+                               feed=url.rstrip('/').rsplit('/', 1)[-1]):
+                result = await self.fetch(url, max_items=max_items,
+                                          **self.cache.validators(url))
+            check_result(url, result)
+        except Exception:
+            breaker.failure()
+            raise
+        breaker.success()
+        self.cache.update(url, result)
+
+
+def feeds_for(payload):
+    """
+    :param payload: parsed Alexa request
+    :return: list of podcast feed URLs answering the request will read, not
+    counting podcasts the background refresher already keeps in memory
+    """
+    alexa_request = payload.get('request') or {}
+    intent = alexa_request.get('intent') or {}
+    if alexa_request.get('type') != 'IntentRequest':
+        return []
+
+    if intent.get('name') == 'WhatsNew':
+        names = briefing.podcasts
+    elif intent.get('name') in PROGRAM_INTENTS:
+        value = ''
+        for slot in (intent.get('slots') or {}).values():
+            if slot.get('name') == 'ProgramName':
+                value = slot.get('value') or ''
+        names = [programs.resolver.resolve(value.lower()).key]
+    else:
+        return []
+    return [programs.PODCAST_URL + name for name in names
+            if name in programs.podcasts and name not in programs.latest_episodes]
+
+
+def wsgi_environ(scope, body):
+    """
+    :param scope: ASGI HTTP connection scope
+    :param body: bytes of the request body
+    :return: WSGI environ for the request
+    """
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', ()):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_LENGTH':
+            continue
+        key = name if name == 'CONTENT_TYPE' else 'HTTP_' + name
+        environ[key] = environ[key] + ',' + value if key in environ else value
+    return environ
+
+
+def call_wsgi(wsgi_app, environ):
+    """
+    :return: (status code, list of ASGI header pairs, bytes of the body)
+    """
+    started = []
+
+    def start_response(status, headers, exc_info=None):
+        started[:] = [status, headers]
+
+    chunks = wsgi_app(environ, start_response)
+    try:
+        body = b''.join(chunks)
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+    status, headers = started
+    return (int(status.split(' ', 1)[0]),
+            [(name.lower().encode('latin-1'), value.encode('latin-1'))
+             for name, value in headers],
+            body)
+
+
+class AsgiApplication(object):
+    """
+    ASGI 3 application serving a Flask app, with podcast feeds fetched on the
+    event loop ahead of each /ask request.
+    """
+
+    def __init__(self, wsgi_app, feeds=None, threads=DEFAULT_THREADS,
+                 refresh_interval=0):
+        """
+        :param wsgi_app: Flask app from webapp.create_app()
+        :param feeds: AsyncFeeds to fetch with, defaults to one filling
+        programs.feed_cache
+        :param threads: threads running the Flask app
+        :param refresh_interval: seconds between background feed refreshes,
+        started with the ASGI lifespan, 0 disables them
+        """
+        self.wsgi_app = wsgi_app
+        self.feeds = feeds or AsyncFeeds()
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+        self.refresh_interval = refresh_interval
+        self.refresher = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http':
+            return None
+
+        started = time.time()
+        body = await _receive_body(receive)
+        if scope['method'] == 'POST' and scope['path'] == ASK_ROUTE:
+            budget = self.wsgi_app.config['ALEXA_RESPONSE_BUDGET']
+            await self.prefetch(body, resilience.Deadline(budget, started))
+
+        environ = wsgi_environ(scope, body)
+        environ[REQUEST_STARTED] = started
+        status, headers, content = await asyncio.get_event_loop() \
+            .run_in_executor(self.executor, call_wsgi, self.wsgi_app, environ)
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': headers})
+        await send({'type': 'http.response.body', 'body': content})
+
+    async def prefetch(self, body, deadline):
+        """
+        Fetch the feeds a request needs, giving up at the deadline. Handlers
+        fall back to the last known good episode for any that aren't ready.
+        """
+        try:
+            urls = feeds_for(json.loads(body))
+        except (ValueError, AttributeError):
+            return
+        if not urls:
+            return
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*[self.feeds.ensure(url) for url in urls]),
+                deadline.remaining())
+        except asyncio.TimeoutError:
+            logger.info('Feeds not ready by the deadline: %s' % ', '.join(urls))
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self.refresher = start_refresher(self.refresh_interval)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def close(self):
+        if self.refresher is not None:
+            self.refresher.stop()
+            self.refresher = None
+        self.executor.shutdown(wait=False)
+
+
+async def _receive_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+flask_app = create_app()
+application = None
+
+if flask_app is not None:
+    application = AsgiApplication(
+        flask_app, threads=int(os.environ.get('ASGI_THREADS', DEFAULT_THREADS)),
+        refresh_interval=flask_app.config['FEED_REFRESH_INTERVAL'])
@@ -0,0 +1,259 @@
+"""
+Redis Cache Backend
+
+The stream cache, shared episodes and metrics all live in Redis when REDIS_URL
+is set. RedisBackend gives them a bounded connection pool with socket timeouts,
+so a slow Redis costs a request a fraction of a second rather than stalling
+it.
+
+While Redis is unreachable every call is answered by an in-process SimpleCache
+instead. Each worker then keeps its own state until Redis answers a ping again,
+which is tried every `retry_interval` seconds. Counters incremented in the
+meantime, like the metrics, are added to Redis once it's back.
+"""
+import threading
+import time
+
+import redis
+from werkzeug.contrib.cache import BaseCache, RedisCache, SimpleCache
+
+from vpr_alexa import logger, metrics
+
+MAX_CONNECTIONS = 20
+SOCKET_TIMEOUT = 0.5
+POOL_TIMEOUT = 0.5
+RETRY_INTERVAL = 5
+
+# Errors meaning Redis can't be reached, as opposed to errors in a command.
+UNAVAILABLE = (redis.ConnectionError, redis.TimeoutError)
+
+
+class TimedConnectionPool(redis.BlockingConnectionPool):
+    """
+    Connection pool recording how long each checkout waits for a connection.
+    """
+
+    def get_connection(self, *args, **kwargs):
+        with metrics.registry.timer('vpr_alexa_redis_pool_wait_seconds'):
+            return super(TimedConnectionPool, self).get_connection(*args,
+                                                                   **kwargs)
+
+    def usage(self):
+        """
+        :return: dict of connections created, in use and idle
+        """
+        created = len(self._connections)
+        idle = sum(1 for connection in list(self.pool.queue)
+                   if connection is not None)
+        return {'max': self.max_connections, 'created': created,
+                'in_use': created - idle, 'idle': idle}
+
+
+class PipelinedRedisCache(RedisCache):
+    """
+    RedisCache sending multi-key writes in a single round trip.
+    """
+
+    def add(self, key, value, timeout=None):
+        timeout = self._normalize_timeout(timeout)
+        return bool(self._client.set(name=self.key_prefix + key,
+                                     value=self.dump_object(value), nx=True,
+                                     ex=timeout if timeout != -1 else None))
+
+    def inc_many(self, mapping):
+        """
+        Increment several counters in one pipeline.
+        :param mapping: dict of key -> delta
+        :return: list of the new values
+        """
+        pipe = self._client.pipeline(transaction=False)
+        for key, delta in mapping.items():
+            pipe.incr(name=self.key_prefix + key, amount=delta)
+        return pipe.execute()
+
+
+class RedisBackend(BaseCache):
+    """
+    werkzeug cache backed by Redis, falling back to a SimpleCache while Redis
+    is unreachable.
+    """
+
+    def __init__(self, client, default_timeout=300, key_prefix=None,
+                 retry_interval=RETRY_INTERVAL):
+        """
+        :param client: redis.StrictRedis
+        :param default_timeout: default cache timeout in seconds
+        :param key_prefix: prefix for every Redis key
+        :param retry_interval: seconds between pings while Redis is down
+        """
+        BaseCache.__init__(self, default_timeout)
+        self.client = client
+        self.redis = PipelinedRedisCache(client, default_timeout=default_timeout,
+                                         key_prefix=key_prefix)
+        self.fallback = SimpleCache(default_timeout=default_timeout)
+        self.retry_interval = retry_interval
+        self.down_since = None
+        self.retry_at = 0
+        self.fallbacks = 0
+        self.recoveries = 0
+        # Counter deltas added to the fallback during an outage
+        self._fallback_counts = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_url(cls, url, max_connections=MAX_CONNECTIONS,
+                 socket_timeout=SOCKET_TIMEOUT, pool_timeout=POOL_TIMEOUT,
+                 **kwargs):
+        """
+        :param url: redis:// or rediss:// URL, e.g. Heroku's REDIS_URL
+        :param max_connections: connections per worker process
+        :param socket_timeout: seconds to wait on connecting or any command
+        :param pool_timeout: seconds to wait for a free connection
+        :return: new RedisBackend
+        """
+        pool = TimedConnectionPool.from_url(
+            url, max_connections=max_connections, timeout=pool_timeout,
+            socket_timeout=socket_timeout,
+            socket_connect_timeout=socket_timeout)
+        return cls(redis.StrictRedis(connection_pool=pool), **kwargs)
+
+    @property
+    def available(self):
+        return self.down_since is None
+
+    def stats(self):
+        """
+        :return: dict of connection pool usage and fallback state
+        """
+        stats = {'available': self.available, 'down_since': self.down_since,
+                 'fallbacks': self.fallbacks, 'recoveries': self.recoveries}
+        pool = self.client.connection_pool
+        if hasattr(pool, 'usage'):
+            stats['pool'] = pool.usage()
+        return stats
+
+    def after_fork(self):
+        """
+        Drop connections inherited from the parent process, a forked worker
+        must open its own.
+        """
+        self._lock = threading.Lock()
+        self.client.connection_pool.reset()
+
+    def _mark_down(self, error):
+        with self._lock:
+            now = time.time()
+            self.retry_at = now + self.retry_interval
+            if self.down_since is not None:
+                return
+            self.down_since = now
+            self.fallbacks += 1
+        logger.error('Redis unavailable, using an in-process cache: %s' % error)
+        metrics.registry.inc('vpr_alexa_redis_fallback_total',
+                             {'event': 'unavailable'})
+
+    def _check_recovered(self):
+        """
+        :return: True if Redis is (back) up, pinging it once the retry interval
+        has passed
+        """
+        if self.down_since is None:
+            return True
+        with self._lock:
+            if self.down_since is None:
+                return True
+            if time.time() < self.retry_at:
+                return False
+            self.retry_at = time.time() + self.retry_interval
+
+        try:
+            self.client.ping()
+        except UNAVAILABLE:
+            return False
+
+        with self._lock:
+            if self.down_since is None:
+                return True
+            down_for = time.time() - self.down_since
+            self.down_since = None
+            self.recoveries += 1
+        logger.info('Redis available again after %.1fs' % down_for)
+        metrics.registry.inc('vpr_alexa_redis_fallback_total',
+                             {'event': 'recovered'})
+        # What was cached during the outage is out of step with Redis now,
+        # except for counters, which add up.
+        with self._lock:
+            counts, self._fallback_counts = self._fallback_counts, {}
+        self.fallback.clear()
+        if counts:
+            try:
+                self.redis.inc_many(counts)
+            except UNAVAILABLE as e:
+                logger.error('Dropped %d counters incremented while Redis was '
+                             'unavailable: %s' % (len(counts), e))
+        return True
+
+    def _call(self, method, *args, **kwargs):
+        if self._check_recovered():
+            try:
+                return getattr(self.redis, method)(*args, **kwargs)
+            except UNAVAILABLE as e:
+                self._mark_down(e)
+        return getattr(self.fallback, method)(*args, **kwargs)
+
+    def get(self, key):
+        return self._call('get', key)
+
+    def get_many(self, *keys):
+        return self._call('get_many', *keys)
+
+    def set(self, key, value, timeout=None):
+        return self._call('set', key, value, timeout)
+
+    def add(self, key, value, timeout=None):
+        return self._call('add', key, value, timeout)
+
+    def set_many(self, mapping, timeout=None):
+        return self._call('set_many', mapping, timeout)
+
+    def delete(self, key):
+        return self._call('delete', key)
+
+    def delete_many(self, *keys):
+        return self._call('delete_many', *keys)
+
+    def has(self, key):
+        return self._call('has', key)
+
+    def clear(self):
+        return self._call('clear')
+
+    def inc(self, key, delta=1):
+        if self._check_recovered():
+            try:
+                return self.redis.inc(key, delta)
+            except UNAVAILABLE as e:
+                self._mark_down(e)
+        return self._fallback_inc({key: delta})[0]
+
+    def dec(self, key, delta=1):
+        return self.inc(key, -delta)
+
+    def inc_many(self, mapping):
+        """
+        Increment several counters, pipelined when Redis is up.
+        :param mapping: dict of key -> delta
+        """
+        if self._check_recovered():
+            try:
+                return self.redis.inc_many(mapping)
+            except UNAVAILABLE as e:
+                self._mark_down(e)
+        return self._fallback_inc(mapping)
+
+    def _fallback_inc(self, mapping):
+        with self._lock:
+            for key, delta in mapping.items():
+                self._fallback_counts[key] = \
+                    self._fallback_counts.get(key, 0) + delta
+        return [self.fallback.inc(key, delta) for key, delta in mapping.items()]
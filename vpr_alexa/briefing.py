@@ -0,0 +1,127 @@
+"""
+What's New Briefing
+
+Reads out the latest episode of every podcast, then plays them one after
+another. Resolving them one at a time could take four slow feed fetches in a
+row. Briefing resolves every podcast on its own thread instead, all held to the
+request's deadline. A podcast that isn't ready when the deadline passes is left
+out of the briefing rather than holding up the others.
+
+The briefing is kept until any podcast feed changes (see
+`programs.feed_generation`) or `ttl` seconds pass. A briefing missing podcasts is only kept for
+`partial_ttl` seconds, so the next request gives them another chance.
+"""
+import threading
+import time
+
+from vpr_alexa import logger, metrics, programs, resilience
+
+PLAYLIST = 'briefing'
+
+TTL = 15 * 60
+PARTIAL_TTL = 30
+
+
+class Briefing(object):
+    """
+    Latest episode of each podcast, resolved concurrently and cached.
+    """
+
+    def __init__(self, podcasts=None, latest=None, ttl=TTL,
+                 partial_ttl=PARTIAL_TTL):
+        """
+        :param podcasts: podcast names in the order they're read out, defaults
+        to programs.podcasts in program_priority order
+        :param latest: function of podcast name -> Program, defaults to
+        programs.latest_podcast_episode
+        :param ttl: most seconds a complete briefing is kept, even if no feed
+        changes
+        :param partial_ttl: seconds a briefing missing podcasts is kept
+        """
+        self.podcasts = podcasts or [name for name in programs.program_priority
+                                     if name in programs.podcasts]
+        self.latest = latest or programs.latest_podcast_episode
+        self.ttl = ttl
+        self.partial_ttl = partial_ttl
+        # (feed generation, expires at, tuple of Programs)
+        self._cached = None
+        self._lock = threading.Lock()
+
+    def cached(self):
+        """
+        :return: tuple of Programs of the last briefing, however old, never
+        waiting on a fetch
+        """
+        cached = self._cached
+        return cached[2] if cached is not None else ()
+
+    def episodes(self, deadline=None):
+        """
+        :param deadline: resilience.Deadline to finish by, defaults to a fresh
+        request budget
+        :return: tuple of Programs, one per podcast that could be resolved in
+        time, in `podcasts` order
+        """
+        cached = self._cached
+        if cached is not None and cached[0] == programs.feed_generation \
+                and time.time() < cached[1]:
+            return cached[2]
+
+        deadline = deadline or resilience.Deadline()
+        episodes = self.gather(deadline)
+        ttl = self.ttl if len(episodes) == len(self.podcasts) \
+            else self.partial_ttl
+        # Read after gathering, which may itself have changed feeds.
+        generation = programs.feed_generation
+        with self._lock:
+            self._cached = (generation, time.time() + ttl, episodes)
+        return episodes
+
+    def gather(self, deadline):
+        """
+        Resolve every podcast's latest episode concurrently.
+        :param deadline: resilience.Deadline shared by every fetch
+        :return: tuple of the Programs resolved before the deadline
+        """
+        results = {}
+
+        def resolve(name):
+            resilience.share_deadline(deadline)
+            try:
+                results[name] = self.latest(name)
+            except Exception as e:
+                logger.info('Leaving %s out of the briefing: %s' % (name, e))
+            finally:
+                resilience.end_request()
+
+        threads = [threading.Thread(target=resolve, args=(name,),
+                                    name='briefing-%s' % name)
+                   for name in self.podcasts]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join(deadline.remaining())
+
+        # Threads still running past the deadline don't make it in.
+        resolved = dict(results)
+        episodes = []
+        for name in self.podcasts:
+            episode = resolved.get(name)
+            metrics.registry.inc('vpr_alexa_briefing_podcasts_total',
+                                 {'result': 'missed' if episode is None
+                                  else 'included'})
+            if episode is not None:
+                episodes.append(programs._secure(name, episode))
+        return tuple(episodes)
+
+    def next_after(self, url):
+        """
+        :param url: audio URL of the briefing episode playing now
+        :return: Program to play after it from the cached briefing, or None
+        """
+        episodes = self.cached()
+        for index, episode in enumerate(episodes[:-1]):
+            if episode.url == url:
+                return episodes[index + 1]
+        return None
@@ -0,0 +1,172 @@
+"""
+Compact Episode Index
+
+Feed entries parsed by Feedparser (or vpr_alexa.rss) are nested dicts with
+lists of link dicts. That's fine for the newest few, but too heavy for keeping
+a podcast's whole back catalogue in every worker.
+
+EpisodeIndex keeps just what playing an episode needs: title, audio URL,
+publish time and duration. Each field is stored in its own flat array, with
+strings packed into one blob plus offsets, so an episode costs little more than
+the characters of its title and URL rather than several KB. Episodes are
+stored newest first. Lookups by position are O(1) and lookups by date are
+O(log n).
+"""
+from array import array
+from collections import namedtuple
+from email.utils import mktime_tz, parsedate_tz
+import sys
+
+import six
+
+Episode = namedtuple('Episode', ['title', 'url', 'published', 'duration'])
+
+
+def parse_published(value):
+    """
+    :param value: RFC 822 date from <pubDate>, e.g. "Tue, 14 Mar 2017 12:00:00 -0400"
+    :return: seconds since the epoch, 0 if it can't be read
+    """
+    parsed = parsedate_tz(value or '')
+    if parsed is None:
+        return 0
+    return mktime_tz(parsed)
+
+
+def parse_duration(value):
+    """
+    :param value: <itunes:duration>, e.g. "1:02:03", "48:10" or "2890"
+    :return: seconds, 0 if it can't be read
+    """
+    seconds = 0
+    try:
+        for part in (value or '').strip().split(':'):
+            seconds = seconds * 60 + int(float(part))
+    except ValueError:
+        return 0
+    return seconds
+
+
+class PackedStrings(object):
+    """
+    Immutable sequence of strings stored as one string and end offsets.
+    """
+    __slots__ = ('_blob', '_ends')
+
+    def __init__(self, strings):
+        strings = [six.text_type(s) for s in strings]
+        self._blob = u''.join(strings)
+        self._ends = array('l')
+        end = 0
+        for s in strings:
+            end += len(s)
+            self._ends.append(end)
+
+    def __len__(self):
+        return len(self._ends)
+
+    def __getitem__(self, index):
+        start = self._ends[index - 1] if index > 0 else 0
+        return self._blob[start:self._ends[index]]
+
+    def nbytes(self):
+        return sys.getsizeof(self._blob) + sys.getsizeof(self._ends)
+
+
+def audio_url(entry):
+    """
+    :return: href of a feed entry's audio/mpeg link, None if it has none
+    """
+    for link in entry.get('links', ()):
+        if link.get('type') == 'audio/mpeg' and link.get('href'):
+            return link['href']
+
+
+class EpisodeIndex(object):
+    """
+    Episodes of one podcast feed, newest first.
+    """
+    __slots__ = ('titles', 'urls', 'published', 'durations')
+
+    def __init__(self, episodes=()):
+        """
+        :param episodes: iterable of Episode, in any order
+        """
+        episodes = sorted(episodes, key=lambda episode: -episode.published)
+        self.titles = PackedStrings(episode.title for episode in episodes)
+        self.urls = PackedStrings(episode.url for episode in episodes)
+        self.published = array('d', (episode.published for episode in episodes))
+        self.durations = array('l', (episode.duration for episode in episodes))
+
+    @classmethod
+    def from_entries(cls, entries, limit=None):
+        """
+        :param entries: feed entries shaped like Feedparser's
+        :param limit: most episodes to keep, the newest win
+        :return: new EpisodeIndex of the entries with audio
+        """
+        episodes = []
+        for entry in entries:
+            url = audio_url(entry)
+            if url is None:
+                continue
+            episodes.append(Episode(title=entry.get('title', ''), url=url,
+                                    published=parse_published(entry.get('published')),
+                                    duration=parse_duration(entry.get('itunes_duration'))))
+        if limit is not None:
+            episodes = sorted(episodes, key=lambda episode: -episode.published)[:limit]
+        return cls(episodes)
+
+    def __len__(self):
+        return len(self.published)
+
+    def __getitem__(self, position):
+        """
+        :param position: 0 for the newest episode, negative counts from the
+        oldest
+        :return: Episode
+        """
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError('episode index out of range')
+        return Episode(title=self.titles[position], url=self.urls[position],
+                       published=self.published[position],
+                       duration=self.durations[position])
+
+    def published_before(self, timestamp):
+        """
+        :param timestamp: seconds since the epoch
+        :return: position of the newest episode published at or before
+        timestamp, None if they're all newer
+        """
+        # Binary search on publish times in descending order.
+        low, high = 0, len(self.published)
+        while low < high:
+            middle = (low + high) // 2
+            if self.published[middle] > timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low if low < len(self.published) else None
+
+    def published_between(self, start, end):
+        """
+        :param start: seconds since the epoch, inclusive
+        :param end: seconds since the epoch, exclusive
+        :return: range of positions of episodes published in [start, end),
+        newest first
+        """
+        first = self.published_before(end - 1e-6)
+        if first is None:
+            return range(0)
+        last = self.published_before(start - 1e-6)
+        return range(first, len(self) if last is None else last)
+
+    def nbytes(self):
+        """
+        :return: approximate bytes of memory used by the index
+        """
+        return (sys.getsizeof(self) + self.titles.nbytes() +
+                self.urls.nbytes() + sys.getsizeof(self.published) +
+                sys.getsizeof(self.durations))
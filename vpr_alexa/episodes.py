@@ -0,0 +1,133 @@
+"""
+Shared Episode Cache
+
+Every gunicorn worker keeps its own feed cache, so a cold start or an expiry
+sends each worker to https://podcasts.vpr.net at once. This module stores the
+resolved podcast Program records in the same cache backend flask-ask uses for
+its `stream_cache` (Redis in production), shared by all workers.
+
+Refreshes are single-flight: a worker must win a lock in the backend before it
+fetches a feed. Everyone else serves the last stored value, or waits briefly
+for the winner when there's nothing stored yet, never past the request's
+deadline.
+"""
+import time
+import uuid
+
+from vpr_alexa import logger
+from vpr_alexa.programs import Program
+from vpr_alexa.resilience import DeadlineExceeded, current_deadline
+
+KEY_PREFIX = 'vpr_alexa:episode:'
+LOCK_PREFIX = 'vpr_alexa:episode-lock:'
+
+DEFAULT_TTL = 5 * 60
+DEFAULT_RETENTION = 24 * 60 * 60
+DEFAULT_LOCK_TIMEOUT = 30
+DEFAULT_WAIT = 5
+POLL_INTERVAL = 0.05
+
+
+class SharedEpisodeCache(object):
+    """
+    Program records shared across processes through a werkzeug cache backend.
+    """
+
+    def __init__(self, backend, ttl=DEFAULT_TTL, retention=DEFAULT_RETENTION,
+                 lock_timeout=DEFAULT_LOCK_TIMEOUT, wait=DEFAULT_WAIT):
+        """
+        :param backend: werkzeug cache (RedisCache, SimpleCache, ...)
+        :param ttl: seconds a stored episode is considered fresh
+        :param retention: seconds a stored episode is kept as a last known value
+        :param lock_timeout: seconds before an abandoned refresh lock expires
+        :param wait: seconds to wait for another worker's refresh when there's
+        no stored value to serve
+        """
+        self.backend = backend
+        self.ttl = ttl
+        self.retention = retention
+        self.lock_timeout = lock_timeout
+        self.wait = wait
+
+    def _record(self, podcast_name):
+        try:
+            return self.backend.get(KEY_PREFIX + podcast_name)
+        except Exception as e:
+            logger.error('Failed to read shared episode %s: %s'
+                         % (podcast_name, e))
+
+    def get(self, podcast_name):
+        """
+        :return: (Program, fetched_at) last stored for a podcast, or None
+        """
+        record = self._record(podcast_name)
+        if record:
+            return Program(*record['program']), record['fetched_at']
+
+    def set(self, podcast_name, program, fetched_at=None):
+        record = {'program': tuple(program),
+                  'fetched_at': time.time() if fetched_at is None else fetched_at}
+        self.backend.set(KEY_PREFIX + podcast_name, record,
+                         timeout=self.retention)
+
+    def _acquire(self, podcast_name):
+        token = uuid.uuid4().hex
+        if self.backend.add(LOCK_PREFIX + podcast_name, token,
+                            timeout=self.lock_timeout):
+            return token
+
+    def _release(self, podcast_name, token):
+        # Only drop the lock if it's still ours, it may have expired and been
+        # taken by another worker during a very slow fetch.
+        if self.backend.get(LOCK_PREFIX + podcast_name) == token:
+            self.backend.delete(LOCK_PREFIX + podcast_name)
+
+    def get_or_refresh(self, podcast_name, fetch, force=False):
+        """
+        Get a podcast's episode, fetching it in at most one worker when it's
+        missing or stale.
+        :param podcast_name: url-style name of the podcast
+        :param fetch: callable returning a fresh Program for the podcast
+        :param force: refresh even if the stored episode is still fresh
+        :return: Program
+        :raise DeadlineExceeded: if the current request's deadline passes while
+        waiting on another worker's refresh
+        """
+        stored = self.get(podcast_name)
+        if stored and not force and time.time() - stored[1] < self.ttl:
+            return stored[0]
+
+        token = self._acquire(podcast_name)
+        if token is not None:
+            try:
+                program = fetch()
+                self.set(podcast_name, program)
+                return program
+            except Exception as e:
+                if not stored:
+                    raise
+                logger.error('Failed to refresh shared episode %s, serving '
+                             'the stored one: %s' % (podcast_name, e))
+                return stored[0]
+            finally:
+                self._release(podcast_name, token)
+
+        if stored:
+            return stored[0]
+
+        # Someone else is fetching and there's nothing to serve yet.
+        deadline = current_deadline()
+        wait = self.wait if deadline is None \
+            else min(self.wait, deadline.remaining())
+        give_up = time.time() + wait
+        while time.time() < give_up:
+            time.sleep(max(0, min(POLL_INTERVAL, give_up - time.time())))
+            stored = self.get(podcast_name)
+            if stored:
+                return stored[0]
+
+        if deadline is not None and deadline.expired():
+            raise DeadlineExceeded('Ran out of time waiting on shared refresh '
+                                   'of %s' % podcast_name)
+        logger.info('Gave up waiting on shared refresh of %s' % podcast_name)
+        return fetch()
@@ -0,0 +1,342 @@
+"""
+VPR Podcast Feed Cache
+
+Keeps parsed RSS feeds in memory so every PlayProgram doesn't pay for a round
+trip to https://podcasts.vpr.net and a full RSS parse.
+
+Each feed gets a TTL. Once the TTL passes the cached copy is still served as
+"stale" for a grace period while a background thread refreshes it. Refreshes
+send the feed's ETag/Last-Modified values back to the server, so an unchanged
+feed costs a 304 and no re-parse.
+
+With `streaming` on, feeds are read by the early-exit parser in `rss` and only
+the newest entries are kept. Feedparser's full parse stays as the fallback for
+anything the streaming parser can't handle.
+
+Fetches respect the current request's deadline (see `resilience`) and go
+through a circuit breaker per feed, so a feed that keeps failing is skipped
+instead of tying up workers. Network and parse errors are raised as
+`FeedUnavailable`, so callers can fall back to what they last had.
+"""
+import threading
+import time
+
+import six
+from six.moves.http_client import HTTPException
+
+from vpr_alexa import rss, logger
+from vpr_alexa.lazy import LazyModule
+from vpr_alexa.metrics import registry as metrics
+from vpr_alexa.resilience import CLOSED, CircuitBreaker, DeadlineExceeded, \
+    FeedUnavailable, current_deadline
+
+DEFAULT_TTL = 5 * 60
+DEFAULT_STALE_TTL = 60 * 60
+
+# Only needed when the streaming parser can't read a feed.
+feedparser = LazyModule('feedparser')
+
+
+def check_result(url, result):
+    """
+    Feedparser doesn't raise on network errors, it returns a "bozo" result with
+    nothing in it. Storing that would replace the last good copy of the feed.
+    :param url: url to RSS feed
+    :param result: dict shaped like Feedparser's results
+    :raise FeedUnavailable: if the result is bozo or has no title or entries
+    """
+    if result.get('status') == 304:
+        return
+    if result.get('bozo') or not result.get('entries') \
+            or not (result.get('feed') or {}).get('title'):
+        raise FeedUnavailable('Unusable result fetching %s: %s' % (
+            url, result.get('bozo_exception', 'no title or entries')))
+
+
+class CachedFeed(object):
+    """ A parsed feed plus the validators needed for a conditional GET. """
+    __slots__ = ('feed', 'etag', 'modified', 'fetched_at', 'refreshing')
+
+    def __init__(self, feed, etag=None, modified=None, fetched_at=None):
+        self.feed = feed
+        self.etag = etag
+        self.modified = modified
+        self.fetched_at = time.time() if fetched_at is None else fetched_at
+        self.refreshing = False
+
+    def age(self, now=None):
+        return (time.time() if now is None else now) - self.fetched_at
+
+
+class FeedCache(object):
+    """
+    In-process TTL cache for parsed RSS feeds with stale-while-revalidate.
+
+    Counters for hits, misses, stale serves and 304s are kept in `stats` so
+    TTLs can be sized from real traffic.
+    """
+
+    def __init__(self, default_ttl=DEFAULT_TTL, stale_ttl=DEFAULT_STALE_TTL,
+                 ttls=None, streaming=False, max_items=1, keep_items=None,
+                 on_refresh=None):
+        """
+        :param default_ttl: seconds a feed is considered fresh
+        :param stale_ttl: seconds past its TTL a feed may still be served while
+        it's being refreshed in the background
+        :param ttls: optional dict of url -> TTL overriding default_ttl
+        :param streaming: use the early-exit streaming parser
+        :param max_items: entries the streaming parser reads per feed
+        :param keep_items: entries kept in memory per feed, None keeps all
+        that were parsed
+        :param on_refresh: optional function(url, feed) called with every newly
+        fetched feed, before it's trimmed to keep_items
+        """
+        self.default_ttl = default_ttl
+        self.stale_ttl = stale_ttl
+        self.ttls = dict(ttls or {})
+        self.streaming = streaming
+        self.max_items = max_items
+        self.keep_items = keep_items
+        self.on_refresh = on_refresh
+        self._feeds = {}
+        self._breakers = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stale': 0, 'not_modified': 0}
+
+    def ttl(self, url):
+        return self.ttls.get(url, self.default_ttl)
+
+    def stats(self):
+        """
+        :return: new dict copy of the cache counters
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def breaker(self, url):
+        """
+        :return: CircuitBreaker guarding fetches of a feed
+        """
+        with self._lock:
+            if url not in self._breakers:
+                self._breakers[url] = CircuitBreaker()
+            return self._breakers[url]
+
+    def breaker_states(self):
+        """
+        :return: new dict of url -> circuit breaker state
+        """
+        with self._lock:
+            return dict((url, breaker.state)
+                        for url, breaker in self._breakers.items())
+
+    def describe(self, url, now=None):
+        """
+        What we have of a feed, never fetching it.
+        :return: dict of its age in seconds (None if we don't have it), TTL,
+        state ('fresh', 'stale' while it may still be served, 'expired' or
+        'missing') and circuit breaker state and consecutive failures
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._feeds.get(url)
+            breaker = self._breakers.get(url)
+        ttl = self.ttl(url)
+        age = entry.age(now) if entry is not None else None
+        if age is None:
+            state = 'missing'
+        elif age < ttl:
+            state = 'fresh'
+        elif age < ttl + self.stale_ttl:
+            state = 'stale'
+        else:
+            state = 'expired'
+        return {'age': round(age, 1) if age is not None else None, 'ttl': ttl,
+                'state': state,
+                'breaker': breaker.state if breaker is not None else CLOSED,
+                'failures': breaker.failures if breaker is not None else 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+        metrics.inc('vpr_alexa_feed_cache_total', {'result': name})
+
+    def get(self, url):
+        """
+        Get a parsed feed, fetching it only when it's missing or too stale.
+        :param url: url to RSS feed
+        :return: dict of RSS feed results
+        """
+        entry = self._feeds.get(url)
+        if entry is None:
+            self._count('misses')
+            return self.refresh(url).feed
+
+        age = entry.age()
+        ttl = self.ttl(url)
+        if age < ttl:
+            self._count('hits')
+        elif age < ttl + self.stale_ttl:
+            self._count('stale')
+            self._refresh_in_background(url, entry)
+        else:
+            self._count('misses')
+            try:
+                entry = self.refresh(url)
+            except Exception as e:
+                logger.error('Failed to refresh expired feed %s: %s' % (url, e))
+        return entry.feed
+
+    def peek(self, url):
+        """
+        :param url: url to RSS feed
+        :return: dict of RSS feed results we already have, however old, or
+        None. Never fetches.
+        """
+        entry = self._feeds.get(url)
+        if entry is not None:
+            return entry.feed
+
+    def fresh(self, url, now=None):
+        """
+        :return: True if we have a copy of the feed younger than its TTL
+        """
+        entry = self._feeds.get(url)
+        return entry is not None and entry.age(now) < self.ttl(url)
+
+    def validators(self, url):
+        """
+        :return: dict of the etag and modified values for a conditional GET of
+        the feed, empty if we don't have it
+        """
+        entry = self._feeds.get(url)
+        if entry is None:
+            return {}
+        return {'etag': entry.etag, 'modified': entry.modified}
+
+    def refresh(self, url):
+        """
+        Fetch a feed now, using a conditional GET if we have a previous copy.
+        :param url: url to RSS feed
+        :return: CachedFeed for the url
+        """
+        result = self._fetch(url, **self.validators(url))
+        if result.get('status') == 304 and url not in self._feeds:
+            # The copy we validated against was invalidated while the request
+            # was in flight, so there's nothing left to keep.
+            result = self._fetch(url)
+        return self.update(url, result)
+
+    def update(self, url, result):
+        """
+        Store the result of fetching a feed, however it was fetched.
+        :param url: url to RSS feed
+        :param result: dict shaped like Feedparser's results, with 'status',
+        'etag' and 'modified'
+        :return: CachedFeed for the url
+        :raise FeedUnavailable: when the feed is unmodified but there's no
+        previous copy to keep
+        """
+        previous = self._feeds.get(url)
+        if previous is None and result.get('status') == 304:
+            raise FeedUnavailable('%s was not modified, but is no longer cached'
+                                  % url)
+        if previous is not None and result.get('status') == 304:
+            self._count('not_modified')
+            entry = CachedFeed(previous.feed, previous.etag, previous.modified)
+        else:
+            feed = dict(result)
+            if self.on_refresh is not None:
+                try:
+                    self.on_refresh(url, feed)
+                except Exception as e:
+                    logger.error('on_refresh failed for %s: %s' % (url, e))
+            if self.keep_items is not None and 'entries' in feed:
+                feed['entries'] = feed['entries'][:self.keep_items]
+            entry = CachedFeed(feed, result.get('etag'), result.get('modified'))
+
+        self._feeds[url] = entry
+        return entry
+
+    def _fetch(self, url, **validators):
+        deadline = current_deadline()
+        if deadline is not None:
+            deadline.check()
+
+        breaker = self.breaker(url)
+        breaker.before_call()
+        try:
+            with metrics.timer('vpr_alexa_feed_fetch_seconds',
+                               feed=url.rstrip('/').rsplit('/', 1)[-1]):
+                result = self._fetch_feed(url, deadline, **validators)
+            check_result(url, result)
+        except Exception as e:
+            breaker.failure()
+            if deadline is not None and deadline.expired() and \
+                    not isinstance(e, DeadlineExceeded):
+                raise DeadlineExceeded('Fetching %s ran out of time: %s'
+                                       % (url, e))
+            if isinstance(e, (EnvironmentError, HTTPException,
+                              rss.RSSParseError)):
+                six.raise_from(FeedUnavailable('Fetching %s failed: %s'
+                                               % (url, e)), e)
+            raise
+        breaker.success()
+        return result
+
+    def _fetch_feed(self, url, deadline, **validators):
+        if self.streaming:
+            try:
+                return rss.fetch(url, max_items=self.max_items,
+                                 deadline=deadline, **validators)
+            except rss.RSSParseError as e:
+                if e.response is None:
+                    raise
+                # Reparse the document that was already downloaded rather
+                # than fetching it again.
+                logger.info('Streaming parse failed for %s, falling back to '
+                            'a full parse: %s' % (url, e))
+                response = e.response
+                result = feedparser.parse(response['document'])
+                for header in ('status', 'etag', 'modified'):
+                    result[header] = response[header]
+                return result
+        if deadline is not None:
+            deadline.check()
+        return feedparser.parse(url, **validators)
+
+    def _refresh_in_background(self, url, entry):
+        with self._lock:
+            if entry.refreshing:
+                return
+            entry.refreshing = True
+
+        def run():
+            try:
+                self.refresh(url)
+            except Exception as e:
+                logger.error('Background refresh failed for %s: %s' % (url, e))
+            finally:
+                entry.refreshing = False
+
+        thread = threading.Thread(target=run, name='feed-refresh')
+        thread.daemon = True
+        thread.start()
+
+    def after_fork(self):
+        """
+        Reset state left behind by the parent process's threads: its lock and
+        any background refresh that was running when it forked.
+        """
+        self._lock = threading.Lock()
+        for entry in list(self._feeds.values()):
+            entry.refreshing = False
+
+    def invalidate(self, url=None):
+        """
+        Drop a single feed, or every feed when no url is given.
+        """
+        if url is None:
+            self._feeds.clear()
+        else:
+            self._feeds.pop(url, None)
@@ -0,0 +1,29 @@
+"""
+Gunicorn Configuration
+
+    gunicorn -c vpr_alexa/gunicorn_conf.py vpr_alexa.wsgi
+
+The app is loaded and warmed up once in the master process, then forked into
+workers that start with primed feed caches (see vpr_alexa.startup). Set
+GUNICORN_PRELOAD=false to build and warm up the app in each worker instead.
+Gunicorn's own settings, like WEB_CONCURRENCY and PORT on Heroku, still apply.
+
+Gunicorn reads this file before the app's directory is on the import path, so
+vpr_alexa is only imported from inside the hooks.
+"""
+import os
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() != 'false'
+
+# Tells vpr_alexa.startup to leave per-worker setup to post_fork.
+os.environ['VPR_ALEXA_PRELOADED'] = 'true' if preload_app else 'false'
+
+
+def post_fork(server, worker):
+    """
+    Per-worker setup for a worker forked from a preloaded app, before it
+    accepts any requests.
+    """
+    if server.cfg.preload_app:
+        from vpr_alexa import startup
+        startup.start_worker(worker.app.wsgi())
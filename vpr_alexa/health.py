@@ -0,0 +1,97 @@
+"""
+Health and Readiness
+
+/healthz answers as long as the worker can serve requests at all. /readyz
+answers 200 only once the worker is worth sending Alexa traffic to: every
+podcast feed has been fetched, or at least tried (a feed that's down mustn't
+keep workers out of rotation), and the cache backend is reachable. Until then
+it answers 503.
+
+Both report from what's already in memory. Neither fetches a feed or talks to
+Redis, so they're cheap enough to poll every few seconds.
+
+Every podcast's age is reported relative to when it's expected to be refreshed:
+its feed cache TTL, or the refresher's current poll delay for it when that's
+longer. Podcasts more than OVERDUE times past it are listed as overdue.
+"""
+import os
+import time
+
+from flask import Blueprint, jsonify
+
+from vpr_alexa import programs, refresher
+
+OVERDUE = 2
+
+# The web app's werkzeug cache, set by create_app()
+backend = None
+
+blueprint = Blueprint('health', __name__)
+
+
+def feed_status(podcast_name, now=None):
+    """
+    :param podcast_name: url-style name of the podcast, e.g. "vermont-edition"
+    :return: dict of what the worker has of the podcast's feed, see
+    FeedCache.describe, with its expected refresh, relative age and whether
+    it's primed or overdue
+    """
+    now = time.time() if now is None else now
+    status = programs.feed_cache.describe(programs.PODCAST_URL + podcast_name,
+                                          now)
+    expected = status['ttl']
+    poller = refresher.current
+    if poller is not None and poller.is_running() \
+            and podcast_name in poller.next_due:
+        expected = max(expected, poller.poll_delay(podcast_name, now))
+        status['next_poll_in'] = max(0, round(poller.next_due[podcast_name]
+                                              - now, 1))
+
+    age = status['age']
+    relative = round(age / expected, 2) if age is not None and expected \
+        else None
+    status['expected_refresh'] = expected
+    status['relative_age'] = relative
+    status['overdue'] = relative is not None and relative > OVERDUE
+    status['primed'] = age is not None or status['failures'] > 0 \
+        or podcast_name in programs.latest_episodes
+    return status
+
+
+def backend_status():
+    """
+    :return: dict of the cache backend's type and availability, with Redis
+    pool usage when it has any
+    """
+    if backend is None:
+        return {'type': None, 'available': True}
+    status = backend.stats() if hasattr(backend, 'stats') \
+        else {'available': True}
+    status['type'] = type(backend).__name__
+    return status
+
+
+@blueprint.route('/healthz')
+def healthz():
+    """ Liveness, answering whenever the worker can. """
+    poller = refresher.current
+    return jsonify(status='ok', pid=os.getpid(),
+                   refresher_running=bool(poller and poller.is_running()))
+
+
+@blueprint.route('/readyz')
+def readyz():
+    """ Readiness, 503 until feeds are primed and the cache is reachable. """
+    now = time.time()
+    feeds = dict((name, feed_status(name, now)) for name in programs.podcasts)
+    waiting_on = sorted(name for name, status in feeds.items()
+                        if not status['primed'])
+    cache = backend_status()
+    ready = not waiting_on and cache['available']
+
+    response = jsonify(ready=ready, cache_backend=cache, feeds=feeds,
+                       waiting_on=waiting_on,
+                       overdue=sorted(name for name, status in feeds.items()
+                                      if status['overdue']))
+    response.status_code = 200 if ready else 503
+    return response
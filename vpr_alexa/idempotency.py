@@ -0,0 +1,110 @@
+"""
+Idempotent Responses
+
+Alexa retries a request that hasn't been answered in time, with the same
+requestId. Without this module a retry of PlayProgram would resolve the
+program again, fetching the feed that made the first attempt slow.
+
+ResponseCache stores each response under its requestId for a short while, in
+the backend shared by all workers. The first attempt claims the id with an
+atomic `add` before it's handled. A retry landing on any worker finds either
+the stored response, or the claim of an attempt still in progress and waits
+for its response rather than handling the request a second time.
+"""
+import time
+
+from vpr_alexa import logger
+
+KEY_PREFIX = 'vpr_alexa:response:'
+
+DEFAULT_TTL = 2 * 60
+DEFAULT_LOCK_TIMEOUT = 10
+DEFAULT_WAIT = 5
+POLL_INTERVAL = 0.05
+
+# Stored under a request id while its first attempt is being handled.
+PENDING = 'pending'
+
+
+class ResponseCache(object):
+    """
+    Responses keyed by Alexa requestId, shared through a werkzeug cache.
+    """
+
+    def __init__(self, backend, ttl=DEFAULT_TTL,
+                 lock_timeout=DEFAULT_LOCK_TIMEOUT, wait=DEFAULT_WAIT):
+        """
+        :param backend: werkzeug cache (RedisCache, SimpleCache, ...)
+        :param ttl: seconds a response is kept for retries, 0 disables the
+        cache
+        :param lock_timeout: seconds before the claim of an attempt that never
+        finished expires
+        :param wait: seconds a retry waits for an attempt in progress
+        """
+        self.backend = backend
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self.wait = wait
+
+    def _get(self, request_id):
+        try:
+            return self.backend.get(KEY_PREFIX + request_id)
+        except Exception as e:
+            logger.error('Failed to read stored response %s: %s'
+                         % (request_id, e))
+
+    def claim(self, request_id):
+        """
+        :param request_id: Alexa requestId
+        :return: True if this is the first attempt at the request and it's
+        now ours to answer
+        """
+        try:
+            return bool(self.backend.add(KEY_PREFIX + request_id, PENDING,
+                                         timeout=self.lock_timeout))
+        except Exception as e:
+            logger.error('Failed to claim request %s: %s' % (request_id, e))
+            return True
+
+    def store(self, request_id, status, body):
+        """
+        Keep the response to a claimed request for its retries.
+        :param status: HTTP status code
+        :param body: bytes of the response body
+        """
+        try:
+            self.backend.set(KEY_PREFIX + request_id,
+                             {'status': status, 'body': body},
+                             timeout=self.ttl)
+        except Exception as e:
+            logger.error('Failed to store response %s: %s' % (request_id, e))
+
+    def release(self, request_id):
+        """
+        Drop the claim of an attempt that failed, so its retries are handled
+        from scratch.
+        """
+        try:
+            self.backend.delete(KEY_PREFIX + request_id)
+        except Exception as e:
+            logger.error('Failed to release request %s: %s' % (request_id, e))
+
+    def response(self, request_id, wait=None):
+        """
+        :param request_id: Alexa requestId of a request that couldn't be
+        claimed
+        :param wait: most seconds to wait for an attempt in progress, defaults
+        to `wait`
+        :return: dict with the 'status' and 'body' of the first attempt's
+        response, or None if it failed or didn't finish in time
+        """
+        deadline = time.time() + (self.wait if wait is None else wait)
+        while True:
+            stored = self._get(request_id)
+            if stored != PENDING:
+                return stored
+            if time.time() >= deadline:
+                logger.info('Gave up waiting on the first attempt at %s'
+                            % request_id)
+                return None
+            time.sleep(POLL_INTERVAL)
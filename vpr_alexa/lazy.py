@@ -0,0 +1,34 @@
+"""
+Lazily Imported Modules
+
+Every import at startup is paid for by a cold worker before its first request.
+A LazyModule stands in for a dependency that's only needed sometimes, importing
+it the first time one of its attributes is used.
+"""
+import importlib
+
+
+class LazyModule(object):
+    """
+    Module imported on first attribute access.
+    """
+
+    def __init__(self, name):
+        """
+        :param name: full module name, e.g. 'feedparser'
+        """
+        self._name = name
+        self._module = None
+
+    @property
+    def loaded(self):
+        return self._module is not None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+    def __repr__(self):
+        return '<lazy module %r%s>' % (self._name,
+                                       '' if self.loaded else ' (not loaded)')
@@ -0,0 +1,309 @@
+"""
+Request and Cache Metrics
+
+Timing histograms per intent and AudioPlayer event, feed fetch timings and
+cache hit/miss counters, served in Prometheus' text format on /metrics.
+
+Recording only bumps numbers in an in-process dict. A daemon thread in each
+worker flushes the accumulated deltas to the shared cache backend every few
+seconds with atomic increments, so a scrape sees totals that add up across all
+gunicorn workers no matter which worker answers it. Without Redis each worker
+keeps and serves its own totals.
+"""
+import atexit
+import bisect
+from contextlib import contextmanager
+import os
+import re
+import threading
+import time
+import uuid
+
+from flask import Blueprint, Response
+
+from vpr_alexa import logger
+
+KEY_PREFIX = 'vpr_alexa:metrics:'
+REGISTRY_KEY = KEY_PREFIX + 'series'
+LOCK_KEY = KEY_PREFIX + 'lock'
+
+FLUSH_INTERVAL = 10
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 8.0)
+INF = '+Inf'
+
+# Histogram sums are kept as integer microseconds so they can be incremented
+# atomically in Redis.
+MICROS = 1000000
+
+METRICS = {
+    'vpr_alexa_request_seconds':
+        ('histogram', 'Time spent answering Alexa requests by intent or '
+                      'AudioPlayer event.'),
+    'vpr_alexa_feed_fetch_seconds':
+        ('histogram', 'Time spent fetching and parsing podcast feeds.'),
+    'vpr_alexa_feed_cache_total':
+        ('counter', 'Podcast feed cache lookups by result.'),
+    'vpr_alexa_stream_cache_total':
+        ('counter', 'flask-ask stream cache reads by result.'),
+    'vpr_alexa_redis_pool_wait_seconds':
+        ('histogram', 'Time spent waiting for a pooled Redis connection.'),
+    'vpr_alexa_redis_fallback_total':
+        ('counter', 'Switches to the in-process cache while Redis is '
+                    'unavailable, and back.'),
+    'vpr_alexa_playback_events_total':
+        ('counter', 'AudioPlayer events answered by the fast path.'),
+    'vpr_alexa_briefing_podcasts_total':
+        ('counter', 'Podcasts included in or missing from a What\'s New '
+                    'briefing.'),
+    'vpr_alexa_retried_requests_total':
+        ('counter', 'Retried Alexa requests by whether the first attempt\'s '
+                    'response was replayed.'),
+}
+
+_series = re.compile(r'^(\w+)\{(.*)\}$')
+_label = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def series(name, labels):
+    """
+    :return: Prometheus series name, e.g. name{intent="PlayProgram"}
+    """
+    return '%s{%s}' % (name, ','.join(
+        '%s="%s"' % (key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for key, value in sorted(labels.items())))
+
+
+def parse_series(key):
+    """
+    :return: (name, dict of labels) for a series name
+    """
+    match = _series.match(key)
+    return match.group(1), dict(_label.findall(match.group(2)))
+
+
+def bucket_label(bound):
+    return INF if bound == INF else repr(float(bound))
+
+
+class Metrics(object):
+    """
+    Counters and histograms accumulated in-process and flushed to a werkzeug
+    cache backend.
+    """
+
+    def __init__(self, backend=None, flush_interval=FLUSH_INTERVAL,
+                 buckets=BUCKETS):
+        """
+        :param backend: werkzeug cache shared by all workers, None keeps
+        totals in this process only
+        :param flush_interval: seconds between background flushes
+        :param buckets: histogram bucket upper bounds in seconds
+        """
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self.buckets = tuple(buckets)
+        self._pending = {}
+        self._totals = {}
+        self._registered = set()
+        self._unregistered = set()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pid = None
+
+    def inc(self, name, labels=None, value=1):
+        """
+        Add to a counter.
+        """
+        key = series(name, labels or {})
+        with self._lock:
+            self._pending[key] = self._pending.get(key, 0) + value
+        self._ensure_flusher()
+
+    def observe(self, name, seconds, labels=None):
+        """
+        Record a duration in a histogram.
+        """
+        labels = labels or {}
+        index = bisect.bisect_left(self.buckets, seconds)
+        bound = self.buckets[index] if index < len(self.buckets) else INF
+        keys = ((series(name + '_bucket',
+                        dict(labels, le=bucket_label(bound))), 1),
+                (series(name + '_count', labels), 1),
+                (series(name + '_sum', labels), int(seconds * MICROS)))
+        with self._lock:
+            for key, value in keys:
+                self._pending[key] = self._pending.get(key, 0) + value
+        self._ensure_flusher()
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """
+        Time the enclosed block into a histogram.
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - start, labels)
+
+    def after_fork(self):
+        """
+        Replace locks a thread of the parent process may have held when it
+        forked. The flusher restarts itself in the child on the next update.
+        """
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def _ensure_flusher(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # We're a freshly forked worker, what's pending belongs to the
+                # parent process.
+                self._pending.clear()
+                self._registered.clear()
+                self._unregistered.clear()
+            self._pid = os.getpid()
+
+        thread = threading.Thread(target=self._run_flusher,
+                                  name='metrics-flusher')
+        thread.daemon = True
+        thread.start()
+        atexit.register(self.flush)
+
+    def _run_flusher(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """
+        Move pending deltas to the backend (or local totals without one).
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending and not self._unregistered:
+                return
+
+            if self.backend is None:
+                for key, value in pending.items():
+                    self._totals[key] = self._totals.get(key, 0) + value
+                return
+
+            self._unregistered |= set(pending) - self._registered
+            try:
+                if hasattr(self.backend, 'inc_many'):
+                    self.backend.inc_many(dict(
+                        (KEY_PREFIX + key, value)
+                        for key, value in pending.items()))
+                    pending.clear()
+                for key in list(pending):
+                    self.backend.inc(KEY_PREFIX + key, pending[key])
+                    del pending[key]
+                self._register()
+            except Exception as e:
+                logger.error('Failed to flush metrics: %s' % e)
+                with self._lock:
+                    for key, value in pending.items():
+                        self._pending[key] = self._pending.get(key, 0) + value
+
+    def _register(self):
+        """
+        Add newly seen series to the shared registry, under a short lock so
+        workers don't overwrite each other's additions.
+        """
+        if not self._unregistered:
+            return
+
+        token = uuid.uuid4().hex
+        if not self.backend.add(LOCK_KEY, token, timeout=5):
+            return  # try again on the next flush
+        try:
+            known = set(self.backend.get(REGISTRY_KEY) or ())
+            known |= self._unregistered
+            self.backend.set(REGISTRY_KEY, sorted(known), timeout=0)
+            self._registered |= known
+            self._unregistered = set()
+        finally:
+            if self.backend.get(LOCK_KEY) == token:
+                self.backend.delete(LOCK_KEY)
+
+    def collect(self):
+        """
+        :return: new dict of series -> total across all workers
+        """
+        self.flush()
+        if self.backend is None:
+            return dict(self._totals)
+        keys = self.backend.get(REGISTRY_KEY) or []
+        values = self.backend.get_many(*[KEY_PREFIX + key for key in keys])
+        return dict((key, int(value or 0)) for key, value in zip(keys, values))
+
+    def render(self):
+        """
+        :return: str of every metric in Prometheus' text exposition format
+        """
+        values = self.collect()
+        lines = []
+        for name, (kind, description) in sorted(METRICS.items()):
+            lines.append('# HELP %s %s' % (name, description))
+            lines.append('# TYPE %s %s' % (name, kind))
+            if kind == 'counter':
+                for key in sorted(values):
+                    if parse_series(key)[0] == name:
+                        lines.append('%s %d' % (key, values[key]))
+            else:
+                lines.extend(self._render_histogram(name, values))
+        return '\n'.join(lines) + '\n'
+
+    def _render_histogram(self, name, values):
+        label_sets = [parse_series(key)[1] for key in sorted(values)
+                      if parse_series(key)[0] == name + '_count']
+        for labels in label_sets:
+            total = 0
+            for bound in self.buckets + (INF,):
+                total += values.get(series(
+                    name + '_bucket', dict(labels, le=bucket_label(bound))), 0)
+                yield '%s %d' % (series(name + '_bucket',
+                                        dict(labels, le=bucket_label(bound))),
+                                 total)
+            yield '%s %f' % (series(name + '_sum', labels),
+                             values.get(series(name + '_sum', labels), 0)
+                             / float(MICROS))
+            yield '%s %d' % (series(name + '_count', labels),
+                             values.get(series(name + '_count', labels), 0))
+
+
+class CountingCache(object):
+    """
+    Wraps a werkzeug cache and counts hits and misses on `get`.
+    """
+
+    def __init__(self, cache, name='vpr_alexa_stream_cache_total'):
+        self.cache = cache
+        self.name = name
+
+    def get(self, key):
+        value = self.cache.get(key)
+        registry.inc(self.name, {'result': 'miss' if value is None else 'hit'})
+        return value
+
+    def __getattr__(self, attr):
+        return getattr(self.cache, attr)
+
+
+registry = Metrics()
+
+blueprint = Blueprint('metrics', __name__)
+
+
+@blueprint.route('/metrics')
+def metrics():
+    """ Prometheus scrape endpoint. """
+    return Response(registry.render(),
+                    mimetype='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,138 @@
+"""
+AudioPlayer Event Fast Path
+
+Most requests to /ask aren't users talking to the skill, they're AudioPlayer
+lifecycle events (PlaybackStarted, PlaybackStopped, ...) sent while a program
+plays. flask-ask runs each of them through its full dispatch: session and
+stream bookkeeping, argument mapping and response building, just to answer
+with nothing.
+
+PlaybackEvents answers those events before flask-ask sees them. Requests are
+still verified by flask-ask's own checks, then counted and handed to an
+optional handler. Counts are logged as one summary line per interval instead
+of a line per event.
+"""
+import json
+import threading
+import time
+
+from flask import Response, g, request
+
+from vpr_alexa import logger, metrics
+
+EVENTS = frozenset(['AudioPlayer.PlaybackStarted',
+                    'AudioPlayer.PlaybackStopped',
+                    'AudioPlayer.PlaybackNearlyFinished',
+                    'AudioPlayer.PlaybackFinished',
+                    'AudioPlayer.PlaybackFailed'])
+
+# AudioPlayer events can't include speech or cards, an empty response is all
+# Alexa expects back.
+EMPTY_RESPONSE = json.dumps({'version': '1.0', 'response': {}})
+
+SUMMARY_INTERVAL = 60
+
+# Cheap test on the raw body so intent requests aren't parsed twice.
+_MARKER = b'"AudioPlayer.Playback'
+
+
+class EventCounts(object):
+    """
+    Counts events in memory and logs them as a single summary line.
+    """
+
+    def __init__(self, interval=SUMMARY_INTERVAL):
+        """
+        :param interval: seconds between summary log lines
+        """
+        self.interval = interval
+        self.counts = {}
+        self.since = time.time()
+        self._lock = threading.Lock()
+
+    def add(self, event_type, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            self.counts[event_type] = self.counts.get(event_type, 0) + 1
+            if now - self.since < self.interval:
+                return
+            counts, self.counts = self.counts, {}
+            since, self.since = self.since, now
+        self._log(counts, now - since)
+
+    def flush(self, now=None):
+        """
+        Log whatever has been counted so far.
+        :return: dict of event type -> count that was logged
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            counts, self.counts = self.counts, {}
+            since, self.since = self.since, now
+        if counts:
+            self._log(counts, now - since)
+        return counts
+
+    @staticmethod
+    def _log(counts, seconds):
+        logger.info('AudioPlayer events in the last %ds: %s' % (
+            seconds, ', '.join('%s=%d' % (name.split('.')[-1], counts[name])
+                               for name in sorted(counts))))
+
+
+class PlaybackEvents(object):
+    """
+    Answers AudioPlayer lifecycle events ahead of flask-ask's dispatch.
+    """
+
+    def __init__(self, ask, summary_interval=SUMMARY_INTERVAL):
+        """
+        :param ask: flask_ask.Ask whose request verification is used
+        :param summary_interval: seconds between event count log lines
+        """
+        self.ask = ask
+        self.handlers = {}
+        self.counts = EventCounts(summary_interval)
+
+    def handler(self, event_type):
+        """
+        Decorator registering a handler for one event type. Handlers are called
+        with the `request` and `context` dicts of the event and may return a
+        response dict, e.g. to enqueue the next stream. Returning None answers
+        with an empty response.
+        """
+        def register(func):
+            self.handlers[event_type] = func
+            return func
+        return register
+
+    def dispatch(self):
+        """
+        Answer the current request if it's an AudioPlayer event.
+        :return: flask Response, or None to let flask-ask handle the request
+        """
+        if _MARKER not in request.get_data(cache=True):
+            return None
+
+        # Parses and, unless disabled, verifies the request exactly like
+        # flask-ask does for every other request.
+        payload = self.ask._alexa_request(verify=self.ask.ask_verify_requests)
+        event = payload.get('request') or {}
+        event_type = event.get('type')
+        if event_type not in EVENTS:
+            return None
+
+        g.alexa_request_type = event_type
+        self.counts.add(event_type)
+        metrics.registry.inc('vpr_alexa_playback_events_total',
+                             {'event': event_type})
+
+        response = None
+        handle = self.handlers.get(event_type)
+        if handle is not None:
+            response = handle(event, payload.get('context') or {})
+        if response is None:
+            body = EMPTY_RESPONSE
+        else:
+            body = json.dumps({'version': '1.0', 'response': response})
+        return Response(body, mimetype='application/json')
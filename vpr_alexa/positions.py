@@ -0,0 +1,196 @@
+"""
+Podcast Playback Positions
+
+Remembers how far each user got into each podcast episode so it can be resumed
+on any device, even in a new session. Starting another episode doesn't lose
+the place in the last one. Positions come from the PlaybackStarted and
+PlaybackStopped events, which arrive far more often than anyone asks for a
+program. Writes only update an in-memory buffer. A daemon thread in each worker
+moves the buffer to the cache backend in one batch every few seconds.
+
+Podcast stream tokens carry the episode URL (see `token_for`), so an event says
+which episode it's about without looking anything up.
+"""
+import atexit
+import os
+import threading
+import time
+import uuid
+
+from vpr_alexa import logger
+
+KEY_PREFIX = 'vpr_alexa:position:'
+TOKEN_PREFIX = 'podcast:'
+
+FLUSH_INTERVAL = 5
+
+# Forget positions nobody has come back to in a month.
+RETENTION = 30 * 24 * 60 * 60
+
+
+def token_for(url, playlist=None):
+    """
+    :param url: podcast episode URL
+    :param playlist: name of the playlist the episode is playing from, e.g.
+    "briefing", None when it's played on its own
+    :return: new unique stream token identifying the episode
+    """
+    unique = uuid.uuid4().hex
+    if playlist:
+        unique = '%s.%s' % (playlist, unique)
+    return '%s%s:%s' % (TOKEN_PREFIX, unique, url)
+
+
+def url_from_token(token):
+    """
+    :return: episode URL of a token from `token_for`, None for other streams
+    """
+    if token and token.startswith(TOKEN_PREFIX):
+        parts = token[len(TOKEN_PREFIX):].split(':', 1)
+        if len(parts) == 2:
+            return parts[1]
+
+
+def position_key(user_id, url):
+    """
+    :return: cache key of a user's position in an episode
+    """
+    return '%s%s:%s' % (KEY_PREFIX, user_id, url)
+
+
+def playlist_from_token(token):
+    """
+    :return: playlist given to `token_for`, None for other streams
+    """
+    if token and token.startswith(TOKEN_PREFIX):
+        unique = token[len(TOKEN_PREFIX):].split(':', 1)[0]
+        if '.' in unique:
+            return unique.split('.', 1)[0]
+
+
+class PlaybackPositions(object):
+    """
+    Per-user, per-episode positions with write-behind to a werkzeug cache.
+    """
+
+    def __init__(self, backend=None, flush_interval=FLUSH_INTERVAL,
+                 retention=RETENTION):
+        """
+        :param backend: werkzeug cache shared by all workers
+        :param flush_interval: seconds between background flushes
+        :param retention: seconds a saved position is kept
+        """
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self.retention = retention
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pid = None
+
+    def record(self, user_id, token, offset):
+        """
+        Buffer a user's position in the episode a token is playing. Only the
+        latest position per user and episode is kept until the next flush.
+        :param user_id: Alexa userId
+        :param token: stream token from an AudioPlayer event
+        :param offset: offsetInMilliseconds from the event
+        """
+        url = url_from_token(token)
+        if url is None or not user_id:
+            return
+        with self._lock:
+            self._pending[(user_id, url)] = int(offset or 0)
+        self._ensure_flusher()
+
+    def finish(self, user_id, token):
+        """
+        Forget the position of an episode that played to the end.
+        """
+        url = url_from_token(token)
+        if url is None or not user_id:
+            return
+        with self._lock:
+            self._pending[(user_id, url)] = None
+        self._ensure_flusher()
+
+    def offset(self, user_id, url):
+        """
+        :param user_id: Alexa userId
+        :param url: episode URL about to be played
+        :return: saved offset in milliseconds, 0 if the user has no position
+        in that episode
+        """
+        with self._lock:
+            buffered = (user_id, url) in self._pending
+            position = self._pending.get((user_id, url))
+
+        if not buffered and self.backend is not None:
+            try:
+                position = self.backend.get(position_key(user_id, url))
+            except Exception as e:
+                logger.error('Failed to read playback position: %s' % e)
+        return position or 0
+
+    def after_fork(self):
+        """
+        Replace locks a thread of the parent process may have held when it
+        forked. The flusher restarts itself in the child on the next update.
+        """
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def _ensure_flusher(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Freshly forked worker, the parent flushes its own buffer.
+                self._pending.clear()
+            self._pid = os.getpid()
+
+        thread = threading.Thread(target=self._run_flusher,
+                                  name='positions-flusher')
+        thread.daemon = True
+        thread.start()
+        atexit.register(self.flush)
+
+    def _run_flusher(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """
+        Write buffered positions to the backend in one batch.
+        :return: number of positions written
+        """
+        if self.backend is None:
+            return 0
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+
+            updates = dict((position_key(*key), position)
+                           for key, position in pending.items()
+                           if position is not None)
+            finished = [position_key(*key)
+                        for key, position in pending.items()
+                        if position is None]
+            try:
+                if updates:
+                    self.backend.set_many(updates, timeout=self.retention)
+                if finished:
+                    self.backend.delete_many(*finished)
+            except Exception as e:
+                logger.error('Failed to save playback positions: %s' % e)
+                with self._lock:
+                    for key, position in pending.items():
+                        self._pending.setdefault(key, position)
+                return 0
+            return len(pending)
@@ -5,7 +5,14 @@ VPR Programming
 Includes functions for creating VPR Programs and getting latest metadata.
 """
 from collections import namedtuple
-import feedparser
+import os
+from vpr_alexa import logger
+from vpr_alexa.episode_index import EpisodeIndex
+from vpr_alexa.feeds import FeedCache
+from vpr_alexa.resilience import FeedUnavailable
+from vpr_alexa.resolver import ProgramResolver
+from vpr_alexa.schedule import PublishSchedule
+from vpr_alexa.search import EpisodeSearch
 
 Program = namedtuple('Program',
                      ['name', 'title', 'text', 'url',
@@ -13,6 +20,86 @@ Program = namedtuple('Program',
 
 podcasts = {'vermont-edition', 'eye-on-the-sky', 'vpr-news', 'brave-little-state'}
 
+PODCAST_URL = 'https://podcasts.vpr.net/'
+
+# How long (in seconds) each podcast feed is considered fresh. Eye on the Sky
+# and the news publish several times a day, Brave Little State rarely.
+feed_ttls = {'vermont-edition': 15 * 60,
+             'eye-on-the-sky': 10 * 60,
+             'vpr-news': 5 * 60,
+             'brave-little-state': 60 * 60}
+
+# Episodes kept per podcast for continuous playback and Next/Previous.
+EPISODES_KEPT = 10
+
+# Episodes kept per podcast in its compact EpisodeIndex, newest first.
+INDEX_LIMIT = 500
+
+# Compact index of every podcast's back catalogue, rebuilt whenever its feed
+# changes.
+episode_indexes = {}
+
+# Full-text index of every podcast's episodes, added to as feeds change.
+episode_search = EpisodeSearch()
+
+# Release windows learned from each podcast's recent publish times, used by
+# vpr_alexa.refresher to decide when to poll it next.
+publish_schedules = {}
+
+# Bumped whenever any podcast feed changes, for caches built from several
+# feeds like vpr_alexa.briefing.
+feed_generation = 0
+
+
+def _index_feed(url, feed):
+    """
+    FeedCache on_refresh hook, indexing a podcast's episodes before the feed
+    is trimmed to the newest EPISODES_KEPT entries.
+    """
+    global feed_generation
+    if not url.startswith(PODCAST_URL) or 'entries' not in feed:
+        return
+    name = url[len(PODCAST_URL):]
+    feed_generation += 1
+    index = EpisodeIndex.from_entries(feed['entries'], limit=INDEX_LIMIT)
+    episode_indexes[name] = index
+    added = episode_search.add(name, feed)
+    schedule = PublishSchedule(index.published)
+    publish_schedules[name] = schedule
+    logger.info('Indexed %d episodes of %s in %.1f KB, %d new for search, '
+                '%d release windows'
+                % (len(index), name, index.nbytes() / 1024.0, added,
+                   len(schedule.windows)))
+
+
+# The feed cache reads up to INDEX_LIMIT items so every changed feed rebuilds
+# its podcast's episode index, search and schedule. That gives up most of the
+# streaming parser's early exit: on a synthetic 1,000 item feed it's about
+# 14ms and 430 KB read, against 0.3ms and a few KB for the newest item alone
+# (see benchmarks.bench_rss).
+# It's only paid when a feed has changed, unchanged feeds answer conditional
+# GETs with a 304 and aren't parsed at all.
+feed_cache = FeedCache(ttls=dict((PODCAST_URL + name, ttl)
+                                 for name, ttl in feed_ttls.items()),
+                       streaming=True, max_items=INDEX_LIMIT,
+                       keep_items=EPISODES_KEPT, on_refresh=_index_feed)
+
+# Latest episode per podcast, kept warm by vpr_alexa.refresher when it's running.
+latest_episodes = {}
+
+# Newest first episodes of each podcast as (feed, tuple of Program), rebuilt
+# by podcast_episodes() whenever the cached feed changes.
+episode_lists = {}
+
+# Optional vpr_alexa.episodes.SharedEpisodeCache shared by all web workers.
+shared_episodes = None
+
+# Last episode successfully resolved per podcast. Played instead of an error
+# when a feed runs out of time or its circuit breaker is open, and counted in
+# fallback_counts.
+last_good_episodes = {}
+fallback_counts = dict((name, 0) for name in podcasts)
+
 # List of Streaming Programs with metadata.
 radio = Program(name='Vermont Public Radio', title='Vermont Public Radio Live Stream',
                 url='https://vpr.streamguys1.com/vpr96.mp3',
@@ -42,6 +129,27 @@ classical = Program(name='VPR Classical', title='VPR Classical Live Stream',
                large_img='https://s3.amazonaws.com/www.vpr.net/apps/images/classical-logo.png',
                is_podcast=False)
 
+streams = {'radio': radio, 'jazz': jazz, 'classical': classical,
+           'replay': replay}
+
+# Words identifying each program in a spoken name. Near misses like "addition"
+# are left to the resolver's fuzzy matching. When an utterance mentions more
+# than one program the earliest in program_priority wins.
+program_keywords = {'vermont-edition': ['edition'],
+                    'brave-little-state': ['brave'],
+                    'eye-on-the-sky': ['sky', 'weather'],
+                    'jazz': ['jazz'],
+                    'classical': ['classical'],
+                    'replay': ['replay'],
+                    'vpr-news': ['news'],
+                    'radio': ['radio']}
+
+program_priority = ['vermont-edition', 'brave-little-state', 'eye-on-the-sky',
+                    'jazz', 'classical', 'replay', 'vpr-news', 'radio']
+
+SLOT_VALUES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'speech_assets/customSlotTypes/LIST_OF_PROGRAMS')
+
 
 def _filter_links(links, link_type):
     """
@@ -58,35 +166,229 @@ def _filter_links(links, link_type):
 
 def _get_feed(url):
     """
-    Wrapper around Feedparser's parse call. Caching could go here in the future.
+    Fetch a parsed RSS feed through the shared feed cache.
 
     :param url: url to RSS feed to fetch and parse
-    :return: new dict of RSS feed results
+    :return: dict of RSS feed results
+    """
+    return feed_cache.get(url)
+
+
+def _program_from_entry(feed, entry):
+    """
+    Build a Program from one entry of a parsed podcast feed.
+    :param feed: dict of RSS feed results
+    :param entry: dict of one of the feed's entries
+    :return: new Program named tuple with episode metadata
+    """
+    links = list(_filter_links(entry['links'], 'audio/mpeg'))
+    img_url = feed['feed']['image']['href']
+    return Program(name=feed['feed']['title'],
+                   url=links[0]['href'],
+                   title=entry['title'],
+                   text=entry['summary'],
+                   small_img=img_url,
+                   large_img=img_url,
+                   is_podcast=True)
+
+
+def _episode_from_feed(feed):
+    """
+    Build a Program from the newest entry of a parsed podcast feed.
+    :param feed: dict of RSS feed results
+    :return: new Program named tuple with episode metadata
     """
-    return dict(feedparser.parse(url))
+    return _program_from_entry(feed, feed['entries'][0])
+
+
+def _episodes_from_feed(feed):
+    """
+    :param feed: dict of RSS feed results
+    :return: tuple of Programs for the newest playable entries, newest first
+    """
+    episodes = []
+    for entry in feed['entries'][:EPISODES_KEPT]:
+        try:
+            episodes.append(_program_from_entry(feed, entry))
+        except (KeyError, IndexError):
+            continue  # no audio to play
+    return tuple(episodes)
+
+
+def _fetch_podcast_episode(podcast_name):
+    return _episode_from_feed(_get_feed(PODCAST_URL + podcast_name))
+
+
+def _resolve_podcast_episode(podcast_name):
+    if shared_episodes is not None:
+        return shared_episodes.get_or_refresh(
+            podcast_name, lambda: _fetch_podcast_episode(podcast_name))
+    feed = _get_feed(PODCAST_URL + podcast_name)
+    if feed:
+        return _episode_from_feed(feed)
 
 
 def latest_podcast_episode(podcast_name):
     """
     Fetch the latest podcast episode from https://podcasts.vpr.net
+
+    Episodes precomputed by the background refresher are returned straight from
+    memory, then the shared episode cache is tried (when configured) before
+    reading the feed through the feed cache. If the feed can't be fetched in
+    time the last known good episode is returned instead.
     :param podcast_name: url-style name of the podcast, e.g. "vermont-edition"
     :return: new Program named tuple with episode metadata
     """
     if podcast_name in podcasts:
-        feed = _get_feed('https://podcasts.vpr.net/' + podcast_name)
-        if feed:
-            latest = feed['entries'][0]
-            title = latest['title']
-            text = latest['summary']
-            links = list(_filter_links(latest['links'], 'audio/mpeg'))
-            img_url = feed['feed']['image']['href']
-            return Program(name=feed['feed']['title'],
-                           url=links[0]['href'],
-                           title=title,
-                           text=text,
-                           small_img=img_url,
-                           large_img=img_url,
-                           is_podcast=True)
+        episode = latest_episodes.get(podcast_name)
+        if episode is not None:
+            return episode
+
+        try:
+            episode = _resolve_podcast_episode(podcast_name)
+        except FeedUnavailable as e:
+            episode = last_good_episodes.get(podcast_name)
+            if episode is None:
+                raise
+            logger.info('Playing last known good episode of %s: %s'
+                        % (podcast_name, e))
+            fallback_counts[podcast_name] += 1
+            return episode
+
+        if episode is not None:
+            last_good_episodes[podcast_name] = episode
+        return episode
+
+
+def refresh_podcast_episode(podcast_name, force=False):
+    """
+    Fetch a podcast feed now and store its latest episode in memory. With a
+    shared episode cache only one worker fetches the feed for its latest
+    episode, the rest pick up its result. They still read the feed through
+    their own feed cache, a conditional GET once it's past its TTL, for their
+    episode lists, index, search and publish schedule.
+    :param podcast_name: url-style name of the podcast, e.g. "vermont-edition"
+    :param force: refresh even if the shared episode is still fresh, and have
+    every worker send its conditional GET now, e.g. while a new episode is
+    expected
+    :return: new Program named tuple with episode metadata
+    """
+    global feed_generation
+    url = PODCAST_URL + podcast_name
+    fetched = []
+
+    def fetch():
+        entry = feed_cache.refresh(url)
+        fetched.append(entry)
+        return _episode_from_feed(entry.feed)
+
+    if shared_episodes is not None:
+        episode = shared_episodes.get_or_refresh(podcast_name, fetch,
+                                                 force=force)
+        if not fetched:
+            try:
+                if force:
+                    feed_cache.refresh(url)
+                else:
+                    feed_cache.get(url)
+            except FeedUnavailable as e:
+                logger.info('Keeping the episode list of %s as it is: %s'
+                            % (podcast_name, e))
+    else:
+        episode = fetch()
+    changed = latest_episodes.get(podcast_name) != episode
+    latest_episodes[podcast_name] = episode
+    last_good_episodes[podcast_name] = episode
+    if changed:
+        # _index_feed already bumped it when this worker fetched a new feed,
+        # but a briefing may have been built from the old latest episode
+        # since. Workers that took a shared record haven't bumped it at all.
+        feed_generation += 1
+    podcast_episodes(podcast_name)
+    return episode
+
+
+def podcast_episodes(podcast_name):
+    """
+    Recent episodes of a podcast from the feed already in the feed cache. The
+    list is built once per version of the feed and never waits on a fetch.
+    :param podcast_name: url-style name of the podcast, e.g. "vermont-edition"
+    :return: tuple of Programs, newest first, empty if the feed isn't cached
+    """
+    feed = feed_cache.peek(PODCAST_URL + podcast_name)
+    if not feed:
+        return ()
+    cached = episode_lists.get(podcast_name)
+    if cached is not None and cached[0] is feed:
+        return cached[1]
+
+    episodes = tuple(_secure(podcast_name, episode)
+                     for episode in _episodes_from_feed(feed))
+    episode_lists[podcast_name] = (feed, episodes)
+    return episodes
+
+
+def episode_index_footprint():
+    """
+    :return: dict of podcast name -> {'episodes': count, 'bytes': memory used}
+    """
+    return dict((name, {'episodes': len(index), 'bytes': index.nbytes()})
+                for name, index in episode_indexes.items())
+
+
+def adjacent_episode(url, step):
+    """
+    Find the episode `step` places after the one at `url` in its podcast's
+    episode list. Positive steps go back to older episodes.
+    :param url: audio URL of the episode playing now
+    :param step: e.g. 1 for the next (older) episode, -1 for the newer one
+    :return: Program, or None if url isn't a known episode or there's no
+    episode that far along
+    """
+    for name in podcasts:
+        episodes = podcast_episodes(name)
+        for index, episode in enumerate(episodes):
+            if episode.url == url:
+                if 0 <= index + step < len(episodes):
+                    return episodes[index + step]
+                return None
+
+
+def find_episode(query):
+    """
+    Search the titles and summaries of every podcast's episodes.
+    :param query: what the listener asked for, e.g. "maple syrup"
+    :return: Program for the best matching episode, None if nothing matches
+    """
+    results = episode_search.search(query, limit=1)
+    if not results:
+        return None
+    document = results[0].document
+    return _secure(document.podcast,
+                   Program(name=document.name, title=document.title,
+                           text=document.summary, url=document.url,
+                           small_img=document.image, large_img=document.image,
+                           is_podcast=True))
+
+
+def _build_resolver():
+    """
+    Index the keywords above, plus the LIST_OF_PROGRAMS slot values listeners
+    are expected to say as exact aliases.
+    :return: new ProgramResolver
+    """
+    resolver = ProgramResolver(program_keywords, program_priority,
+                               default='radio')
+    if os.path.exists(SLOT_VALUES_PATH):
+        with open(SLOT_VALUES_PATH, 'r') as f:
+            for line in f.readlines():
+                slot = line.strip()
+                if slot:
+                    resolver.add_alias(slot, resolver.resolve(slot).key)
+    return resolver
+
+
+resolver = _build_resolver()
 
 
 def get_program(program_name):
@@ -95,29 +397,19 @@ def get_program(program_name):
     :param program_name: a valid program name (see program_list)
     :return: new Program named tuple
     """
-    if program_name:
-        program_name = program_name.lower()
-    else:
-        program_name = ''
-
-    if 'edition' in program_name or 'addition' in program_name:
-        return latest_podcast_episode('vermont-edition')
-    elif 'brave' in program_name:
-        return latest_podcast_episode('brave-little-state')
-    elif 'sky' in program_name or 'weather' in program_name:
-        eots = latest_podcast_episode('eye-on-the-sky')
-        if str(eots.url).startswith('http://'):
-            # named tuples are immutable, but have a built in _replace method
-            # that lets you create a new instance with modified data.
-            eots = eots._replace(url=str(eots.url).replace('http:', 'https:'))
-        return eots
-    elif 'jazz' in program_name:
-        return jazz
-    elif 'classical' in program_name:
-        return classical
-    elif 'replay' in program_name:
-        return replay
-    elif 'news' in program_name:
-        return latest_podcast_episode('vpr-news')
-    else:
-        return radio
+    key = resolver.resolve(program_name).key
+    if key in streams:
+        return streams[key]
+
+    return _secure(key, latest_podcast_episode(key))
+
+
+def _secure(podcast_name, program):
+    """
+    Alexa only plays https streams, Eye on the Sky's feed still has http links.
+    """
+    if podcast_name == 'eye-on-the-sky' and str(program.url).startswith('http://'):
+        # named tuples are immutable, but have a built in _replace method
+        # that lets you create a new instance with modified data.
+        program = program._replace(url=str(program.url).replace('http:', 'https:'))
+    return program
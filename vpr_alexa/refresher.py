@@ -0,0 +1,219 @@
+"""
+Background Podcast Refresher
+
+Walks every podcast in `programs.podcasts` on an interval and precomputes its
+latest episode, so `programs.get_program` only ever reads memory and no
+listener pays for a slow https://podcasts.vpr.net.
+
+Runs as a daemon thread inside each web worker. Polls are jittered so workers
+don't hit the feeds in lockstep, and a failing feed backs off exponentially
+without holding up the others.
+
+Each feed is polled on its learned publish schedule (see vpr_alexa.schedule):
+every `min_interval` seconds during a release window until the expected
+episode shows up, and otherwise every `interval` seconds, doubling while the
+feed stays quiet up to `max_interval` but never sleeping past its next window.
+The schedules and next poll times are served at /feeds.
+"""
+import atexit
+import random
+import threading
+import time
+
+from flask import Blueprint, jsonify
+
+from vpr_alexa import programs, logger, rss
+
+DEFAULT_INTERVAL = 5 * 60
+DEFAULT_JITTER = 0.1
+RETRY_DELAY = 30
+MAX_BACKOFF = 30 * 60
+MIN_INTERVAL = 60
+MAX_INTERVAL = 60 * 60
+
+# Seconds stop() waits for an in-flight fetch, long enough for its socket
+# timeout to fire.
+STOP_TIMEOUT = rss.DEFAULT_TIMEOUT + 1
+
+# The refresher started by start_refresher() in this process, if any.
+current = None
+
+
+class FeedRefresher(object):
+    """
+    Keeps `programs.latest_episodes` warm for every podcast.
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL, jitter=DEFAULT_JITTER,
+                 retry_delay=RETRY_DELAY, max_backoff=MAX_BACKOFF,
+                 min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL,
+                 podcasts=None):
+        """
+        :param interval: seconds between successful refreshes of a feed
+        :param jitter: fraction of the interval to randomly add or subtract
+        :param retry_delay: seconds before the first retry of a failed feed
+        :param max_backoff: upper bound in seconds on the retry delay
+        :param min_interval: seconds between refreshes while a feed's new
+        episode is expected
+        :param max_interval: upper bound in seconds on the delay of a quiet feed
+        :param podcasts: podcast names to refresh, defaults to programs.podcasts
+        """
+        self.interval = interval
+        self.jitter = jitter
+        self.retry_delay = retry_delay
+        self.max_backoff = max_backoff
+        self.min_interval = min(min_interval, interval)
+        self.max_interval = max(max_interval, interval)
+        self.podcasts = sorted(podcasts or programs.podcasts)
+        self.failures = dict((name, 0) for name in self.podcasts)
+        self.next_due = dict((name, 0) for name in self.podcasts)
+        self.quiet_polls = dict((name, 0) for name in self.podcasts)
+        self._latest_urls = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self._stop_at_exit = False
+
+    def _jittered(self, delay):
+        spread = delay * self.jitter
+        return delay + random.uniform(-spread, spread)
+
+    def backoff(self, failures):
+        """
+        :param failures: number of consecutive failures for a feed
+        :return: seconds to wait before trying that feed again
+        """
+        return min(self.retry_delay * 2 ** (failures - 1), self.max_backoff)
+
+    def poll_delay(self, podcast_name, now):
+        """
+        :return: seconds until a freshly refreshed feed should be polled again,
+        from its publish schedule once one has been learned
+        """
+        schedule = programs.publish_schedules.get(podcast_name)
+        if schedule is None:
+            return self.interval
+        return schedule.poll_delay(now, self.interval, self.min_interval,
+                                   self.max_interval,
+                                   self.quiet_polls[podcast_name])
+
+    def refresh(self, podcast_name, now=None):
+        """
+        Refresh a single podcast and schedule its next poll.
+        :return: True if the refresh succeeded
+        """
+        now = time.time() if now is None else now
+        schedule = programs.publish_schedules.get(podcast_name)
+        try:
+            # While a new episode is expected, skip the shared episode's TTL
+            # so it's looked for on every poll.
+            episode = programs.refresh_podcast_episode(
+                podcast_name, force=bool(schedule and schedule.expecting(now)))
+        except Exception as e:
+            self.failures[podcast_name] += 1
+            delay = self.backoff(self.failures[podcast_name])
+            logger.error('Failed to refresh %s (%d in a row), retrying in %ds: %s'
+                         % (podcast_name, self.failures[podcast_name], delay, e))
+            self.next_due[podcast_name] = now + self._jittered(delay)
+            return False
+
+        self.failures[podcast_name] = 0
+        url = getattr(episode, 'url', None)
+        if url == self._latest_urls.get(podcast_name):
+            self.quiet_polls[podcast_name] += 1
+        else:
+            self.quiet_polls[podcast_name] = 0
+            self._latest_urls[podcast_name] = url
+        self.next_due[podcast_name] = now + self._jittered(
+            self.poll_delay(podcast_name, now))
+        return True
+
+    def refresh_due(self, now=None):
+        """
+        Refresh every podcast whose next poll time has passed.
+        :return: seconds until the next podcast is due
+        """
+        now = time.time() if now is None else now
+        for name in self.podcasts:
+            if self._stop.is_set():
+                break
+            if self.next_due[name] <= now:
+                self.refresh(name, now)
+        return max(0, min(self.next_due.values()) - time.time())
+
+    def status(self, now=None):
+        """
+        :return: dict of podcast name -> next poll time, failures, quiet polls
+        and learned publish schedule
+        """
+        now = time.time() if now is None else now
+        feeds = {}
+        for name in self.podcasts:
+            schedule = programs.publish_schedules.get(name)
+            feeds[name] = {
+                'next_poll': self.next_due[name],
+                'next_poll_in': max(0, round(self.next_due[name] - now, 1)),
+                'failures': self.failures[name],
+                'quiet_polls': self.quiet_polls[name],
+                'expecting_episode': bool(schedule and schedule.expecting(now)),
+                'schedule': schedule.describe() if schedule else None}
+        return feeds
+
+    def run(self):
+        logger.info('Feed refresher started (interval: %ds)' % self.interval)
+        while not self._stop.is_set():
+            self._stop.wait(self.refresh_due())
+        logger.info('Feed refresher stopped')
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name='feed-refresher')
+        self._thread.daemon = True
+        self._thread.start()
+        if not self._stop_at_exit:
+            atexit.register(self.stop)
+            self._stop_at_exit = True
+        return self
+
+    def stop(self, timeout=STOP_TIMEOUT):
+        """
+        Ask the refresher to exit and wait for any in-flight fetch to finish.
+        A fetch still running after `timeout` seconds is abandoned along with
+        the daemon thread.
+        """
+        self._stop.set()
+        if self._thread is not None and \
+                self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        self._thread = None
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+
+def start_refresher(interval=DEFAULT_INTERVAL):
+    """
+    Start a background refresher for all podcasts.
+    :param interval: seconds between refreshes, 0 disables the refresher
+    :return: running FeedRefresher or None when disabled
+    """
+    global current
+    if not interval:
+        logger.info('!!! Background feed refresher disabled')
+        return None
+    current = FeedRefresher(interval=interval).start()
+    return current
+
+
+blueprint = Blueprint('refresher', __name__)
+
+
+@blueprint.route('/feeds')
+def feeds():
+    """ Learned publish schedules and next poll time of every podcast. """
+    if current is None:
+        return jsonify(running=False, feeds=dict(
+            (name, {'schedule': schedule.describe()})
+            for name, schedule in programs.publish_schedules.items()))
+    return jsonify(running=current.is_running(), feeds=current.status())
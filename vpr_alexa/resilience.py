@@ -0,0 +1,148 @@
+"""
+Request Deadlines and Circuit Breakers
+
+Alexa gives a skill 8 seconds to answer. Each request carries a Deadline
+derived from that, and feed fetches stop once it runs out instead of blocking
+the worker. A CircuitBreaker per feed stops calling a feed that keeps failing
+until it has had time to recover.
+"""
+import threading
+import time
+
+ALEXA_DEADLINE = 8.0
+RESPONSE_MARGIN = 1.5
+DEFAULT_BUDGET = ALEXA_DEADLINE - RESPONSE_MARGIN
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class FeedUnavailable(Exception):
+    """ A feed couldn't be fetched in time or is being skipped. """
+
+
+class DeadlineExceeded(FeedUnavailable):
+    """ The request ran out of its latency budget. """
+
+
+class CircuitOpen(FeedUnavailable):
+    """ The feed's circuit breaker is open, so it wasn't called. """
+
+
+class Deadline(object):
+    """
+    A point in time work for the current request must finish by.
+    """
+
+    def __init__(self, budget=DEFAULT_BUDGET, start=None):
+        """
+        :param budget: seconds available from `start`
+        :param start: time the request started, defaults to now
+        """
+        self.expires_at = (time.time() if start is None else start) + budget
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.time())
+
+    def expired(self):
+        return time.time() >= self.expires_at
+
+    def check(self):
+        """
+        :raise DeadlineExceeded: if the deadline has passed
+        """
+        if self.expired():
+            raise DeadlineExceeded('Request deadline exceeded')
+
+
+_local = threading.local()
+
+
+def start_request(budget=DEFAULT_BUDGET, start=None):
+    """
+    Give the current thread's request a fresh deadline.
+    :param budget: seconds the request has
+    :param start: time the request arrived, defaults to now
+    :return: the new Deadline
+    """
+    _local.deadline = Deadline(budget, start)
+    return _local.deadline
+
+
+def share_deadline(deadline):
+    """
+    Hold the current thread to another thread's deadline, e.g. for work a
+    request hands off to helper threads.
+    :param deadline: Deadline of the request being helped
+    """
+    _local.deadline = deadline
+
+
+def end_request():
+    _local.deadline = None
+
+
+def current_deadline():
+    """
+    :return: Deadline for the current thread's request, or None outside of one
+    """
+    return getattr(_local, 'deadline', None)
+
+
+class CircuitBreaker(object):
+    """
+    Classic closed/open/half-open breaker. After `threshold` consecutive
+    failures it opens and rejects calls for `reset_timeout` seconds, then lets
+    a single trial call through to decide whether to close again.
+    """
+
+    def __init__(self, threshold=3, reset_timeout=60):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return CLOSED
+        if time.time() - self.opened_at >= self.reset_timeout:
+            return HALF_OPEN
+        return OPEN
+
+    def before_call(self):
+        """
+        :raise CircuitOpen: if the call shouldn't be made
+        """
+        with self._lock:
+            state = self.state
+            if state == OPEN or (state == HALF_OPEN and self.trial_running):
+                raise CircuitOpen('Circuit open')
+            if state == HALF_OPEN:
+                self.trial_running = True
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.opened_at is not None or self.failures >= self.threshold:
+                self.opened_at = time.time()
+
+    def call(self, func, *args, **kwargs):
+        self.before_call()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self.failure()
+            raise
+        self.success()
+        return result
@@ -0,0 +1,140 @@
+"""
+Program Name Resolver
+
+Turns whatever Alexa heard for the ProgramName slot into a program key using a
+precomputed index instead of a chain of substring checks. For a catalogue this
+small the index isn't faster than the chain was (see benchmarks.bench_resolver),
+it's here for fuzzy matching and confidence scores.
+
+Resolution tries, in order:
+
+1. an exact lookup of the normalized phrase in the alias index
+2. a lookup of each word in the keyword index, ties going to the program
+   listed first in `priority`
+3. bounded fuzzy matching of each word against the keyword vocabulary, for
+   near-miss speech recognition like "clasical"
+
+Every result carries a confidence score between 0 and 1.
+"""
+from collections import namedtuple
+import difflib
+import re
+
+Match = namedtuple('Match', ['key', 'confidence', 'method'])
+
+# Words that carry no meaning for picking a program.
+STOP_WORDS = frozenset(['a', 'an', 'the', 'to', 'on', 'play', 'listen',
+                        'latest', 'stream', 'live', 'please', 'vpr', 'v', 'p',
+                        'r', 'vermont', 'vermonts', 'public'])
+
+KEYWORD_CONFIDENCE = 0.9
+FUZZY_CONFIDENCE = 0.8
+FUZZY_CUTOFF = 0.75
+MAX_FUZZY_WORDS = 8
+MAX_FUZZY_MEMO = 4096
+
+_non_word = re.compile(r"[^a-z0-9 ]+")
+
+
+def normalize(utterance):
+    """
+    :param utterance: raw slot value
+    :return: lowercased phrase with punctuation removed and spaces collapsed
+    """
+    return ' '.join(_non_word.sub(' ', (utterance or '').lower()).split())
+
+
+class ProgramResolver(object):
+    """
+    Alias and keyword indexes for resolving program names.
+    """
+
+    def __init__(self, keywords, priority, default, aliases=None):
+        """
+        :param keywords: dict of program key -> words that identify it
+        :param priority: program keys, earlier ones win keyword ties
+        :param default: program key used when nothing matches
+        :param aliases: dict of full phrase -> program key
+        """
+        self.priority = dict((key, rank) for rank, key in enumerate(priority))
+        self.default = default
+        self.keywords = {}
+        for key, words in keywords.items():
+            for word in words:
+                self.keywords[normalize(word)] = key
+        # Words too different in length can't reach FUZZY_CUTOFF, so fuzzy
+        # matching only compares against keywords of a similar length.
+        self.by_length = {}
+        for word in self.keywords:
+            self.by_length.setdefault(len(word), []).append(word)
+        self._fuzzy_memo = {}
+        self.aliases = {}
+        for phrase, key in (aliases or {}).items():
+            self.add_alias(phrase, key)
+
+    def add_alias(self, phrase, key):
+        self.aliases[normalize(phrase)] = key
+
+    def _by_keyword(self, words):
+        found = [self.keywords[word] for word in words if word in self.keywords]
+        if found:
+            return min(found, key=self.priority.get)
+
+    def _candidates(self, word):
+        # ratio = 2 * matches / (len(a) + len(b)) can't reach the cutoff once
+        # the lengths differ by more than this.
+        slack = int(len(word) * (1 - FUZZY_CUTOFF) / FUZZY_CUTOFF) + 1
+        for length in range(len(word) - slack, len(word) + slack + 1):
+            for candidate in self.by_length.get(length, ()):
+                yield candidate
+
+    def _closest_keyword(self, word):
+        if word in self._fuzzy_memo:
+            return self._fuzzy_memo[word]
+
+        best = None
+        matcher = difflib.SequenceMatcher(b=word)
+        for candidate in self._candidates(word):
+            matcher.set_seq1(candidate)
+            if matcher.real_quick_ratio() < FUZZY_CUTOFF or \
+                    matcher.quick_ratio() < FUZZY_CUTOFF:
+                continue
+            ratio = matcher.ratio()
+            if ratio >= FUZZY_CUTOFF and (best is None or ratio > best[1]):
+                best = (candidate, ratio)
+
+        if len(self._fuzzy_memo) >= MAX_FUZZY_MEMO:
+            self._fuzzy_memo.clear()
+        self._fuzzy_memo[word] = best
+        return best
+
+    def _by_fuzzy_keyword(self, words):
+        best = None
+        for word in words[:MAX_FUZZY_WORDS]:
+            if len(word) < 4:
+                continue
+            close = self._closest_keyword(word)
+            if close is not None and (best is None or close[1] > best[1]):
+                best = (self.keywords[close[0]], close[1])
+        return best
+
+    def resolve(self, utterance):
+        """
+        :param utterance: raw ProgramName slot value
+        :return: Match of program key, confidence and how it matched
+        """
+        phrase = normalize(utterance)
+        if phrase in self.aliases:
+            return Match(self.aliases[phrase], 1.0, 'alias')
+
+        words = [word for word in phrase.split() if word not in STOP_WORDS]
+        key = self._by_keyword(words)
+        if key is not None:
+            return Match(key, KEYWORD_CONFIDENCE, 'keyword')
+
+        fuzzy = self._by_fuzzy_keyword(words)
+        if fuzzy is not None:
+            return Match(fuzzy[0], round(FUZZY_CONFIDENCE * fuzzy[1], 3),
+                         'fuzzy')
+
+        return Match(self.default, 0.0, 'default')
@@ -0,0 +1,76 @@
+"""
+Pre-serialized Responses
+
+Several responses never change between requests: the live stream plays and the
+welcome, program list and help prompts. Rather than render templates, build
+directives and cards and serialize JSON through flask-ask every time, they're
+serialized once at startup. Requests get the ready JSON with only their own
+fields (like the AudioPlayer token) spliced in.
+"""
+import json
+import re
+
+FIELD = '@@vpr_alexa:%s@@'
+_field = re.compile('"' + FIELD % '([a-z_]+)' + '"')
+
+
+class PreparedResponse(object):
+    """
+    A response serialized once, with named placeholders for the fields that
+    change per request. Session attributes are always a placeholder.
+    """
+
+    def __init__(self, response):
+        """
+        :param response: dict for the 'response' part of an Alexa reply. Use
+        field(name) for values that are filled in per request.
+        """
+        body = json.dumps({'version': '1.0',
+                           'response': response,
+                           'sessionAttributes': field('session_attributes')},
+                          sort_keys=True)
+        pieces = _field.split(body)
+        self.parts = pieces[0::2]
+        self.fields = pieces[1::2]
+
+    def render(self, **values):
+        """
+        :param values: JSON-serializable value for every placeholder
+        :return: str of the full JSON response
+        """
+        out = [self.parts[0]]
+        for name, part in zip(self.fields, self.parts[1:]):
+            out.append(json.dumps(values[name]))
+            out.append(part)
+        return ''.join(out)
+
+
+def field(name):
+    """
+    :return: placeholder value for a per-request field
+    """
+    return FIELD % name
+
+
+def play_directive(url, token, offset=0):
+    """
+    :return: new AudioPlayer.Play directive replacing anything playing
+    """
+    return {'type': 'AudioPlayer.Play',
+            'playBehavior': 'REPLACE_ALL',
+            'audioItem': {'stream': {'url': url,
+                                     'token': token,
+                                     'offsetInMilliseconds': offset}}}
+
+
+def enqueue_directive(url, token, previous_token, offset=0):
+    """
+    :return: new AudioPlayer.Play directive queueing a stream after the one
+    playing `previous_token`
+    """
+    return {'type': 'AudioPlayer.Play',
+            'playBehavior': 'ENQUEUE',
+            'audioItem': {'stream': {'url': url,
+                                     'token': token,
+                                     'expectedPreviousToken': previous_token,
+                                     'offsetInMilliseconds': offset}}}
@@ -0,0 +1,269 @@
+"""
+Streaming RSS Parser
+
+`programs.latest_podcast_episode` only needs the channel title and image plus
+the newest `<item>`, but VPR's feeds carry years of episodes. This parser walks
+the XML incrementally as it's read and stops as soon as it has the channel
+metadata and the requested number of items.
+
+Results are shaped like Feedparser's so the rest of the code can use either.
+"""
+import io
+from xml.etree import ElementTree
+
+import six
+from six.moves.urllib.error import HTTPError
+from six.moves.urllib.request import Request, urlopen
+
+DEFAULT_TIMEOUT = 10
+
+ITUNES = '{http://www.itunes.com/dtds/podcast-1.0.dtd}'
+
+
+class RSSParseError(Exception):
+    """
+    Raised when a document can't be read as an RSS feed. When raised by
+    `fetch`, `response` is a dict of the whole 'document' as bytes plus the
+    response's 'status', 'etag' and 'modified', so it can be parsed again
+    without fetching it twice.
+    """
+    response = None
+
+
+def _text(elem):
+    return (elem.text or '').strip()
+
+
+class _FeedBuilder(object):
+    """ Collects channel metadata and items from parser events. """
+
+    def __init__(self, max_items):
+        self.max_items = max_items
+        self.feed = {}
+        self.entries = []
+        self.entry = None
+        self.path = []
+
+    def done(self):
+        return self.max_items is not None and \
+            len(self.entries) >= self.max_items and \
+            'title' in self.feed and 'image' in self.feed
+
+    def start(self, elem):
+        self.path.append(elem.tag)
+        if elem.tag == 'item':
+            self.entry = {'links': []}
+
+    def end(self, elem):
+        tag = self.path.pop()
+        parent = self.path[-1] if self.path else None
+
+        if self.entry is not None:
+            if tag == 'item':
+                self.entry.setdefault('title', '')
+                self.entry.setdefault('summary', '')
+                self.entries.append(self.entry)
+                self.entry = None
+            elif parent == 'item':
+                self._item_field(tag, elem)
+        elif parent == 'channel':
+            if tag == 'title':
+                self.feed['title'] = _text(elem)
+            elif tag == ITUNES + 'image' and elem.get('href'):
+                self.feed['image'] = {'href': elem.get('href')}
+            elif tag == 'link':
+                self.feed['link'] = _text(elem)
+        elif parent == 'image' and tag == 'url':
+            self.feed.setdefault('image', {'href': _text(elem)})
+
+        # Finished elements aren't needed anymore, keep memory flat.
+        if tag != 'channel':
+            elem.clear()
+
+    def _item_field(self, tag, elem):
+        entry = self.entry
+        if tag == 'title':
+            entry['title'] = _text(elem)
+        elif tag == 'description':
+            entry['summary'] = _text(elem)
+        elif tag == ITUNES + 'summary':
+            entry.setdefault('summary', _text(elem))
+        elif tag == 'link':
+            entry['link'] = _text(elem)
+            entry['links'].append({'rel': 'alternate', 'type': 'text/html',
+                                   'href': _text(elem)})
+        elif tag == 'enclosure':
+            link = {'rel': 'enclosure', 'href': elem.get('url', '')}
+            if elem.get('type'):
+                link['type'] = elem.get('type')
+            if elem.get('length'):
+                link['length'] = elem.get('length')
+            entry['links'].append(link)
+        elif tag == 'pubDate':
+            entry['published'] = _text(elem)
+        elif tag == 'guid':
+            entry['id'] = _text(elem)
+        elif tag == ITUNES + 'duration':
+            entry['itunes_duration'] = _text(elem)
+
+    def result(self):
+        return {'feed': self.feed, 'entries': self.entries}
+
+
+def parse(source, max_items=1):
+    """
+    Incrementally parse an RSS document, stopping once the channel metadata and
+    `max_items` items have been read.
+    :param source: file-like object or bytes/str of RSS XML
+    :param max_items: number of items to read, None reads them all
+    :return: new dict shaped like Feedparser's results ('feed' and 'entries')
+    """
+    if isinstance(source, six.text_type):
+        source = source.encode('utf-8')
+    if isinstance(source, six.binary_type):
+        source = io.BytesIO(source)
+
+    builder = _FeedBuilder(max_items)
+    try:
+        for event, elem in ElementTree.iterparse(source, events=('start', 'end')):
+            if event == 'start':
+                builder.start(elem)
+            else:
+                builder.end(elem)
+                if builder.done():
+                    break
+    except ElementTree.ParseError as e:
+        raise RSSParseError(str(e))
+
+    if 'title' not in builder.feed:
+        raise RSSParseError('No RSS channel found')
+    return builder.result()
+
+
+class FeedParser(object):
+    """
+    Push version of `parse` for bytes arriving a chunk at a time, e.g. from a
+    non-blocking socket. Python 3 only.
+    """
+
+    def __init__(self, max_items=1):
+        """
+        :param max_items: number of items to read, None reads them all
+        """
+        self._parser = ElementTree.XMLPullParser(events=('start', 'end'))
+        self._builder = _FeedBuilder(max_items)
+        self.done = False
+
+    def feed(self, data):
+        """
+        :param data: next bytes of the RSS document
+        :return: True once enough of the document has been read
+        """
+        try:
+            self._parser.feed(data)
+            for event, elem in self._parser.read_events():
+                if event == 'start':
+                    self._builder.start(elem)
+                else:
+                    self._builder.end(elem)
+                    if self._builder.done():
+                        self.done = True
+                        break
+        except ElementTree.ParseError as e:
+            raise RSSParseError(str(e))
+        return self.done
+
+    def result(self):
+        """
+        :return: new dict shaped like Feedparser's results
+        """
+        if not self.done:
+            try:
+                self._parser.close()
+            except ElementTree.ParseError as e:
+                raise RSSParseError(str(e))
+        if 'title' not in self._builder.feed:
+            raise RSSParseError('No RSS channel found')
+        return self._builder.result()
+
+
+class _RecordingReader(object):
+    """ File-like wrapper that keeps a copy of everything read through it. """
+
+    def __init__(self, source):
+        self.source = source
+        self.chunks = []
+
+    def read(self, size=-1):
+        data = self.source.read(size)
+        self.chunks.append(data)
+        return data
+
+    def read_all(self, chunk_size=64 * 1024):
+        """
+        :return: bytes read so far plus the rest of the source
+        """
+        while self.read(chunk_size):
+            pass
+        return b''.join(self.chunks)
+
+
+class _DeadlineReader(object):
+    """ File-like wrapper that stops reading once a deadline has passed. """
+
+    def __init__(self, response, deadline):
+        self.response = response
+        self.deadline = deadline
+
+    def read(self, size=-1):
+        self.deadline.check()
+        return self.response.read(size)
+
+
+def fetch(url, etag=None, modified=None, max_items=1, timeout=DEFAULT_TIMEOUT,
+          deadline=None):
+    """
+    Fetch and stream-parse an RSS feed with a conditional GET. The connection is
+    closed as soon as enough of the document has been read.
+    :param url: url to RSS feed
+    :param etag: ETag from a previous fetch
+    :param modified: Last-Modified from a previous fetch
+    :param max_items: number of items to read, None reads them all
+    :param timeout: socket timeout in seconds
+    :param deadline: optional resilience.Deadline, reading stops when it passes
+    :return: new dict shaped like Feedparser's results, including 'status',
+    'etag' and 'modified'. A 304 response has no 'feed' or 'entries'.
+    :raises RSSParseError: with the whole document attached, see RSSParseError
+    """
+    request = Request(url)
+    if etag:
+        request.add_header('If-None-Match', etag)
+    if modified:
+        request.add_header('If-Modified-Since', modified)
+
+    if deadline is not None:
+        deadline.check()
+        timeout = min(timeout, deadline.remaining())
+
+    try:
+        response = urlopen(request, timeout=timeout)
+    except HTTPError as e:
+        if e.code == 304:
+            return {'status': 304, 'etag': etag, 'modified': modified}
+        raise
+
+    try:
+        source = _RecordingReader(response if deadline is None
+                                  else _DeadlineReader(response, deadline))
+        headers = {'status': response.getcode(),
+                   'etag': response.headers.get('ETag'),
+                   'modified': response.headers.get('Last-Modified')}
+        try:
+            result = parse(source, max_items=max_items)
+        except RSSParseError as e:
+            e.response = dict(headers, document=source.read_all())
+            raise
+        result.update(headers)
+        return result
+    finally:
+        response.close()
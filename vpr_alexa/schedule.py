@@ -0,0 +1,135 @@
+"""
+Podcast Publish Schedules
+
+VPR's podcasts publish on habits: Vermont Edition around the same hour every
+weekday, Eye on the Sky a few times a day, Brave Little State whenever an
+episode is done. PublishSchedule learns a feed's habits from the publish times
+of its recent episodes so the refresher can poll often around the hours an
+episode is expected, and rarely otherwise.
+
+A week is split into hour-long slots (in UTC). Any slot at least
+`min_episodes` recent episodes were published in is a release window.
+"""
+HOUR = 60 * 60
+DAY = 24 * HOUR
+WEEK = 7 * DAY
+
+# The epoch was a Thursday, slots count from the Monday after it.
+MONDAY = 4 * DAY
+
+HISTORY = 8 * WEEK
+MIN_EPISODES = 2
+LEAD = 10 * 60
+
+DAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+
+
+def slot_of(timestamp):
+    """
+    :param timestamp: seconds since the epoch
+    :return: hour of the week in UTC, 0 for Monday 00:00-01:00
+    """
+    return int((timestamp - MONDAY) % WEEK // HOUR)
+
+
+def slot_name(slot):
+    """
+    :return: e.g. "Mon 16:00 UTC"
+    """
+    return '%s %02d:00 UTC' % (DAYS[slot // 24], slot % 24)
+
+
+class PublishSchedule(object):
+    """
+    Release windows of one podcast, learned from its episodes' publish times.
+    """
+    __slots__ = ('windows', 'episodes', 'last_published', 'mean_gap', 'lead')
+
+    def __init__(self, published, history=HISTORY, min_episodes=MIN_EPISODES,
+                 lead=LEAD):
+        """
+        :param published: publish times of the podcast's episodes in seconds
+        since the epoch, in any order, 0 for unknown
+        :param history: only episodes this many seconds older than the newest
+        one or newer are learned from
+        :param min_episodes: episodes in an hour of the week making it a
+        release window
+        :param lead: seconds before a window that it's polled as if it had
+        started, for clocks and publishing running early
+        """
+        published = sorted(t for t in published if t > 0)
+        self.last_published = published[-1] if published else 0
+        published = [t for t in published
+                     if t >= self.last_published - history]
+        self.episodes = len(published)
+        self.mean_gap = ((published[-1] - published[0]) / (len(published) - 1)
+                         if len(published) > 1 else None)
+        self.lead = lead
+
+        counts = {}
+        for t in published:
+            slot = slot_of(t)
+            counts[slot] = counts.get(slot, 0) + 1
+        self.windows = frozenset(slot for slot, count in counts.items()
+                                 if count >= min_episodes)
+
+    def window_start(self, now):
+        """
+        :param now: seconds since the epoch
+        :return: start of the window `now` falls in, counting `lead` seconds
+        before it, or None outside of windows
+        """
+        for moment in (now, now + self.lead):
+            if slot_of(moment) in self.windows:
+                return moment - (moment - MONDAY) % HOUR
+        return None
+
+    def expecting(self, now):
+        """
+        :return: True if `now` is in a window the feed hasn't published in yet
+        """
+        start = self.window_start(now)
+        return start is not None and self.last_published < start - self.lead
+
+    def next_window(self, now):
+        """
+        :return: start of the next window after the current hour, less `lead`,
+        or None when there are no windows
+        """
+        if not self.windows:
+            return None
+        hour = now - (now - MONDAY) % HOUR
+        for hours in range(1, 24 * 7 + 1):
+            start = hour + hours * HOUR
+            if slot_of(start) in self.windows:
+                return start - self.lead
+        return None
+
+    def poll_delay(self, now, interval, min_interval, max_interval,
+                   quiet_polls=0):
+        """
+        :param now: seconds since the epoch
+        :param interval: seconds between polls of a feed with nothing expected
+        :param min_interval: seconds between polls in a release window
+        :param max_interval: longest wait between polls of a quiet feed
+        :param quiet_polls: polls in a row that found no new episode, each
+        doubling the wait outside of windows
+        :return: seconds until the feed should be polled again
+        """
+        if self.expecting(now):
+            return min_interval
+        delay = min(interval * 2 ** quiet_polls, max(interval, max_interval))
+        upcoming = self.next_window(now)
+        if upcoming is not None:
+            delay = min(delay, max(upcoming - now, min_interval))
+        return delay
+
+    def describe(self):
+        """
+        :return: dict summarizing the schedule, for /feeds
+        """
+        return {'episodes': self.episodes,
+                'last_published': self.last_published or None,
+                'mean_gap_hours': (round(self.mean_gap / HOUR, 1)
+                                   if self.mean_gap is not None else None),
+                'windows': [slot_name(slot) for slot in sorted(self.windows)]}
@@ -0,0 +1,167 @@
+"""
+Episode Search
+
+An inverted index over the titles and summaries of every podcast's episodes,
+for requests like "the Vermont Edition about maple syrup".
+
+Entries are added as feeds are refreshed. Episodes already in the index are
+skipped by URL, so a refresh only costs the work of its new entries and the
+index is never rebuilt. Each podcast keeps at most `max_documents` episodes,
+the oldest are dropped from their postings as new ones arrive.
+
+Queries are ranked by TF-IDF, title words weighing more than summary words.
+The rarest query terms are scored first and scoring stops after
+`max_postings` postings, which keeps each lookup's cost bounded no matter how
+common the other words are.
+"""
+from collections import namedtuple
+import heapq
+import itertools
+import math
+import threading
+
+from vpr_alexa.episode_index import audio_url, parse_published
+from vpr_alexa.resolver import normalize
+
+# Words that say nothing about what an episode is about.
+STOP_WORDS = frozenset([
+    'a', 'about', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'episode',
+    'episodes', 'find', 'for', 'from', 'in', 'is', 'it', 'its', 'listen',
+    'me', 'of', 'on', 'one', 'or', 'play', 'please', 'show', 'that', 'the',
+    'this', 'to', 'was', 'with'])
+
+TITLE_WEIGHT = 3
+NAME_WEIGHT = 2
+SUMMARY_WEIGHT = 1
+
+MAX_DOCUMENTS = 2000
+MAX_POSTINGS = 20000
+MAX_SUMMARY = 300
+
+Document = namedtuple('Document', ['podcast', 'name', 'title', 'summary',
+                                   'url', 'image', 'published', 'terms'])
+
+SearchResult = namedtuple('SearchResult', ['document', 'score'])
+
+
+def terms(text):
+    """
+    :param text: title, summary or query
+    :return: list of index terms, lowercased, without stop words and with a
+    plural "s" removed
+    """
+    found = []
+    for word in normalize(text).split():
+        if word in STOP_WORDS:
+            continue
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        found.append(word)
+    return found
+
+
+class EpisodeSearch(object):
+    """
+    Incrementally updated inverted index of podcast episodes.
+    """
+
+    def __init__(self, max_documents=MAX_DOCUMENTS, max_postings=MAX_POSTINGS):
+        """
+        :param max_documents: episodes kept per podcast
+        :param max_postings: postings scored per query at most
+        """
+        self.max_documents = max_documents
+        self.max_postings = max_postings
+        self.documents = {}
+        self.postings = {}
+        self._by_url = {}
+        self._by_podcast = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.documents)
+
+    def add(self, podcast, feed):
+        """
+        Index the entries of a feed that aren't indexed yet.
+        :param podcast: url-style podcast name, e.g. "vermont-edition"
+        :param feed: dict of RSS feed results, newest entries first
+        :return: number of episodes added
+        """
+        channel = feed.get('feed') or {}
+        name = channel.get('title', '')
+        image = (channel.get('image') or {}).get('href')
+        name_terms = terms(name)
+
+        added = 0
+        # Oldest first, so each podcast's ids are in publish order for eviction.
+        for entry in reversed(feed.get('entries') or []):
+            url = audio_url(entry)
+            if url is None or url in self._by_url:
+                continue
+
+            weights = {}
+            for words, weight in ((terms(entry.get('title', '')), TITLE_WEIGHT),
+                                  (name_terms, NAME_WEIGHT),
+                                  (terms(entry.get('summary', '')),
+                                   SUMMARY_WEIGHT)):
+                for word in words:
+                    weights[word] = weights.get(word, 0) + weight
+            document = Document(
+                podcast=podcast, name=name, title=entry.get('title', ''),
+                summary=entry.get('summary', '')[:MAX_SUMMARY], url=url,
+                image=image,
+                published=parse_published(entry.get('published')),
+                terms=tuple(weights))
+
+            with self._lock:
+                doc_id = next(self._ids)
+                self.documents[doc_id] = document
+                self._by_url[url] = doc_id
+                self._by_podcast.setdefault(podcast, []).append(doc_id)
+                for word, weight in weights.items():
+                    self.postings.setdefault(word, {})[doc_id] = weight
+            added += 1
+
+        with self._lock:
+            ids = self._by_podcast.get(podcast, [])
+            while len(ids) > self.max_documents:
+                self._remove(ids.pop(0))
+        return added
+
+    def _remove(self, doc_id):
+        document = self.documents.pop(doc_id)
+        del self._by_url[document.url]
+        for word in document.terms:
+            posting = self.postings[word]
+            del posting[doc_id]
+            if not posting:
+                del self.postings[word]
+
+    def search(self, query, limit=3):
+        """
+        :param query: what the listener asked for
+        :param limit: most results to return
+        :return: list of SearchResult, best first
+        """
+        words = set(terms(query))
+        scores = {}
+        with self._lock:
+            total = float(len(self.documents))
+            postings = sorted((self.postings[word] for word in words
+                               if word in self.postings), key=len)
+            budget = self.max_postings
+            for posting in postings:
+                idf = math.log(1 + total / len(posting))
+                for doc_id, weight in itertools.islice(posting.items(), budget):
+                    scores[doc_id] = scores.get(doc_id, 0) + idf * weight
+                budget -= len(posting)
+                if budget <= 0:
+                    break
+
+            best = heapq.nlargest(
+                limit, scores.items(),
+                key=lambda item: (item[1], self.documents[item[0]].published))
+            return [SearchResult(self.documents[doc_id], score)
+                    for doc_id, score in best]
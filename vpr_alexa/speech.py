@@ -0,0 +1,135 @@
+"""
+Precompiled Speech Templates
+
+flask-ask loads templates.yaml and Jinja renders each template, including any
+nested `{% include %}`, on every request. SpeechTemplates compiles them all up
+front instead, with includes inlined so they cost nothing at request time.
+
+Templates without parameters are rendered once and memoized. Parameterized ones
+(like play_podcast) are cached by their arguments in a bounded LRU.
+"""
+from collections import OrderedDict
+import os
+import re
+import threading
+
+from jinja2 import Environment, meta
+import six
+import yaml
+
+DEFAULT_MAX_CACHED = 256
+
+_include = re.compile(r"""{%-?\s*include\s+['"]([^'"]+)['"]\s*-?%}""")
+
+
+class SpeechTemplates(object):
+    """
+    Compiled templates from a flask-ask style templates.yaml.
+    """
+
+    def __init__(self, path=None, max_cached=DEFAULT_MAX_CACHED,
+                 auto_reload=False):
+        """
+        :param path: path to templates.yaml
+        :param max_cached: rendered parameterized templates to keep
+        :param auto_reload: recompile when the file changes (debug mode)
+        """
+        self.path = path
+        self.max_cached = max_cached
+        self.auto_reload = auto_reload
+        self.environment = Environment()
+        self.compiled = {}
+        self.parameters = {}
+        self.mtime = None
+        self._static = {}
+        self._rendered = OrderedDict()
+        self._lock = threading.Lock()
+        if path is not None:
+            self.load(path, auto_reload)
+
+    def load(self, path=None, auto_reload=None):
+        """
+        Read and compile every template in the YAML file.
+        """
+        if path is not None:
+            self.path = path
+        if auto_reload is not None:
+            self.auto_reload = auto_reload
+
+        with open(self.path, 'r') as f:
+            sources = yaml.safe_load(f.read()) or {}
+        inlined = dict((name, inline_includes(name, sources))
+                       for name in sources)
+        compiled = dict((name, self.environment.from_string(source))
+                        for name, source in inlined.items())
+        parameters = dict((name, frozenset(meta.find_undeclared_variables(
+            self.environment.parse(source)))) for name, source in inlined.items())
+
+        with self._lock:
+            self.mtime = os.path.getmtime(self.path)
+            self.compiled = compiled
+            self.parameters = parameters
+            self._static = {}
+            self._rendered = OrderedDict()
+
+    def _reload_if_changed(self):
+        if self.auto_reload and os.path.getmtime(self.path) != self.mtime:
+            self.load()
+
+    def warm(self):
+        """
+        Render every template that takes no parameters, so none is rendered
+        for the first time during a request.
+        :return: number of templates rendered
+        """
+        static = [name for name, params in self.parameters.items()
+                  if not params]
+        for name in static:
+            self.render(name)
+        return len(static)
+
+    def render(self, template, **params):
+        """
+        Render a template by name.
+        :param template: template name in templates.yaml
+        :param params: template parameters
+        :return: rendered str
+        """
+        self._reload_if_changed()
+
+        if not params:
+            speech = self._static.get(template)
+            if speech is None:
+                speech = self._static[template] = self.compiled[template].render()
+            return speech
+
+        key = (template, tuple(sorted(params.items())))
+        with self._lock:
+            speech = self._rendered.pop(key, None)
+            if speech is not None:
+                self._rendered[key] = speech
+                return speech
+
+        speech = self.compiled[template].render(**params)
+        with self._lock:
+            self._rendered[key] = speech
+            while len(self._rendered) > self.max_cached:
+                self._rendered.popitem(last=False)
+        return speech
+
+
+def inline_includes(name, sources, seen=()):
+    """
+    Replace every `{% include 'other' %}` in a template with the source of
+    `other`, recursively.
+    :param name: template name
+    :param sources: dict of template name -> source
+    :return: template source without includes
+    """
+    if name in seen:
+        raise ValueError('Template %s includes itself' % name)
+
+    def replace(match):
+        return inline_includes(match.group(1), sources, seen + (name,))
+
+    return _include.sub(replace, six.text_type(sources[name]))
@@ -0,0 +1,169 @@
+"""
+Worker Startup
+
+A cold worker's first requests pay for everything it hasn't done yet: fetching
+every podcast feed, opening a Redis connection, rendering speech for the first
+time. `boot()` does all of that before the worker takes traffic.
+
+Under gunicorn with `preload_app` (see gunicorn_conf.py), the app is built and
+warmed up once in the master process, and every worker is forked with primed
+feed caches. Each worker then only resets what can't be shared across a fork,
+in `start_worker()`: the Redis connection pool, locks the master's threads may
+have held, and background threads, which don't survive a fork.
+
+How long each step took is logged, and recorded in the
+vpr_alexa_startup_seconds histogram by phase, once a worker has served its
+first request.
+"""
+from collections import OrderedDict
+from contextlib import contextmanager
+import os
+import time
+
+from flask import request
+
+from vpr_alexa import logger, metrics, programs, resilience, webapp
+from vpr_alexa.refresher import start_refresher
+
+WARM_UP_BUDGET = 10.0
+WARM_UP_KEY = 'vpr_alexa:warm_up'
+
+# Set by gunicorn_conf.py when the app is loaded in the master process before
+# workers are forked. Per-worker setup then waits for gunicorn's post_fork.
+preloading = os.environ.get('VPR_ALEXA_PRELOADED', '').lower() == 'true'
+
+
+class StartupTimes(object):
+    """
+    When each step of getting a worker ready happened.
+    """
+
+    def __init__(self):
+        self.events = OrderedDict()
+
+    def mark(self, event, at=None):
+        """
+        :param event: e.g. 'import' or 'first_request'
+        :param at: seconds since the epoch, defaults to now
+        """
+        self.events[event] = time.time() if at is None else at
+
+    def between(self, start, end):
+        """
+        :return: seconds from one event to another, None if either hasn't
+        happened
+        """
+        if start not in self.events or end not in self.events:
+            return None
+        return self.events[end] - self.events[start]
+
+    def describe(self):
+        """
+        :return: dict of event -> seconds after the import started
+        """
+        start = self.events.get('import')
+        return OrderedDict((event, round(at - start, 3) if start else None)
+                           for event, at in self.events.items())
+
+
+times = StartupTimes()
+
+
+@contextmanager
+def _step(steps, name):
+    start = time.time()
+    try:
+        yield
+    except Exception as e:
+        logger.error('Warm-up step %s failed: %s' % (name, e))
+    finally:
+        steps[name] = round(time.time() - start, 3)
+
+
+def warm_up(budget=WARM_UP_BUDGET):
+    """
+    Prime everything a first request would otherwise wait on.
+    :param budget: seconds the feed fetches may take altogether
+    :return: dict of step -> seconds it took
+    """
+    steps = OrderedDict()
+    with _step(steps, 'speech'):
+        webapp.templates.warm()
+    with _step(steps, 'cache_backend'):
+        webapp.cache.get(WARM_UP_KEY)
+    with _step(steps, 'feeds'):
+        # The briefing resolves every podcast concurrently, leaving their
+        # feeds, episode indexes and the briefing itself cached.
+        episodes = webapp.briefing.episodes(resilience.Deadline(budget))
+        logger.info('Warmed up %d of %d podcast feeds'
+                    % (len(episodes), len(webapp.briefing.podcasts)))
+    return steps
+
+
+def after_fork():
+    """
+    Reset per-process resources inherited from the parent process.
+    """
+    if hasattr(webapp.cache, 'after_fork'):  # a RedisBackend
+        webapp.cache.after_fork()
+    programs.feed_cache.after_fork()
+    metrics.registry.after_fork()
+    webapp.playback_positions.after_fork()
+
+
+def boot(app, imported_at=None):
+    """
+    Get a newly created app ready for traffic. Called by vpr_alexa.wsgi.
+    :param app: Flask app from webapp.create_app()
+    :param imported_at: when the entry point started importing
+    """
+    times.mark('import', imported_at)
+    times.mark('app_created')
+    app.after_request(_first_request)
+
+    budget = float(os.environ.get('WARM_UP_BUDGET', WARM_UP_BUDGET))
+    if budget:
+        steps = warm_up(budget)
+        times.mark('warmed_up')
+        logger.info('Warm-up took %.2fs (%s)' % (
+            times.between('app_created', 'warmed_up'),
+            ', '.join('%s: %.2fs' % step for step in steps.items())))
+
+    if not preloading:
+        start_worker(app)
+
+
+def start_worker(app):
+    """
+    Per-worker setup, in the process that will serve requests.
+    :param app: Flask app from webapp.create_app()
+    """
+    times.mark('worker_started')
+    if preloading:
+        after_fork()
+    start_refresher(app.config['FEED_REFRESH_INTERVAL'])
+
+
+def _first_request(response):
+    if 'first_request' not in times.events and request.path == webapp.ASK_ROUTE:
+        times.mark('first_request')
+        report()
+    return response
+
+
+def report():
+    """
+    Log and record how long this worker took to get to its first request.
+    """
+    for phase, start, end in (('import', 'import', 'app_created'),
+                              ('warm_up', 'app_created', 'warmed_up'),
+                              ('worker', 'worker_started', 'first_request'),
+                              ('first_request', 'import', 'first_request')):
+        seconds = times.between(start, end)
+        if seconds is not None:
+            metrics.registry.observe('vpr_alexa_startup_seconds', seconds,
+                                     {'phase': phase})
+    logger.info('First request served %.2fs after import (%.2fs after the '
+                'worker started)' % (times.between('import', 'first_request'),
+                                     times.between('worker_started',
+                                                   'first_request') or 0))
@@ -0,0 +1,251 @@
+"""
+Alexa Request Verification
+
+Amazon signs every request it sends the skill. The signing certificate chain
+is downloaded from the SignatureCertChainUrl header. flask-ask downloads and
+checks it again for every request, which costs a round trip to S3 and a
+certificate parse before any intent is handled.
+
+RequestVerifier keeps each chain's checked public key in memory, keyed by URL,
+until the certificate expires. After the first request the only per-request
+work is checking the signature itself.
+"""
+import base64
+import ssl
+import threading
+from datetime import datetime
+
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.x509.oid import ExtensionOID
+from flask import current_app, json, request as flask_request
+from flask_ask import Ask
+from flask_ask import verifier as ask_verifier
+from flask_ask.verifier import VerificationError
+from OpenSSL import crypto
+from six.moves.urllib.request import urlopen
+
+from vpr_alexa import logger
+
+SIGNING_NAME = 'echo-api.amazon.com'
+
+FETCH_TIMEOUT = 5
+MAX_CERTIFICATES = 16
+
+_PEM_END = b'-----END CERTIFICATE-----'
+
+
+class SigningCertificate(object):
+    """
+    Public key of a checked signing certificate and how long it's valid.
+    """
+    __slots__ = ('public_key', 'not_before', 'not_after')
+
+    def __init__(self, public_key, not_before, not_after):
+        self.public_key = public_key
+        self.not_before = not_before
+        self.not_after = not_after
+
+    def is_valid(self, now):
+        return self.not_before <= now < self.not_after
+
+
+def split_pem_chain(data):
+    """
+    :param data: bytes of one or more PEM certificates
+    :return: list of bytes, one per certificate, in the order given
+    """
+    return [part.strip() + b'\n' + _PEM_END + b'\n'
+            for part in data.split(_PEM_END) if part.strip()]
+
+
+def default_trust_store():
+    """
+    :return: new OpenSSL X509Store with the system's trusted root CAs, or None
+    if they can't be found
+    """
+    paths = ssl.get_default_verify_paths()
+    store = crypto.X509Store()
+    try:
+        store.load_locations(paths.cafile, paths.capath)
+    except crypto.Error as e:
+        logger.error('No trusted CAs to check Alexa certificates against: %s'
+                     % e)
+        return None
+    return store
+
+
+class RequestVerifier(object):
+    """
+    Checks Alexa request signatures with certificates cached by URL.
+    """
+
+    def __init__(self, trust_store=None, fetch=None,
+                 max_certificates=MAX_CERTIFICATES):
+        """
+        :param trust_store: OpenSSL X509Store of trusted root CAs, defaults to
+        the system's
+        :param fetch: function of url -> bytes of the PEM chain, defaults to
+        downloading it
+        :param max_certificates: certificate URLs to keep
+        """
+        self._trust_store = trust_store
+        self.fetch = fetch or _download
+        self.max_certificates = max_certificates
+        self.certificates = {}
+        self.fetches = 0
+        self._lock = threading.Lock()
+
+    @property
+    def trust_store(self):
+        if self._trust_store is None:
+            self._trust_store = default_trust_store()
+        return self._trust_store
+
+    def certificate(self, url, now=None):
+        """
+        :param url: SignatureCertChainUrl header
+        :return: SigningCertificate, downloaded and checked if it's not cached
+        or has expired
+        :raises VerificationError: if the URL or certificate chain is invalid
+        """
+        now = now or datetime.utcnow()
+        cert = self.certificates.get(url)
+        if cert is not None and cert.is_valid(now):
+            return cert
+
+        if not ask_verifier._valid_certificate_url(url):
+            raise VerificationError('Certificate URL verification failed')
+
+        with self._lock:
+            cert = self.certificates.get(url)
+            if cert is None or not cert.is_valid(now):
+                self.fetches += 1
+                cert = self._load(self.fetch(url), now)
+                if url not in self.certificates and \
+                        len(self.certificates) >= self.max_certificates:
+                    oldest = min(self.certificates,
+                                 key=lambda key: self.certificates[key].not_after)
+                    del self.certificates[oldest]
+                self.certificates[url] = cert
+        return cert
+
+    def _load(self, data, now):
+        """
+        Check a downloaded chain the way Amazon asks: the signing certificate
+        must be current, name echo-api.amazon.com and chain up to a trusted CA.
+        """
+        try:
+            pems = split_pem_chain(data)
+            leaf = x509.load_pem_x509_certificate(pems[0], default_backend())
+        except (IndexError, ValueError) as e:
+            raise VerificationError('Certificate could not be read: %s' % e)
+
+        not_before, not_after = _validity(leaf)
+        if not not_before <= now < not_after:
+            raise VerificationError('Certificate has expired')
+
+        try:
+            names = leaf.extensions.get_extension_for_oid(
+                ExtensionOID.SUBJECT_ALTERNATIVE_NAME).value \
+                .get_values_for_type(x509.DNSName)
+        except x509.ExtensionNotFound:
+            names = []
+        if SIGNING_NAME not in names:
+            raise VerificationError('Certificate is not for %s' % SIGNING_NAME)
+
+        store = self.trust_store
+        if store is None:
+            logger.error('Skipping Alexa certificate chain verification')
+        else:
+            chain = [crypto.load_certificate(crypto.FILETYPE_PEM, pem)
+                     for pem in pems]
+            try:
+                crypto.X509StoreContext(store, chain[0], chain[1:]) \
+                    .verify_certificate()
+            except crypto.X509StoreContextError as e:
+                raise VerificationError('Certificate chain verification '
+                                        'failed: %s' % e)
+
+        return SigningCertificate(leaf.public_key(), not_before, not_after)
+
+    def verify(self, cert_url, signature, body, algorithm=None):
+        """
+        :param cert_url: SignatureCertChainUrl header
+        :param signature: base64 Signature header
+        :param body: bytes of the raw request body
+        :param algorithm: cryptography hash the signature uses, SHA-1 for the
+        Signature header
+        :raises VerificationError: if the request wasn't signed by Alexa
+        """
+        public_key = self.certificate(cert_url).public_key
+        try:
+            public_key.verify(base64.b64decode(signature), body,
+                              padding.PKCS1v15(), algorithm or hashes.SHA1())
+        except (InvalidSignature, TypeError, ValueError):
+            raise VerificationError('Signature verification failed')
+
+
+def _validity(cert):
+    """
+    :return: (not before, not after) as naive UTC datetimes
+    """
+    try:
+        return (cert.not_valid_before_utc.replace(tzinfo=None),
+                cert.not_valid_after_utc.replace(tzinfo=None))
+    except AttributeError:  # cryptography < 42
+        return cert.not_valid_before, cert.not_valid_after
+
+
+def _download(url):
+    response = urlopen(url, timeout=FETCH_TIMEOUT)
+    try:
+        return response.read()
+    finally:
+        response.close()
+
+
+class VerifiedAsk(Ask):
+    """
+    flask_ask.Ask checking request signatures with a RequestVerifier. The
+    timestamp and application id checks are flask-ask's own.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.verifier = kwargs.pop('verifier', None) or RequestVerifier()
+        super(VerifiedAsk, self).__init__(*args, **kwargs)
+
+    def _alexa_request(self, verify=True):
+        raw_body = flask_request.data
+        payload = json.loads(raw_body)
+
+        if verify:
+            headers = flask_request.headers
+            if 'Signaturecertchainurl' not in headers:
+                raise VerificationError('Request is not signed')
+            if 'Signature-256' in headers:
+                signature, algorithm = headers['Signature-256'], hashes.SHA256()
+            elif 'Signature' in headers:
+                signature, algorithm = headers['Signature'], hashes.SHA1()
+            else:
+                raise VerificationError('Request is not signed')
+            self.verifier.verify(headers['Signaturecertchainurl'], signature,
+                                 raw_body, algorithm)
+
+            timestamp = self._parse_timestamp(
+                payload.get('request', {}).get('timestamp'))
+            if not current_app.debug or self.ask_verify_timestamp_debug:
+                ask_verifier.verify_timestamp(timestamp)
+
+            if self.ask_application_id is not None:
+                try:
+                    application_id = payload['session']['application']['applicationId']
+                except KeyError:
+                    application_id = payload['context']['System']['application']['applicationId']
+                ask_verifier.verify_application_id(application_id,
+                                                   self.ask_application_id)
+
+        return payload
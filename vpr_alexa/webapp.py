@@ -2,28 +2,219 @@
 Vermont Public Radio Alexa Skill
 """
 import os
-from flask import Flask, Blueprint, render_template
-from flask_ask import Ask, question, statement, audio
-from werkzeug.contrib.cache import SimpleCache, RedisCache
-from vpr_alexa import programs, logger
+import time
+import uuid
+from flask import Flask, Blueprint, Response, current_app, g, json, request
+from flask_ask import question, statement, audio, context, session
+from flask_ask.cache import push_stream
+from werkzeug.contrib.cache import SimpleCache
+from vpr_alexa import health, metrics, programs, refresher, resilience, logger
+from vpr_alexa.briefing import PLAYLIST as BRIEFING, Briefing
+from vpr_alexa.episodes import SharedEpisodeCache
+from vpr_alexa.idempotency import ResponseCache
+from vpr_alexa.playback import PlaybackEvents
+from vpr_alexa.positions import (PlaybackPositions, playlist_from_token,
+                                 token_for, url_from_token)
+from vpr_alexa.responses import (PreparedResponse, enqueue_directive, field,
+                                 play_directive)
+from vpr_alexa.speech import SpeechTemplates
+from vpr_alexa.verification import VerifiedAsk
 
 ASK_ROUTE = '/ask'
+
+# WSGI environ key for the time a request arrived, when a server in front of
+# the app knows it.
+REQUEST_STARTED = 'vpr_alexa.request_started'
 alexa = Blueprint('alexa', __name__)
 
 DEFAULT_TIMEOUT = 60 * 60
 if 'REDIS_URL' in os.environ:
-    url = os.environ.get('REDIS_URL', '')
-    if url.startswith('redis://'):
-        # redis://h:pabf0075a117fd75136f95a2502f6bd1d07224afb6e1798a3897fc47c81e096ca@ec2-34-204-242-91.compute-1.amazonaws.com:10449
-        parts = url.split(':')
-        cache = RedisCache(host=parts[2].split('@')[1],
-                           port=int(parts[3]),
-                           password=parts[2].split('@')[0],
-                           default_timeout=DEFAULT_TIMEOUT)
+    # Imported here so workers without Redis never load the Redis client.
+    from vpr_alexa import backends
+    cache = backends.RedisBackend.from_url(
+        os.environ['REDIS_URL'],
+        max_connections=int(os.environ.get('REDIS_MAX_CONNECTIONS',
+                                           backends.MAX_CONNECTIONS)),
+        socket_timeout=float(os.environ.get('REDIS_SOCKET_TIMEOUT',
+                                            backends.SOCKET_TIMEOUT)),
+        default_timeout=DEFAULT_TIMEOUT)
 else:
     cache = SimpleCache(default_timeout=DEFAULT_TIMEOUT)
 
-ask = Ask(route=ASK_ROUTE, stream_cache=cache)
+# Request signatures are checked with certificates cached by URL, see
+# vpr_alexa.verification.
+ask = VerifiedAsk(route=ASK_ROUTE, stream_cache=metrics.CountingCache(cache))
+
+# AudioPlayer lifecycle events, answered without flask-ask's dispatch.
+playback_events = PlaybackEvents(ask)
+
+# Where each user stopped listening to a podcast episode.
+playback_positions = PlaybackPositions(cache)
+
+# Responses kept by requestId for Alexa's retries, see vpr_alexa.idempotency.
+response_cache = ResponseCache(cache)
+
+# Latest episode of every podcast for WhatsNew.
+briefing = Briefing()
+
+# templates.yaml, compiled by create_app()
+templates = SpeechTemplates()
+
+
+# Responses serialized once by prepare_responses(), keyed by template name or,
+# for the live streams, by Program.
+prepared_responses = {}
+
+
+def prepare_responses():
+    """
+    Serialize every response that's the same for all requests.
+    """
+    prepared_responses.clear()
+    for name, build in (('welcome', welcome_response),
+                        ('list_programs', list_programs_response),
+                        ('help', help_response)):
+        prepared_responses[name] = PreparedResponse(build()._response)
+
+    for program in programs.streams.values():
+        response = audio(templates.render('play_livestream', name=program.name)) \
+            .standard_card(title=program.title, text=program.text,
+                           small_image_url=program.small_img,
+                           large_image_url=program.large_img)._response
+        response['shouldEndSession'] = True
+        response['directives'].append(play_directive(program.url,
+                                                     field('token')))
+        prepared_responses[program] = PreparedResponse(response)
+
+
+def _prepared(name):
+    prepared = prepared_responses.get(name)
+    if prepared is not None:
+        return prepared.render(session_attributes=session.attributes)
+
+
+def _play_prepared(program):
+    """
+    Play a live stream from its prepared response, with a fresh token pushed to
+    the stream cache just like flask-ask's audio().play() does.
+    """
+    prepared = prepared_responses.get(program)
+    if prepared is not None:
+        token = str(uuid.uuid4())
+        push_stream(ask.stream_cache, context['System']['user']['userId'],
+                    {'url': program.url, 'token': token,
+                     'offsetInMilliseconds': 0})
+        return prepared.render(session_attributes=session.attributes,
+                               token=token)
+
+
+@alexa.before_app_request
+def start_deadline():
+    """
+    Give every request a latency budget so slow feeds can't hold it past
+    Alexa's response deadline.
+    """
+    # vpr_alexa.asgi may already have spent some of the budget on feeds.
+    g.request_started = request.environ.get(REQUEST_STARTED, time.time())
+    resilience.start_request(current_app.config['ALEXA_RESPONSE_BUDGET'],
+                             g.request_started)
+
+
+@alexa.before_app_request
+def playback_fast_path():
+    """
+    Answer AudioPlayer events straight away, see vpr_alexa.playback.
+    """
+    if request.path == ASK_ROUTE and request.method == 'POST':
+        return playback_events.dispatch()
+
+
+def _request_id():
+    try:
+        payload = json.loads(request.get_data(cache=True))
+        return payload['request']['requestId'] or None
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+@alexa.before_app_request
+def replay_retried_request():
+    """
+    Answer a retry of an Alexa request with the response to its first attempt,
+    waiting for it if that attempt is still in progress.
+    """
+    if request.path != ASK_ROUTE or request.method != 'POST' \
+            or not response_cache.ttl:
+        return None
+    request_id = _request_id()
+    if request_id is None:
+        return None
+    if response_cache.claim(request_id):
+        g.claimed_request_id = request_id
+        return None
+
+    # Another attempt's response is only for a request Alexa signed.
+    ask._alexa_request(verify=ask.ask_verify_requests)
+    g.alexa_request_type = 'Retry'
+    deadline = resilience.current_deadline()
+    stored = response_cache.response(
+        request_id, wait=min(response_cache.wait, deadline.remaining())
+        if deadline is not None else None)
+    if stored is None:
+        # The first attempt failed or is taking too long, try it ourselves.
+        metrics.registry.inc('vpr_alexa_retried_requests_total',
+                             {'result': 'handled'})
+        return None
+    metrics.registry.inc('vpr_alexa_retried_requests_total',
+                         {'result': 'replayed'})
+    return Response(stored['body'], status=stored['status'],
+                    mimetype='application/json')
+
+
+@alexa.after_app_request
+def store_response(response):
+    """
+    Keep the response to a claimed request for its retries, or let them be
+    handled from scratch if it failed.
+    """
+    request_id = g.pop('claimed_request_id', None)
+    if request_id is not None:
+        if response.status_code == 200:
+            response_cache.store(request_id, response.status_code,
+                                 response.get_data())
+        else:
+            response_cache.release(request_id)
+    return response
+
+
+@alexa.after_app_request
+def record_request_time(response):
+    """
+    Time every Alexa request by its intent name, or request type for launches,
+    session ends and AudioPlayer events.
+    """
+    if request.path == ASK_ROUTE and 'request_started' in g:
+        alexa_request = ask.request or {}
+        intent = alexa_request.get('intent') or {}
+        label = intent.get('name') or alexa_request.get('type') \
+            or g.get('alexa_request_type') or 'unknown'
+        metrics.registry.observe('vpr_alexa_request_seconds',
+                                 time.time() - g.request_started,
+                                 {'intent': label})
+    return response
+
+
+@alexa.teardown_app_request
+def end_deadline(exception=None):
+    resilience.end_request()
+
+
+@alexa.teardown_app_request
+def release_unanswered(exception=None):
+    """ A claimed request that raised never reached store_response. """
+    request_id = g.pop('claimed_request_id', None)
+    if request_id is not None:
+        response_cache.release(request_id)
 
 
 @ask.launch
@@ -34,8 +225,12 @@ def welcome():
     particular program
     """
     logger.info("welcome launch")
-    return question(render_template('welcome'))\
-        .reprompt(render_template('welcome_reprompt'))
+    return _prepared('welcome') or welcome_response()
+
+
+def welcome_response():
+    return question(templates.render('welcome'))\
+        .reprompt(templates.render('welcome_reprompt'))
 
 
 @ask.intent('ListPrograms')
@@ -46,7 +241,11 @@ def list_programs():
     :return: question of which program to play
     """
     logger.info("list programs launch")
-    return question(render_template('list_programs'))
+    return _prepared('list_programs') or list_programs_response()
+
+
+def list_programs_response():
+    return question(templates.render('list_programs'))
 
 
 @ask.intent('PlayProgram', mapping={'program_name': 'ProgramName'})
@@ -62,17 +261,14 @@ def play_program(program_name=''):
     try:
         program = programs.get_program(program_name.lower())
 
-        if program.is_podcast:
-            speech = render_template('play_podcast', name=program.name,
-                                     title=program.title)
-        else:
-            speech = render_template('play_livestream', name=program.name)
+        prepared = _play_prepared(program)
+        if prepared is not None:
+            return prepared
 
-        return audio(speech) \
-            .play(program.url) \
-            .standard_card(title=program.title, text=program.text,
-                           small_image_url=program.small_img,
-                           large_image_url=program.large_img)
+        if program.is_podcast:
+            return _play_episode(program, 'play_podcast')
+        return _play(program, templates.render('play_livestream',
+                                               name=program.name))
 
     except Exception as e:
         logger.error('Failed to launch program for program_name: %s'
@@ -82,6 +278,28 @@ def play_program(program_name=''):
     return statement('Sorry, I did not understand your request!')
 
 
+def _play_episode(program, template):
+    """
+    Play a podcast episode, starting where this user last stopped listening
+    to it on whichever device that was.
+    :param program: Program of the episode
+    :param template: speech for starting from the beginning
+    """
+    offset = playback_positions.offset(context['System']['user']['userId'],
+                                       program.url)
+    speech = templates.render('resume_podcast' if offset else template,
+                              name=program.name, title=program.title)
+    return _play(program, speech, offset, token_for(program.url))
+
+
+def _play(program, speech, offset=0, token=None):
+    return audio(speech) \
+        .play(program.url, offset=offset, opaque_token=token) \
+        .standard_card(title=program.title, text=program.text,
+                       small_image_url=program.small_img,
+                       large_image_url=program.large_img)
+
+
 @ask.intent('SelectProgram', mapping={'program_name': 'ProgramName'})
 def select_program(program_name):
     """
@@ -91,10 +309,46 @@ def select_program(program_name):
     return play_program(program_name)
 
 
+@ask.intent('SearchEpisodes', mapping={'topic': 'Topic'})
+def search_episodes(topic=''):
+    """
+    Play the podcast episode best matching what the listener asked about.
+    :param topic: Topic slot value, e.g. "maple syrup"
+    """
+    logger.info('episode search (topic: %s)' % topic)
+    topic = (topic or '').strip()
+    if not topic:
+        return question(templates.render('search_topic'))\
+            .reprompt(templates.render('search_topic'))
+    program = programs.find_episode(topic)
+    if program is None:
+        return statement(templates.render('no_search_results', topic=topic))
+    return _play_episode(program, 'play_search_result')
+
+
+@ask.intent('WhatsNew')
+def whats_new():
+    """
+    Read out the latest episode of every podcast, then play them in turn.
+    Podcasts that can't be resolved in time are left out.
+    """
+    logger.info('whats new launch')
+    episodes = briefing.episodes(resilience.current_deadline())
+    if not episodes:
+        return statement(templates.render('briefing_unavailable'))
+    first = episodes[0]
+    speech = templates.render('briefing', episodes=episodes)
+    return _play(first, speech, token=token_for(first.url, BRIEFING))
+
+
 @ask.intent('AMAZON.HelpIntent')
 def help():
     """ General 'help' handler. """
-    return question(render_template('help'))
+    return _prepared('help') or help_response()
+
+
+def help_response():
+    return question(templates.render('help'))
 
 # -----------------------------
 #    AudioPlayer Directives
@@ -102,23 +356,68 @@ def help():
 # These are the primary handlers for all the audio directives
 # required by Amazon. Even those that we don't use need to be
 # properly implemented to nicely respond to the request.
+#
+# Lifecycle events (PlaybackStarted, PlaybackStopped, ...) are answered by
+# playback_events before flask-ask sees them and only counted, unless a
+# handler is registered below.
 # -----------------------------
-@ask.on_playback_started()
-def started(offset, token):
+def _user_id(event_context):
+    return ((event_context.get('System') or {}).get('user') or {}).get('userId')
+
+
+@playback_events.handler('AudioPlayer.PlaybackStarted')
+@playback_events.handler('AudioPlayer.PlaybackStopped')
+def playback_position(event, context):
+    """
+    Remember where podcast episodes start and stop so they can be resumed.
     """
-    The skill gets notified when the stream's about to start. This allows for
-    any state handling, but also for now is just helpful for debugging.
+    playback_positions.record(_user_id(context), event.get('token'),
+                              event.get('offsetInMilliseconds'))
+
+
+@playback_events.handler('AudioPlayer.PlaybackFinished')
+def playback_finished(event, context):
+    """
+    A podcast episode played to the end, start it over next time.
     """
-    logger.info('Playback started at %d ms for token %s' % (offset, token))
+    playback_positions.finish(_user_id(context), event.get('token'))
 
 
-@ask.on_playback_stopped()
-def stopped(offset, token):
+@playback_events.handler('AudioPlayer.PlaybackNearlyFinished')
+def enqueue_next_episode(event, context):
     """
-    The skill gets notified when the stream is stopped. This allows for
-    any state handling, but also for now is just helpful for debugging.
+    Queue the next (older) episode of the podcast that's playing, or the next
+    podcast of a briefing, so it starts without a gap. Episode lists come from
+    feeds already in memory, this never waits on a fetch.
     """
-    logger.info('Playback stopped at %d ms for token %s' % (offset, token))
+    token = event.get('token')
+    playlist = playlist_from_token(token)
+    if playlist == BRIEFING:
+        episode = briefing.next_after(url_from_token(token))
+    else:
+        episode = programs.adjacent_episode(url_from_token(token), 1)
+    if episode is None:
+        return None
+
+    next_token = token_for(episode.url, playlist)
+    user_id = _user_id(context)
+    if user_id:
+        # Like flask-ask's audio().enqueue(), so pause and resume know about
+        # the new stream.
+        push_stream(ask.stream_cache, user_id,
+                    {'url': episode.url, 'token': next_token,
+                     'offsetInMilliseconds': 0})
+    return {'directives': [enqueue_directive(episode.url, next_token, token)]}
+
+
+@playback_events.handler('AudioPlayer.PlaybackFailed')
+def playback_failed(event, context):
+    """
+    The stream couldn't be played, worth a log line of its own.
+    """
+    error = event.get('error') or {}
+    logger.error('Playback failed for token %s: %s %s'
+                 % (event.get('token'), error.get('type'), error.get('message')))
 
 
 @ask.intent('AMAZON.PauseIntent')
@@ -157,7 +456,7 @@ def cancel_session():
 
 def not_handled():
     """ Common response for unhandled AudioPlayer directives. """
-    return statement(render_template('unsupported'))
+    return statement(templates.render('unsupported'))
 
 
 @ask.intent('AMAZON.LoopOffIntent')
@@ -170,14 +469,34 @@ def loop_on():
     return not_handled()
 
 
+def _play_adjacent(step):
+    """
+    Move through the episodes of the podcast that's playing, see
+    programs.adjacent_episode.
+    """
+    player = getattr(context, 'AudioPlayer', None) or {}
+    url = url_from_token(player.get('token'))
+    if url is None:
+        return not_handled()
+
+    episode = programs.adjacent_episode(url, step)
+    if episode is None:
+        return statement(templates.render('no_more_episodes'))
+    return _play(episode, templates.render('play_episode', name=episode.name,
+                                           title=episode.title),
+                 token=token_for(episode.url))
+
+
 @ask.intent('AMAZON.NextIntent')
 def next():
-    return not_handled()
+    """ Play the podcast episode before the one playing now. """
+    return _play_adjacent(1)
 
 
 @ask.intent('AMAZON.PreviousIntent')
 def previous():
-    return not_handled()
+    """ Play the podcast episode after the one playing now. """
+    return _play_adjacent(-1)
 
 
 @ask.intent('AMAZON.RepeatIntent')
@@ -224,8 +543,32 @@ def create_app():
         if os.environ['DISABLE_ASK_VERIFY_REQUESTS'].lower() == 'true':
             logger.info('!!! Disabling ASK Request verification')
             app.config['ASK_VERIFY_REQUESTS'] = False
+    app.config['ALEXA_RESPONSE_BUDGET'] = float(
+        os.environ.get('ALEXA_RESPONSE_BUDGET', resilience.DEFAULT_BUDGET))
+    response_cache.ttl = int(os.environ.get('RESPONSE_CACHE_TTL',
+                                            response_cache.ttl))
+    app.config['FEED_REFRESH_INTERVAL'] = int(
+        os.environ.get('FEED_REFRESH_INTERVAL', refresher.DEFAULT_INTERVAL))
+
+    if 'REDIS_URL' in os.environ:
+        # Share resolved podcast episodes across all gunicorn workers.
+        programs.shared_episodes = SharedEpisodeCache(cache)
+
+    # Metrics are only summed across workers through Redis. A SimpleCache is
+    # per-process anyway, and it prunes and expires keys, losing counts.
+    metrics.registry.backend = cache if 'REDIS_URL' in os.environ else None
+    health.backend = cache
 
     app.register_blueprint(alexa)
+    app.register_blueprint(metrics.blueprint)
+    app.register_blueprint(refresher.blueprint)
+    app.register_blueprint(health.blueprint)
     ask.init_app(app, path='templates.yaml')
+    templates.load(os.path.join(app.root_path, 'templates.yaml'),
+                   auto_reload=app.debug)
+
+    if not app.debug:
+        # In debug mode templates.yaml edits should show up without a restart.
+        prepare_responses()
 
     return app
@@ -1,6 +1,17 @@
 """
 WSGI Entry Point
+
+    gunicorn -c vpr_alexa/gunicorn_conf.py vpr_alexa.wsgi
+
+See vpr_alexa.startup for what happens before the app takes traffic.
 """
-from vpr_alexa.webapp import create_app
+import time
+imported_at = time.time()
+
+from vpr_alexa import startup  # noqa: E402
+from vpr_alexa.webapp import create_app  # noqa: E402
 
 application = create_app()
+
+if application is not None:
+    startup.boot(application, imported_at)